@@ -0,0 +1,91 @@
+"""Offline capture analysis throughput.
+
+    python benchmarks/bench_analyze.py [SIZE_MB] [--keep FILE]
+
+Writes a synthetic Ethernet pcap of about SIZE_MB megabytes (default 1024).
+Each observation is one query, one forged answer and one real answer.
+The capture is then read back three ways: frames only, frames decoded to
+UDP, and the full analyze_capture pipeline that parses and pairs every message.
+"""
+import argparse
+import os
+import socket
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from dns_observe import DNSQuery, RecordType  # noqa: E402
+from dns_observe.analyze import analyze_capture  # noqa: E402
+from dns_observe.pcap import iter_udp, read_capture  # noqa: E402
+
+
+def ethernet_udp(payload: bytes, src: tuple, dst: tuple) -> bytes:
+    udp = struct.pack('!HHHH', src[1], dst[1], 8 + len(payload), 0) + payload
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0x4000, 64, 17, 0,
+                     socket.inet_aton(src[0]), socket.inet_aton(dst[0]))
+    return b'\x00' * 12 + b'\x08\x00' + ip + udp
+
+
+def answer(query: bytes, ip: str) -> bytes:
+    header = struct.pack('>HHHHHH', 0, 0x8180, 1, 1, 0, 0)
+    record = b'\xc0\x0c' + struct.pack('>HHLH', RecordType.A, 1, 60, 4) + socket.inet_aton(ip)
+    return header + query[12:] + record
+
+
+def write_capture(path: str, size: int) -> int:
+    """写入约 size 字节的抓包，返回数据包数量"""
+    client, server = ('192.0.2.10', 40000), ('198.51.100.1', 53)
+    query = bytes(DNSQuery()._build_request('www.example.com', RecordType.A, 1))
+    templates = [
+        (0.0, ethernet_udp(query, client, server)),
+        (0.002, ethernet_udp(answer(query, '10.0.0.1'), server, client)),
+        (0.150, ethernet_udp(answer(query, '93.184.216.34'), server, client)),
+    ]
+    id_offset = 14 + 20 + 8  # 以太网 + IPv4 + UDP 之后是 transaction ID
+    packets = 0
+    written = 24
+    with open(path, 'wb', buffering=1 << 20) as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        tid = 0
+        start = 1_700_000_000.0
+        while written < size:
+            tid = tid % 65535 + 1
+            for delay, frame in templates:
+                frame = bytearray(frame)
+                frame[id_offset:id_offset + 2] = tid.to_bytes(2, 'big')
+                ts = start + delay
+                record = struct.pack('<IIII', int(ts), int(ts % 1 * 1e6), len(frame), len(frame)) + frame
+                f.write(record)
+                written += len(record)
+                packets += 1
+            start += 0.001
+    return packets
+
+
+def measure(label: str, packets: int, size: int, run):
+    start = time.perf_counter()
+    count = run()
+    elapsed = time.perf_counter() - start
+    print(f'{label:>12}: {packets / elapsed:>12,.0f} packets/s  {size / elapsed / 1e6:>8,.1f} MB/s  ({count:,} items, {elapsed:.1f}s)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('size_mb', type=int, nargs='?', default=1024)
+    parser.add_argument('--keep', metavar='FILE', help='write the capture here and keep it')
+    args = parser.parse_args()
+    path = args.keep or tempfile.mkstemp(suffix='.pcap')[1]
+    try:
+        packets = write_capture(path, args.size_mb * 1024 * 1024)
+        size = os.path.getsize(path)
+        print(f'== {size / 1e9:.2f} GB, {packets:,} packets ==')
+        measure('frames', packets, size, lambda: sum(1 for _ in read_capture(path)))
+        measure('udp', packets, size, lambda: sum(1 for _ in iter_udp(read_capture(path))))
+        measure('analyze', packets, size, lambda: sum(len(o.responses) for o in analyze_capture(path)))
+    finally:
+        if not args.keep:
+            os.remove(path)
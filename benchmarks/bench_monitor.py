@@ -0,0 +1,65 @@
+"""Timer wheel scheduling cost of the monitor daemon.
+
+    python benchmarks/bench_monitor.py [-n ENTRIES] [--interval SECONDS]
+
+Schedules ENTRIES watch entries with intervals spread over 0.5x-1.5x
+--interval on a TimerWheel, then replays --duration seconds of ticks on a
+simulated clock. Each expired entry is rescheduled the way Monitor does.
+Reports the cost of an empty tick, the cost per expired timer and the worst
+tick. No packets are sent.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from dns_observe.monitor import TimerWheel  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='dns-observe monitor scheduler benchmark')
+    parser.add_argument('-n', '--entries', type=int, default=100000, help='watch entries')
+    parser.add_argument('--interval', type=float, default=60, help='mean probe interval in seconds')
+    parser.add_argument('--duration', type=float, default=300, help='simulated seconds')
+    parser.add_argument('--tick', type=float, default=0.1, help='wheel resolution in seconds')
+    parser.add_argument('--slots', type=int, default=4096, help='wheel size')
+    args = parser.parse_args()
+
+    wheel = TimerWheel(args.tick, args.slots, now=0)
+    intervals = [args.interval * (0.5 + i / args.entries) for i in range(args.entries)]
+    start = time.perf_counter()
+    for key, interval in enumerate(intervals):
+        wheel.schedule(key, interval * key / args.entries, now=0)
+    schedule = time.perf_counter() - start
+
+    ticks = int(args.duration / args.tick)
+    fired = 0
+    empty_ticks = empty_time = worst = 0.0
+    start = time.perf_counter()
+    for i in range(1, ticks + 1):
+        now = i * args.tick
+        tick_start = time.perf_counter()
+        expired = wheel.advance(now)
+        for key in expired:
+            wheel.schedule(key, intervals[key], now)
+        elapsed = time.perf_counter() - tick_start
+        worst = max(worst, elapsed)
+        fired += len(expired)
+        if not expired:
+            empty_ticks += 1
+            empty_time += elapsed
+    total = time.perf_counter() - start
+
+    print(f'{args.entries:,} entries, {args.tick * 1000:.0f} ms ticks, {args.slots} slots, {args.duration:.0f} s simulated')
+    print(f'initial schedule: {schedule / args.entries * 1e9:,.0f} ns/entry')
+    print(f'timers fired: {fired:,} ({fired / args.duration:,.0f}/s)')
+    print(f'per fired timer (advance + reschedule): {total / max(fired, 1) * 1e9:,.0f} ns')
+    if empty_ticks:
+        print(f'empty tick: {empty_time / empty_ticks * 1e6:,.1f} us')
+    print(f'worst tick: {worst * 1e3:,.2f} ms, CPU per simulated second: {total / args.duration * 1e3:,.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Scan throughput with the domain list sharded across worker processes.
+
+    python benchmarks/bench_shard.py [-n QUERIES] [--workers 1,2,4,8] [--format jsonl]
+
+The simulator runs in its own process and answers every name after --delay
+seconds, with one forged reply before it. At each worker count one
+query_sharded scan formats its output in the workers and writes it to
+/dev/null. The benchmark reports queries/s, the time from the end of the
+listening window to the merged output, and how many answers were lost. The
+simulator shares the cores with the workers, so run it on a machine with more
+cores than the largest worker count.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from dns_observe import DNSQuery, query_sharded  # noqa: E402
+from dns_observe.simulator import Injection, PollutionServer  # noqa: E402
+
+
+def domain(i: int) -> str:
+    return f'host{i}.example.com'
+
+
+def serve(queries: int, delay: float, pipe):
+    zone = {domain(i): {'A': [f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}']} for i in range(queries)}
+    server = PollutionServer(zone, delay=delay, injections=[Injection(('31.13.94.41',), delay / 2, 247)]).start()
+    pipe.send(server.port)
+    pipe.recv()
+    server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='dns-observe sharded scan benchmark')
+    parser.add_argument('-n', '--queries', type=int, default=20000, help='domains per scan')
+    parser.add_argument('--workers', default='1,2,4,8', help='worker counts, comma separated')
+    parser.add_argument('--format', choices=('text', 'jsonl', 'csv'), default='jsonl', help='output format rendered in the workers')
+    parser.add_argument('--delay', type=float, default=0.05, help='seconds before the simulator sends the genuine reply')
+    parser.add_argument('--wait-time', type=float, default=1.0, help='listening window of each shard')
+    args = parser.parse_args()
+
+    pipe, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(args.queries, args.delay, child), daemon=True)
+    process.start()
+    port = pipe.recv()
+    domains = [domain(i) for i in range(args.queries)]
+    print(f'{args.queries} domains, {os.cpu_count()} cores, {args.wait_time:.1f} s listening window per shard')
+    print(f"{'workers':>7} {'seconds':>8} {'queries/s':>10} {'speedup':>8} {'answers lost':>13}")
+    baseline = None
+    with open(os.devnull, 'w') as devnull:
+        for workers in (int(value) for value in args.workers.split(',')):
+            dns = DNSQuery('127.0.0.1', port=port, wait_time=args.wait_time, timeout=0.1, transaction_id=1)
+            start = time.perf_counter()
+            results = query_sharded(dns, domains, workers=workers, output_format=args.format, write=devnull.write)
+            # 每个分片都要监听完整的 wait_time，不计入 CPU 工作的耗时
+            elapsed = time.perf_counter() - start - args.wait_time
+            lost = 2 * args.queries - sum(len(responses) for responses in results.values())
+            rate = args.queries / elapsed
+            baseline = baseline or rate
+            print(f'{workers:>7} {elapsed:>8.2f} {rate:>10,.0f} {rate / baseline:>7.2f}x {lost:>13}')
+    pipe.send('stop')
+    process.join(5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Ingestion and query throughput of the SQLite observation store.
+
+    python benchmarks/bench_store.py [-n RESPONSES] [--names N] [--batch SIZE]
+
+Replays the messages of the wire corpus as responses from 8 servers for N
+distinct names, written through ObservationStore.on_response into a
+temporary database. It reports responses/s and records/s for ingestion, then
+the latency of the history, poisoning and names_for_ip queries.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from corpus import load_corpus  # noqa: E402
+from dns_observe import DNSQuery, ObservationStore  # noqa: E402
+from dns_observe.sinks import ResponseEvent  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='dns-observe observation store benchmark')
+    parser.add_argument('-n', '--responses', type=int, default=200000, help='responses to ingest')
+    parser.add_argument('--names', type=int, default=10000, help='distinct query names')
+    parser.add_argument('--batch', type=int, default=1000, help='responses per transaction')
+    args = parser.parse_args()
+
+    dns = DNSQuery()
+    packets = list(load_corpus().values())
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'observations.db')
+    store = ObservationStore(path, batch_size=args.batch, flush_interval=float('inf'))
+    base = time.time() - args.responses
+    records = 0
+    start = time.perf_counter()
+    for i in range(args.responses):
+        dns_resp = dns._parse_response(packets[i % len(packets)])
+        dns_resp.timestamp = base + i
+        dns_resp.rtt = 0.05
+        dns_resp.address = (f'10.0.0.{i % 8}', 53)
+        dns_resp.verdict = 'fake' if i % 3 == 0 else 'real'
+        records += dns_resp.answer_n + dns_resp.authority_n + dns_resp.additional_n
+        store.on_response(ResponseEvent(dns_resp, f'host{i % args.names}.example.com'))
+    store.flush()
+    elapsed = time.perf_counter() - start
+    print(f'ingest: {args.responses:,} responses, {records:,} records in {elapsed:.2f} s '
+          f'({args.responses / elapsed:,.0f} responses/s, {records / elapsed:,.0f} records/s), '
+          f'{os.path.getsize(path) / 1e6:,.1f} MB')
+
+    for label, query in (('history', lambda: store.history('host0.example.com')),
+                         ('poisoning', lambda: store.poisoning('host0.example.com')),
+                         ('names_for_ip', lambda: store.names_for_ip('31.13.94.41', since=base + args.responses - 1000))):
+        start = time.perf_counter()
+        rows = query()
+        print(f'{label}: {len(rows):,} rows in {(time.perf_counter() - start) * 1e3:,.1f} ms')
+    store.close()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""DNS over TLS latency: cold handshake, resumed session and kept-alive connection.
+
+    python benchmarks/bench_tls.py [-n QUERIES]
+
+The simulator runs in its own process with a TLS listener. It uses the
+self-signed certificate in tests/tls/ and answers with no added delay. The
+benchmark times one query_tls call in each of three modes:
+- cold: a new connection pool for every query, so every query does a full
+  handshake;
+- resumed: the connection is closed after each query, and the next one
+  resumes the saved TLS session;
+- kept-alive: every query reuses the same open connection.
+UDP and plain TCP queries are timed as a baseline.
+"""
+import argparse
+import multiprocessing
+import ssl
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'src'))
+
+from dns_observe import DNSQuery, TCPPool  # noqa: E402
+from dns_observe.simulator import PollutionServer  # noqa: E402
+
+CERTS = ROOT / 'tests' / 'tls'
+
+
+def serve(pipe):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(CERTS / 'localhost.pem')
+    server = PollutionServer({'example.com': {'A': ['93.184.216.34']}}, delay=0, tcp=True, tls_context=context).start()
+    pipe.send((server.port, server.tls_port))
+    pipe.recv()
+    server.close()
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def measure(query, queries: int, after=None) -> list[float]:
+    query()  # 预热
+    if after is not None:
+        after()
+    timings = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        responses = query()
+        timings.append(time.perf_counter() - start)
+        assert len(responses) == 1
+        if after is not None:
+            after()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='dns-observe DNS over TLS latency benchmark')
+    parser.add_argument('-n', '--queries', type=int, default=200, help='queries per mode')
+    args = parser.parse_args()
+
+    pipe, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(child,), daemon=True)
+    process.start()
+    port, tls_port = pipe.recv()
+    context = ssl.create_default_context(cafile=str(CERTS / 'ca.pem'))
+
+    def client(pool: TCPPool | None = None) -> DNSQuery:
+        # adaptive 模式下第一个响应到达即结束监听，UDP 与 TCP/TLS 一样测量单次往返
+        return DNSQuery('127.0.0.1', port=port, wait_time=0.5, timeout=1, adaptive=True, grace=0, rtt_tolerance=1,
+                        tls_pool=pool, tls_port=tls_port)
+
+    pool = TCPPool(timeout=1, ssl_context=context)
+    dns = client(pool)
+    modes = [
+        ('udp', measure(lambda: dns.query('example.com'), args.queries)),
+        ('tcp kept-alive', measure(lambda: dns.query_tcp('example.com'), args.queries)),
+        ('tls cold', measure(lambda: client(TCPPool(timeout=1, ssl_context=context)).query_tls('example.com'), args.queries)),
+        ('tls resumed', measure(lambda: dns.query_tls('example.com'), args.queries, after=pool.close)),
+        ('tls kept-alive', measure(lambda: dns.query_tls('example.com'), args.queries)),
+    ]
+    resumed = pool.resumed
+    pipe.send('stop')
+    process.join(5)
+
+    print(f'{args.queries} queries per mode against 127.0.0.1, {ssl.OPENSSL_VERSION}')
+    print(f"{'mode':<15} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, timings in modes:
+        print(f'{name:<15} {sum(timings) / len(timings) * 1e3:>8.3f} {percentile(timings, 0.5) * 1e3:>8.3f} '
+              f'{percentile(timings, 0.99) * 1e3:>8.3f}')
+    print(f'sessions resumed: {resumed} of {pool.connects} connections')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Wire-format corpus for the benchmark suite.
+
+The messages are checked in under benchmarks/corpus/ so results stay comparable
+between commits. This module documents how each one was built; regenerate with
+
+    python benchmarks/corpus.py
+"""
+import base64
+import socket
+import struct
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from dns_observe import RecordType  # noqa: E402
+
+CORPUS_DIR = Path(__file__).resolve().parent / 'corpus'
+
+
+def encode_name(name: str) -> bytes:
+    return b''.join(struct.pack('>B', len(p)) + p.encode() for p in name.split('.')) + b'\x00'
+
+
+def rr(name: bytes, rtype: int, ttl: int, rdata: bytes) -> bytes:
+    return name + struct.pack('>HHLH', rtype, 1, ttl, len(rdata)) + rdata
+
+
+def build_answer_packet() -> bytes:
+    """www.example.com CNAME chain followed by four A records."""
+    question = encode_name('www.example.com') + struct.pack('>HH', RecordType.A, 1)
+    answers = [
+        rr(b'\xc0\x0c', RecordType.CNAME, 300, b'\x03www\x07example\x03net\x00'),
+        rr(b'\xc0\x2d', RecordType.CNAME, 300, b'\x04edge\xc0\x31'),
+    ]
+    for i in range(4):
+        answers.append(rr(b'\xc0\x4a', RecordType.A, 60, socket.inet_aton(f'93.184.216.{i}')))
+    header = struct.pack('>HHHHHH', 0x1234, 0x8180, 1, len(answers), 0, 0)
+    return header + question + b''.join(answers)
+
+
+def build_https_packet() -> bytes:
+    """crypto.cloudflare.com HTTPS record carrying alpn, ipv4hint, ech and ipv6hint."""
+    question = encode_name('crypto.cloudflare.com') + struct.pack('>HH', RecordType.HTTPS, 1)
+    params = [
+        (1, b'\x02h3\x02h2'),
+        (4, socket.inet_aton('162.159.137.85') + socket.inet_aton('162.159.138.85')),
+        (5, bytes(range(256)) * 1 + bytes(range(40))),
+        (6, socket.inet_pton(socket.AF_INET6, '2606:4700:7::a29f:8955')),
+    ]
+    rdata = struct.pack('>H', 1) + b'\x00' + b''.join(struct.pack('>HH', k, len(v)) + v for k, v in params)
+    answer = rr(b'\xc0\x0c', RecordType.HTTPS, 300, rdata)
+    header = struct.pack('>HHHHHH', 0x4321, 0x8180, 1, 1, 0, 0)
+    return header + question + answer
+
+
+class Compressor:
+    """Encode names with RFC 1035 message compression, like a real server does."""
+
+    def __init__(self):
+        self.packet = bytearray()
+        self.suffixes = {}
+
+    def name(self, name: str) -> bytes:
+        labels = name.split('.')
+        out = b''
+        for i in range(len(labels)):
+            suffix = '.'.join(labels[i:]).lower()
+            if suffix in self.suffixes:
+                return out + struct.pack('>H', 0xc000 | self.suffixes[suffix])
+            position = len(self.packet) + len(out)
+            if position < 0x4000:
+                self.suffixes[suffix] = position
+            out += struct.pack('>B', len(labels[i])) + labels[i].encode()
+        return out + b'\x00'
+
+    def write(self, data: bytes):
+        self.packet += data
+
+    def rr(self, name: str, rtype: int, ttl: int, rdata_name: str = None, rdata: bytes = b''):
+        self.write(self.name(name))
+        fixed = len(self.packet)
+        self.write(struct.pack('>HHLH', rtype, 1, ttl, 0))
+        if rdata_name is not None:
+            rdata = self.name(rdata_name)
+        self.write(rdata)
+        struct.pack_into('>H', self.packet, fixed + 8, len(rdata))
+
+
+def build_referral_packet() -> bytes:
+    """a.gtld-servers.net referral for example.com: 13 NS records plus A/AAAA glue."""
+    c = Compressor()
+    servers = [f'{chr(ord("a") + i)}.gtld-servers.net' for i in range(13)]
+    c.write(struct.pack('>HHHHHH', 0xbeef, 0x8000, 1, 0, len(servers), len(servers) * 2))
+    c.write(c.name('example.com') + struct.pack('>HH', RecordType.A, 1))
+    for server in servers:
+        c.rr('com', RecordType.NS, 172800, rdata_name=server)
+    for i, server in enumerate(servers):
+        c.rr(server, RecordType.A, 172800, rdata=socket.inet_aton(f'192.{i}.0.30'))
+    for i, server in enumerate(servers):
+        c.rr(server, RecordType.AAAA, 172800, rdata=socket.inet_pton(socket.AF_INET6, f'2001:503:{i:x}::30'))
+    return bytes(c.packet)
+
+
+def build_simple_answer(qname: str, qtype: int, rdatas: list, ttl: int = 300, tid: int = 0x1a2b, flags: int = 0x8180) -> bytes:
+    """An answer-only response, every owner name compressed to the question."""
+    question = encode_name(qname) + struct.pack('>HH', qtype, 1)
+    answers = b''.join(rr(b'\xc0\x0c', qtype, ttl, rdata) for rdata in rdatas)
+    return struct.pack('>HHHHHH', tid, flags, 1, len(rdatas), 0, 0) + question + answers
+
+
+def build_mx_packet() -> bytes:
+    """gmail.com MX with five exchangers compressed against each other."""
+    c = Compressor()
+    exchangers = [(5, 'gmail-smtp-in.l.google.com')] + [(10 * i, f'alt{i}.gmail-smtp-in.l.google.com') for i in range(1, 5)]
+    c.write(struct.pack('>HHHHHH', 0x5151, 0x8180, 1, len(exchangers), 0, 0))
+    c.write(c.name('gmail.com') + struct.pack('>HH', RecordType.MX, 1))
+    for preference, exchanger in exchangers:
+        c.write(c.name('gmail.com'))
+        fixed = len(c.packet)
+        c.write(struct.pack('>HHLH', RecordType.MX, 1, 3600, 0))
+        c.write(struct.pack('>H', preference))
+        # 先写入 preference，压缩指针才会指向正确的位置
+        target = c.name(exchanger)
+        c.write(target)
+        struct.pack_into('>H', c.packet, fixed + 8, 2 + len(target))
+    return bytes(c.packet)
+
+
+def build_txt_packet() -> bytes:
+    """A typical apex TXT set: SPF plus site verification tokens."""
+    texts = [
+        b'v=spf1 include:_spf.google.com include:mailgun.org ~all',
+        b'google-site-verification=' + b'x' * 43,
+        b'MS=ms' + b'1' * 8,
+        b'apple-domain-verification=' + b'A' * 16,
+    ]
+    return build_simple_answer('example.org', RecordType.TXT, [bytes([len(t)]) + t for t in texts], ttl=3600, tid=0x7777)
+
+
+def build_nxdomain_packet() -> bytes:
+    """NXDOMAIN with the zone SOA in the authority section (captured from a real server)."""
+    return base64.b64decode('FGqBgwABAAAAAQAACG5vdGV4aXN0CWV4YW1wbGUxMQNjb20AAAEAAcAVAAYAAQAAASwAMANuczEIc3RhY2tkbnPAHwpob3N0bWFzdGVywDhl8ou8AAAHCAAAA4QAEnUAAAABLA==')
+
+
+def build_injection_packet() -> bytes:
+    """An on-path injected A answer: echoed question, one bogus address, no EDNS."""
+    return build_simple_answer('twitter.com', RecordType.A, [socket.inet_aton('31.13.94.41')], ttl=247, tid=0x2c3d)
+
+
+def build_injection_multi_packet() -> bytes:
+    """An injected answer carrying several bogus addresses, as some injectors send."""
+    addresses = ['108.160.166.62', '199.59.148.97', '31.13.70.1', '157.240.7.20']
+    return build_simple_answer('www.youtube.com', RecordType.A, [socket.inet_aton(a) for a in addresses], ttl=60, tid=0x9e9e)
+
+
+def build_corpus() -> dict[str, bytes]:
+    return {
+        'answer_a': build_simple_answer('google.com', RecordType.A, [socket.inet_aton('142.250.72.14')]),
+        'answer_aaaa': build_simple_answer('google.com', RecordType.AAAA, [socket.inet_pton(socket.AF_INET6, '2607:f8b0:4005:80c::200e'),
+                                                                            socket.inet_pton(socket.AF_INET6, '2607:f8b0:4005:80d::200e')]),
+        'cname_chain': build_answer_packet(),
+        'referral': build_referral_packet(),
+        'https_ech': build_https_packet(),
+        'mx': build_mx_packet(),
+        'txt': build_txt_packet(),
+        'nxdomain_soa': build_nxdomain_packet(),
+        'injection': build_injection_packet(),
+        'injection_multi': build_injection_multi_packet(),
+    }
+
+
+def load_corpus() -> dict[str, bytes]:
+    """Read the checked-in corpus, sorted by name."""
+    return {path.stem: path.read_bytes() for path in sorted(CORPUS_DIR.glob('*.bin'))}
+
+
+if __name__ == '__main__':
+    CORPUS_DIR.mkdir(exist_ok=True)
+    for name, packet in build_corpus().items():
+        (CORPUS_DIR / f'{name}.bin').write_bytes(packet)
+        print(f'{name:>16}: {len(packet)} bytes')
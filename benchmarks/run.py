@@ -0,0 +1,264 @@
+"""Parser microbenchmark suite over the checked-in wire corpus.
+
+    python benchmarks/run.py                          # print the results
+    python benchmarks/run.py -o results.json          # also save them
+    python benchmarks/run.py --compare results.json   # exit 1 on regressions
+
+Every message in benchmarks/corpus/ is measured for:
+- header/question parsing (packets/s);
+- full record decoding (packets/s, ns/record, retained allocations per message);
+- decompression_message over name-bearing RDATA.
+It also measures _build_request cold and cached, each registered record
+decoder by type, and PoisonIndex classification against a 50k-network index.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from corpus import load_corpus  # noqa: E402
+from dns_observe import DNSQuery, PoisonIndex, RecordType, RECORD_DECODERS, RECORD_TYPE_NAME, decompression_message, __version__  # noqa: E402
+from dns_observe.dns import _build_template  # noqa: E402
+
+# 数值越小越好的指标，其余指标越大越好
+LOWER_IS_BETTER = ('ns_per_record', 'ns_per_name', 'blocks_per_message', 'bytes_per_message')
+
+
+def timed(func, min_time: float, repeat: int) -> float:
+    """Seconds per call: calibrate a loop to last at least min_time, keep the best of repeat runs."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2 if elapsed < min_time / 10 else max(2, int(min_time / max(elapsed, 1e-9)) + 1)
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / loops
+
+
+def sections(dns_resp):
+    return (dns_resp.answer_RRs, dns_resp.authority_RRs, dns_resp.additional_RRs)
+
+
+def decode_all(dns_resp) -> int:
+    """Decode every record, the work the console output does per packet."""
+    n = 0
+    for section in sections(dns_resp):
+        for record in section:
+            record.name, record.data_view
+            n += 1
+    return n
+
+
+def allocations(packet: bytes, count: int = 1000) -> dict:
+    """Retained blocks and traced bytes per fully decoded message."""
+    dns = DNSQuery()
+    keep = []
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    for _ in range(count):
+        dns_resp = dns._parse_response(packet)
+        decode_all(dns_resp)
+        keep.append(dns_resp)
+    retained = (sys.getallocatedblocks() - blocks) / count
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'blocks_per_message': retained, 'bytes_per_message': size / count}
+
+
+def name_fields(packet: bytes) -> list:
+    """(message, RDATA) pairs whose RDATA starts with a possibly compressed name."""
+    skip = {RecordType.CNAME: 0, RecordType.NS: 0, RecordType.SOA: 0, RecordType.MX: 2}
+    fields = []
+    for section in sections(DNSQuery()._parse_response(packet)):
+        for record in section:
+            if record.type in skip:
+                fields.append((packet, bytes(record.data[skip[record.type]:])))
+    return fields
+
+
+def bench_message(name: str, packet: bytes, min_time: float, repeat: int) -> dict:
+    dns = DNSQuery()
+    results = {}
+    parse = timed(lambda: dns._parse_response(packet), min_time, repeat)
+    records = decode_all(dns._parse_response(packet))
+    decode = timed(lambda: decode_all(dns._parse_response(packet)), min_time, repeat)
+    results[f'parse/{name}'] = {'packets_per_sec': 1 / parse}
+    results[f'decode/{name}'] = {
+        'packets_per_sec': 1 / decode,
+        'ns_per_record': decode / max(records, 1) * 1e9,
+        **allocations(packet),
+    }
+    fields = name_fields(packet)
+    if fields:
+        def decompress():
+            for buff, data in fields:
+                decompression_message(buff, data)
+        elapsed = timed(decompress, min_time, repeat)
+        results[f'decompress/{name}'] = {'names_per_sec': len(fields) / elapsed, 'ns_per_name': elapsed / len(fields) * 1e9}
+    return results
+
+
+def bench_build_request(corpus: dict, min_time: float, repeat: int) -> dict:
+    questions = []
+    for packet in corpus.values():
+        dns_resp = DNSQuery()._parse_response(packet)
+        questions.append((dns_resp.qname, dns_resp.qtype))
+    dns = DNSQuery(transaction_id=1)
+
+    def cold():
+        for qname, qtype in questions:
+            _build_template(qname, qtype)
+
+    def cached():
+        for i, (qname, qtype) in enumerate(questions):
+            dns._build_request(qname, qtype, i + 1)
+
+    return {
+        'build_request/cold': {'requests_per_sec': len(questions) / timed(cold, min_time, repeat)},
+        'build_request/cached': {'requests_per_sec': len(questions) / timed(cached, min_time, repeat)},
+    }
+
+
+def bench_decoders(corpus: dict, min_time: float, repeat: int) -> dict:
+    """Construct each registered record type from the wire and decode its data."""
+    by_type: dict = {}
+    for packet in corpus.values():
+        for section in sections(DNSQuery()._parse_response(packet)):
+            for record in section:
+                if record.type in RECORD_DECODERS:
+                    by_type.setdefault(record.type, []).append(
+                        (packet, record._offset, record._size, record.name, record.type, record.class_, record.ttl))
+    results = {}
+    for rtype, fields in sorted(by_type.items()):
+        cls = RECORD_DECODERS[rtype]
+
+        def decode():
+            for packet, offset, size, name, type_, class_, ttl in fields:
+                cls.from_wire(packet, offset, size, name, type_, class_, ttl, {}).data_view
+        elapsed = timed(decode, min_time, repeat)
+        results[f'decoder/{RECORD_TYPE_NAME[rtype]}'] = {'ns_per_record': elapsed / len(fields) * 1e9}
+    return results
+
+
+def poison_index(networks: int = 50000) -> PoisonIndex:
+    """A deterministic index mixing /32, /24, /20 IPv4 and /48 IPv6 networks, plus the corpus injection address."""
+    index = PoisonIndex(['31.13.94.41'])
+    for i in range(networks):
+        kind = i % 4
+        if kind == 0:
+            index.add(f'{100 + i % 100}.{i >> 8 & 255}.{i & 255}.{i % 251}')
+        elif kind == 1:
+            index.add(f'{100 + i % 100}.{i >> 8 & 255}.{i & 255}.0/24')
+        elif kind == 2:
+            index.add(f'{100 + i % 100}.{i >> 4 & 255}.{i << 4 & 240}.0/20')
+        else:
+            index.add(f'2001:db8:{i & 0xffff:x}::/48')
+    return index
+
+
+def bench_classify(corpus: dict, min_time: float, repeat: int) -> dict:
+    """DNSResponse.classify over every message that carries A/AAAA answers."""
+    index = poison_index()
+    responses = []
+    for packet in corpus.values():
+        dns_resp = DNSQuery()._parse_response(packet)
+        if any(record.type in (RecordType.A, RecordType.AAAA) for record in dns_resp.answer_RRs):
+            responses.append(dns_resp)
+
+    def classify():
+        for dns_resp in responses:
+            dns_resp.classify(index)
+    elapsed = timed(classify, min_time, repeat)
+    return {'classify/poison_index': {'responses_per_sec': len(responses) / elapsed}}
+
+
+def run(min_time: float = 0.2, repeat: int = 3) -> dict:
+    corpus = load_corpus()
+    results = {}
+    for name, packet in corpus.items():
+        results.update(bench_message(name, packet, min_time, repeat))
+    results.update(bench_build_request(corpus, min_time, repeat))
+    results.update(bench_decoders(corpus, min_time, repeat))
+    results.update(bench_classify(corpus, min_time, repeat))
+    return results
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'version': __version__,
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Print the change of every metric; return the ones that got worse by more than threshold."""
+    regressions = []
+    for key, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(key, {}).get(metric)
+            if not base:
+                continue
+            change = value / base - 1
+            worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+            mark = '  REGRESSION' if worse else ''
+            print(f'{key:>28} {metric:>20}: {base:>14,.1f} -> {value:>14,.1f} ({change:+.1%}){mark}')
+            if worse:
+                regressions.append((key, metric, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='dns-observe parser microbenchmarks')
+    parser.add_argument('-o', '--output', metavar='FILE', help='save the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='compare with results saved by an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.15, help='relative change counted as a regression')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per measurement')
+    parser.add_argument('--repeat', type=int, default=3, help='measurements per benchmark, the best is kept')
+    parser.add_argument('--quick', action='store_true', help='short measurements for a smoke test')
+    args = parser.parse_args()
+    if args.quick:
+        args.min_time, args.repeat = 0.01, 1
+
+    results = run(args.min_time, args.repeat)
+    for key, metrics in results.items():
+        print(f'{key:>28}  ' + '  '.join(f'{metric}={value:,.1f}' for metric, value in metrics.items()))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': metadata(), 'results': results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\n== compared with {baseline['meta'].get('commit')} ({baseline['meta'].get('time')}) ==")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f'{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,80 @@
 from .dns import *
 from .dns import __version__
+from .cache import ObservationCache, CacheInfo
+from .metrics import Metrics, MetricsServer
+from .pcap import PcapWriter
+from .poison import PoisonIndex
+from .sinks import Sink, CallbackSink, QueueSink, TextSink, JSONLinesSink, CSVSink, ResponseEvent, ROW_FIELDS, iter_rows, render_text
 
 __all__ = [
     # RCODE definitions
     'REPLY_CODE',
     # Core classes
     'DNSQuery',
+    'AsyncDNSQuery',
     'DNSResponse',
     'DNSResourceRecord',
+    # Response sinks
+    'Sink',
+    'CallbackSink',
+    'QueueSink',
+    'TextSink',
+    'JSONLinesSink',
+    'CSVSink',
+    'ResponseEvent',
+    'render_text',
+    'iter_rows',
+    'ROW_FIELDS',
+    # Packet capture
+    'PcapWriter',
+    # Forged address classification
+    'PoisonIndex',
+    # Observation cache
+    'ObservationCache',
+    'CacheInfo',
+    # Observation database
+    'ObservationStore',
+    # Prometheus metrics
+    'Metrics',
+    'MetricsServer',
+    # Tracing
+    'Tracer',
+    'ChromeTraceExporter',
+    # DNS over TCP
+    'TCPPool',
+    # Sharded scanning
+    'query_sharded',
     # Record types
     'RecordType',
     'QTYPE',
     'QTYPE_NAME',
+    'RECORD_TYPE_NAME',
+    # Record decoder registry
+    'RECORD_DECODERS',
+    'register_record_type',
     # Functions and exceptions
     'query_type',
     'UnsupportTypeError',
     # Version
     '__version__',
 ]
+
+# 可选功能的模块依赖 asyncio、sqlite3、inspect、ssl、concurrent.futures 等较慢的标准库模块，第一次访问时才导入
+_LAZY = {
+    'AsyncDNSQuery': '.aio',
+    'ObservationStore': '.store',
+    'Tracer': '.tracing',
+    'ChromeTraceExporter': '.tracing',
+    'TCPPool': '.tcp',
+    'query_sharded': '.shard',
+}
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,242 @@
+from __future__ import annotations
+from .dns import DNSQuery, RecordType
+from .receiver import Datagram
+from .utils import ResponseList
+from typing import Iterable
+import asyncio
+import socket
+import time
+
+
+class _ResponseProtocol(asyncio.DatagramProtocol):
+    """
+    把收到的数据包交给 AsyncDNSQuery 解析
+
+    sources 为 None 时所有响应追加到 responses；否则按来源地址分发到 sources 对应的服务器，忽略其他来源的数据包。
+    """
+
+    def __init__(self, client: AsyncDNSQuery, responses: ResponseList | dict[str, ResponseList], deadline: float,
+                 sources: dict[tuple, str] | None = None):
+        self.client = client
+        self.responses = responses
+        self.sources = sources
+        self.loop = asyncio.get_running_loop()
+        self.start_time = self.loop.time()
+        self.deadline = deadline
+        self.deadline_changed = asyncio.Event()
+
+    def connection_made(self, transport: asyncio.DatagramTransport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: tuple):
+        now = self.loop.time()
+        server = None
+        if self.sources is not None:
+            server = self.sources.get(addr)
+            if server is None:
+                return
+        if self.client.capture is not None:
+            self.client.capture.write_udp(data, addr, self.transport.get_extra_info('sockname'), time.time())
+        dns_resp = self.client._parse_packet(Datagram(data, addr, now))
+        if dns_resp is None:
+            return  # 丢弃无法解析的畸形数据包
+        dns_resp.rtt = now - self.start_time
+        dns_resp.address = addr
+        self.client._label(dns_resp)
+        if server is not None:
+            # 与 DNSQuery.query_servers 相同，多服务器查询监听完整的 wait_time
+            self.responses[server].append(dns_resp)
+            self.client._emit(dns_resp, server=server)
+            return
+        self.responses.append(dns_resp)
+        self.client._emit(dns_resp)
+        deadline = self.client._early_deadline(dns_resp, now, self.deadline)
+        if deadline < self.deadline:
+            self.deadline = deadline
+            self.deadline_changed.set()
+
+    def error_received(self, exc: Exception):
+        # ICMP 端口不可达等错误不影响继续监听到 wait_time 结束
+        pass
+
+
+def _blocking(name: str):
+    """DNSQuery 中会阻塞事件循环的方法，在 AsyncDNSQuery 上调用时直接报错"""
+    def method(self, *args, **kwargs):
+        raise NotImplementedError(f'AsyncDNSQuery.{name}() would block the event loop; '
+                                  f'gather query() coroutines instead, or call DNSQuery.{name}() in a thread')
+    method.__name__ = method.__qualname__ = name
+    return method
+
+
+class AsyncDNSQuery(DNSQuery):
+    """
+    基于 asyncio datagram endpoint 的 DNSQuery
+
+    构造参数、记录类型和返回值与 DNSQuery 相同，但 query()、query_many() 和 query_servers() 是协程，
+    在监听窗口内不会阻塞事件循环，可以在同一个线程中并发运行大量观测。
+    TCP/TLS 查询和截断响应的 TCP 回退是阻塞的：TCP/TLS 方法调用时抛出 NotImplementedError，
+    tcp_fallback 默认关闭，传入 True 时抛出 ValueError。
+    """
+
+    def __init__(self, *args, tcp_fallback: bool = False, **kwargs):
+        if tcp_fallback:
+            raise ValueError('AsyncDNSQuery does not support tcp_fallback, the TCP exchange would block the event loop; '
+                             'call query_tcp() on a DNSQuery in a thread instead')
+        super().__init__(*args, tcp_fallback=False, **kwargs)
+
+    query_tcp = _blocking('query_tcp')
+    query_many_tcp = _blocking('query_many_tcp')
+    query_tls = _blocking('query_tls')
+    query_many_tls = _blocking('query_many_tls')
+
+    async def query(self, qname: str, qtype: RecordType=RecordType.A) -> ResponseList:
+        """
+        向指定 DNS 服务器查询 DNS 记录，持续收集响应直到 wait_time 结束
+
+        Parameters:
+            - qname(str): 查询记录的域名
+            - qtype(RecordType): 查询的记录类型，默认为 A 类型
+
+        Returns:
+            - ResponseList: 收到的所有响应
+
+        Raises:
+            - RuntimeError: 当 DNS 请求失败时抛出运行时错误
+        """
+        if self.cache is not None:
+            cached = self.cache.get(self._cache_key(qname, qtype))
+            if cached is not None:
+                return cached
+        loop = asyncio.get_running_loop()
+        responses = ResponseList()
+        qdata = self._build_request(qname, qtype)
+        try:
+            # 提前异步解析服务器地址，避免 sendto 在事件循环中阻塞解析域名
+            infos = await loop.getaddrinfo(self.server, self.port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            address = infos[0][4]
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda: _ResponseProtocol(self, responses, loop.time() + self.wait_time),
+                family=socket.AF_INET,
+            )
+        except OSError as err:
+            self._socket_error('send')
+            raise RuntimeError('DNS request failed: %s' % err)
+
+        try:
+            protocol.start_time = loop.time()
+            protocol.deadline = protocol.start_time + self.wait_time
+            transport.sendto(qdata, address)
+            if self.capture is not None:
+                self.capture.write_udp(qdata, transport.get_extra_info('sockname'), address, time.time())
+            if self.metrics is not None:
+                self.metrics.probes.inc((self.metrics.server_label(address),))
+            await self._wait(protocol)
+        finally:
+            transport.close()
+        self._learn_rtt(responses)
+        self._observe(responses, address)
+        if self.tracer is not None:
+            from .tracing import release
+            release(responses)
+        if self.cache is not None:
+            self.cache.put(self._cache_key(qname, qtype), responses)
+        return responses
+
+    async def query_many(self, domains: Iterable[str], qtype: RecordType=RecordType.A) -> dict[str, ResponseList]:
+        """
+        并发查询多个域名，每个域名一个 query() 协程，所有查询的监听窗口相互重叠
+
+        Parameters:
+            - domains(Iterable[str]): 查询记录的域名列表
+            - qtype(RecordType): 查询的记录类型，默认为 A 类型
+
+        Returns:
+            - dict[str, ResponseList]: 按输入顺序排列的 域名 -> 响应列表 映射
+
+        Raises:
+            - RuntimeError: 当 DNS 请求失败时抛出运行时错误
+        """
+        domains = list(dict.fromkeys(domains))
+        results = await asyncio.gather(*(self.query(domain, qtype) for domain in domains))
+        return dict(zip(domains, results))
+
+    async def query_servers(self, servers: Iterable[str], qname: str, qtype: RecordType=RecordType.A) -> dict[str, ResponseList]:
+        """
+        同时向多个 DNS 服务器发送同一个查询，在同一个监听窗口内按来源地址收集各服务器的响应
+
+        Parameters:
+            - servers(Iterable[str]): DNS 服务器地址或域名，端口使用 self.port
+            - qname(str): 查询记录的域名
+            - qtype(RecordType): 查询的记录类型，默认为 A 类型
+
+        Returns:
+            - dict[str, ResponseList]: 按输入顺序排列的 服务器 -> 响应列表 映射
+
+        Raises:
+            - RuntimeError: 当 DNS 请求失败时抛出运行时错误
+        """
+        loop = asyncio.get_running_loop()
+        servers = list(dict.fromkeys(servers))
+        try:
+            infos = await asyncio.gather(*(loop.getaddrinfo(server, self.port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+                                           for server in servers))
+        except OSError as err:
+            self._socket_error('resolve')
+            raise RuntimeError('DNS request failed: %s' % err)
+        results = {server: ResponseList() for server in servers}
+        sources = {info[0][4]: server for server, info in zip(servers, infos)}
+
+        qdata = self._build_request(qname, qtype)
+        try:
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda: _ResponseProtocol(self, results, loop.time() + self.wait_time, sources),
+                family=socket.AF_INET,
+            )
+        except OSError as err:
+            self._socket_error('send')
+            raise RuntimeError('DNS request failed: %s' % err)
+
+        try:
+            protocol.start_time = loop.time()
+            protocol.deadline = protocol.start_time + self.wait_time
+            for address in sources:
+                transport.sendto(qdata, address)
+                if self.capture is not None:
+                    self.capture.write_udp(qdata, transport.get_extra_info('sockname'), address, time.time())
+                if self.metrics is not None:
+                    self.metrics.probes.inc((self.metrics.server_label(address),))
+            await self._wait(protocol)
+        finally:
+            transport.close()
+        for server, responses in results.items():
+            self._learn_rtt(responses, self._server_view(server))
+        for address, server in sources.items():
+            self._observe(results[server], address)
+        if self.tracer is not None:
+            from .tracing import release
+            for responses in results.values():
+                release(responses)
+        return results
+
+    @staticmethod
+    async def _wait(protocol: _ResponseProtocol):
+        """等待到 protocol 的截止时间；adaptive 模式下截止时间可能被提前，此时被唤醒后按新的截止时间继续等待"""
+        while True:
+            remaining = protocol.deadline - protocol.loop.time()
+            if remaining <= 0:
+                break
+            protocol.deadline_changed.clear()
+            try:
+                await asyncio.wait_for(protocol.deadline_changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return f"AsyncDNSQuery(server={self.server_view!r}, id={self.transaction_id!r})"
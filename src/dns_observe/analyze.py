@@ -0,0 +1,137 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Iterable, Iterator, NamedTuple
+import argparse
+import struct
+import sys
+from .dns import DNSQuery, DNSResponse
+from .pcap import UDPDatagram, iter_udp, read_capture
+from .poison import PoisonIndex
+from .sinks import CSVSink, JSONLinesSink, ResponseEvent, Sink, TextSink
+from .store import ObservationStore
+from .utils import ResponseList
+
+
+class Observation(NamedTuple):
+    """抓包中的一次查询及其收到的所有响应"""
+    query: DNSResponse | None   # 查询报文（与响应格式相同），没有抓到查询时为 None
+    client: tuple               # (host, port)
+    server: tuple               # (host, port)
+    timestamp: float | None     # 查询发出的时间
+    responses: ResponseList
+
+
+def analyze_capture(path: str, port: int = 53, window: float = 10.0, poison: PoisonIndex | None = None) -> Iterator[Observation]:
+    """
+    从 pcap/pcapng 抓包文件中还原每次查询的观测结果
+
+    文件以内存映射方式读取，响应直接从映射内存解析。查询和响应按 (ID, 五元组) 配对，
+    查询发出 window 秒后不再接收新的响应，此时输出该查询的观测结果，内存占用与抓包大小无关。
+    提供 poison 时按污染地址索引判定真假，否则按到达顺序判定。
+    """
+    return pair_datagrams(iter_udp(read_capture(path), port), window, poison)
+
+def pair_datagrams(datagrams: Iterable[UDPDatagram], window: float = 10.0, poison: PoisonIndex | None = None) -> Iterator[Observation]:
+    """把按时间排列的 DNS 数据报配对为观测结果"""
+    parser = DNSQuery()
+    pending: OrderedDict[tuple, Observation] = OrderedDict()
+    horizon = float('inf')  # 最早的待定查询超出监听窗口的时间
+    for datagram in datagrams:
+        if datagram.timestamp > horizon:
+            # 先输出已经超出监听窗口的查询
+            while pending:
+                observation = next(iter(pending.values()))
+                if datagram.timestamp - observation.timestamp <= window:
+                    break
+                pending.popitem(last=False)
+                yield _classify(poison, observation)
+            horizon = next(iter(pending.values())).timestamp + window if pending else float('inf')
+        try:
+            message = parser._parse_response(datagram.payload)
+        except (IndexError, struct.error):
+            continue
+        if not message.flags & 0x8000:
+            # 查询：同一个 (ID, 五元组) 重复出现时视为新的一次查询
+            key = (message.id, datagram.src, datagram.dst)
+            previous = pending.pop(key, None)
+            if previous is not None:
+                yield _classify(poison, previous)
+            pending[key] = Observation(message, datagram.src, datagram.dst, datagram.timestamp, ResponseList())
+            horizon = min(horizon, datagram.timestamp + window)
+            continue
+        message.address = datagram.src
+        message.timestamp = datagram.timestamp
+        observation = pending.get((message.id, datagram.dst, datagram.src))
+        if observation is None:
+            # 没有抓到对应的查询，单独作为一次观测
+            yield _classify(poison, Observation(None, datagram.dst, datagram.src, None, ResponseList([message])))
+            continue
+        message.rtt = datagram.timestamp - observation.timestamp
+        observation.responses.append(message)
+    while pending:
+        yield _classify(poison, pending.popitem(last=False)[1])
+
+def _classify(poison: PoisonIndex | None, observation: Observation) -> Observation:
+    """
+    标记真假：有污染地址索引时按索引判定，否则（以及索引无法判定的响应）按到达顺序，
+    最后到达的响应为真实响应，其余为伪造
+    """
+    responses = observation.responses
+    if poison is not None:
+        undecided = ResponseList()
+        for response in responses:
+            try:
+                if response.classify(poison) is None:
+                    undecided.append(response)
+            except (IndexError, struct.error):
+                undecided.append(response)
+        responses = undecided
+    for response in responses.fakes():
+        response.verdict = 'fake'
+    if responses:
+        responses.real().verdict = 'real'
+    return observation
+
+def emit_observations(observations: Iterable[Observation], sinks: list[Sink]) -> int:
+    """把观测结果中的每个响应交给 sink，返回响应数量"""
+    count = 0
+    for observation in observations:
+        qname = observation.query.qname if observation.query is not None else None
+        server = '%s:%d' % observation.server
+        for response in observation.responses:
+            event = ResponseEvent(response, qname, server)
+            for sink in sinks:
+                sink.on_response(event)
+            count += 1
+    return count
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog='dns-observe analyze',
+        description='Re-analyze DNS responses in a pcap or pcapng capture',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('capture', nargs='+', help='pcap or pcapng file')
+    parser.add_argument('-p', '--port', type=int, default=53, help='DNS server port')
+    parser.add_argument('-w', '--window', type=float, default=10, help='seconds after a query during which responses are paired with it')
+    parser.add_argument('-f', '--format', choices=('text', 'jsonl', 'csv'), default='text', help='output format')
+    parser.add_argument('--poison', metavar='FILE', help='file of known forged IPs/CIDRs, used instead of arrival order to label responses')
+    parser.add_argument('--db', metavar='FILE', help='also append the observations to a SQLite observation database')
+    args = parser.parse_args(argv)
+    poison = PoisonIndex.load(args.poison) if args.poison else None
+    if args.format == 'jsonl':
+        sink = JSONLinesSink()
+    elif args.format == 'csv':
+        sink = CSVSink()
+    else:
+        sink = TextSink(lambda line: sys.stdout.write(line + '\n'))
+    sinks = [sink]
+    if args.db:
+        sinks.append(ObservationStore(args.db, batch_size=10000))
+    try:
+        for path in args.capture:
+            emit_observations(analyze_capture(path, args.port, args.window, poison), sinks)
+    finally:
+        for sink in sinks:
+            sink.close()
@@ -0,0 +1,111 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import TYPE_CHECKING, NamedTuple
+import struct
+import threading
+import time
+from .utils import ResponseList
+
+if TYPE_CHECKING:
+    from .poison import PoisonIndex
+
+
+class CacheInfo(NamedTuple):
+    """缓存的命中统计，类似 functools.lru_cache 的 cache_info()"""
+    hits: int
+    misses: int
+    evictions: int     # 因容量不足淘汰的条目
+    expirations: int   # 因 TTL 到期删除的条目
+    size: int
+    maxsize: int
+
+
+class ObservationCache:
+    """
+    按 (服务器, 域名, 类型) 缓存完整观测结果的 LRU 缓存
+
+    有效期由真实响应答案区的最小 TTL 决定，不超过 max_ttl；收到伪造响应时不超过 poisoned_ttl，
+    以便较快地重新观测；没有答案的真实响应（NXDOMAIN、NODATA）使用 negative_ttl。
+    没有收到任何响应的结果不缓存。多个 DNSQuery 可以共用同一个缓存。
+    缓存的是响应的独立副本（见 DNSResponse.detach），不引用接收缓冲区。
+    """
+
+    def __init__(self, maxsize: int = 1024, max_ttl: float = 300, poisoned_ttl: float = 60,
+                 negative_ttl: float = 30, poison: PoisonIndex | None = None):
+        self.maxsize = maxsize
+        self.max_ttl = max_ttl
+        self.poisoned_ttl = poisoned_ttl
+        self.negative_ttl = negative_ttl
+        self.poison = poison    # 设置后按污染地址索引判定真假，否则按到达顺序
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: OrderedDict[tuple, tuple[float, ResponseList]] = OrderedDict()  # 键 -> (过期时间, 响应)
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> ResponseList | None:
+        """返回未过期的缓存结果（新的列表，响应对象共享），没有时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return ResponseList(entry[1])
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, responses: ResponseList) -> float:
+        """缓存一次观测结果，返回有效期秒数，0 表示没有缓存"""
+        ttl = self.ttl_for(responses)
+        if ttl <= 0:
+            return 0
+        with self._lock:
+            # 缓存的响应可能存活很久，不能占住整个接收 arena
+            self._entries[key] = (time.monotonic() + ttl, ResponseList(dns_resp.detach() for dns_resp in responses))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return ttl
+
+    def ttl_for(self, responses: ResponseList) -> float:
+        """
+        按上面的规则计算观测结果的有效期
+
+        设置了 poison 时使用接收时已判定的 verdict，没有判定过的才解析答案区；
+        答案区畸形的响应与伪造响应一样不超过 poisoned_ttl。
+        """
+        real = responses.real(self.poison)
+        if real is None:
+            # 全部是伪造或畸形的响应，真实响应丢失
+            return min(self.poisoned_ttl, self.max_ttl) if responses else 0
+        try:
+            ttls = [record.ttl for record in real.answer_RRs]
+        except (IndexError, struct.error, ValueError):
+            return 0  # 畸形的答案区不缓存
+        ttl = min(ttls) if ttls and real.rcode == 0 else self.negative_ttl
+        ttl = min(ttl, self.max_ttl)
+        if responses.fakes(self.poison) or any(response.verdict == 'malformed' for response in responses):
+            ttl = min(ttl, self.poisoned_ttl)
+        return ttl
+
+    def invalidate(self, key: tuple) -> bool:
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.evictions, self.expirations, len(self._entries), self.maxsize)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"ObservationCache(size={len(self._entries)}, maxsize={self.maxsize}, hits={self.hits}, misses={self.misses})"
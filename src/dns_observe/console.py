@@ -2,6 +2,7 @@ import threading
 import sys
 import time
 import math
+from .sinks import QueueSink, render_text
 
 class Spinner:
     def __init__(self, obj, message="", countdown=None, interval=0.15):
@@ -13,23 +14,28 @@ class Spinner:
         self.running = False
         self.thread = None
         self._idx = 0
-        self._msg_index = 0  # 记录已输出的消息索引
         self._start_time = None
+        self._lock = threading.Lock()  # 输出消息与 spinner 刷新互斥
+        # 接收循环只把响应放进队列，格式化和输出都在 spinner 线程中进行；不设上限，命令行输出不能丢
+        self._sink = QueueSink(maxsize=None)
+
+    def write(self, msg: str):
+        """在 spinner 行之上输出一行消息"""
+        with self._lock:
+            self.clear_spinner_line()
+            sys.stdout.write(f'{msg}\n')
+            sys.stdout.flush()
+
+    def _render_pending(self):
+        """取走队列中的响应，格式化后一次写在 spinner 行之上"""
+        events = self._sink.drain()
+        if events:
+            self.write('\n'.join(line for event in events for line in render_text(event)))
 
     def _spin(self):
         try:
             while self.running:
-                # 先清除当前 spinner 行，再输出消息
-                self.clear_spinner_line()
-                # 只输出新消息（从上次索引开始）
-                with self.obj._msg_lock:
-                    for msg in self.obj.stdout_msg[self._msg_index:]:
-                        sys.stdout.write(f'{msg}\n')
-                        sys.stdout.flush()
-                    
-                    # 更新已输出消息的索引
-                    self._msg_index = len(self.obj.stdout_msg)
-
+                self._render_pending()
                 # 更新 spinner 字符
                 char = self.chars[self._idx % len(self.chars)]
                 
@@ -41,8 +47,9 @@ class Spinner:
                 else:
                     tips = self.message
 
-                sys.stdout.write(f'\r{char} {tips}')
-                sys.stdout.flush()
+                with self._lock:
+                    sys.stdout.write(f'\033[2K\r{char} {tips}')
+                    sys.stdout.flush()
 
                 time.sleep(self.interval)
                 self._idx += 1
@@ -59,6 +66,7 @@ class Spinner:
         sys.stdout.flush()        
 
     def start(self):
+        self.obj.add_sink(self._sink)
         self.running = True
         self._start_time = time.time()
         sys.stdout.write('\033[?25l')  # 隐藏光标
@@ -70,6 +78,8 @@ class Spinner:
         self.running = False
         if self.thread:
             self.thread.join()
+        self.obj.remove_sink(self._sink)
+        self._render_pending()
         self.clear_spinner_line()
         sys.stdout.write('\033[?25h')  # 显示光标
         sys.stdout.flush()
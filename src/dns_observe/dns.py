@@ -1,14 +1,26 @@
 from __future__ import annotations
 from .parameters import REPLY_CODE
 from .utils import ResponseList
+from .receiver import Datagram, DatagramReceiver
+from .cache import ObservationCache
+from .pcap import PcapWriter
+from .poison import PoisonIndex
+from .sinks import CSVSink, JSONLinesSink, ResponseEvent, Sink, ROW_FIELDS
 import socket
 import struct
 import time
-import datetime
 import argparse
-import threading
 import sys
 import random
+import select
+from collections import OrderedDict, deque
+from functools import cached_property
+from typing import TYPE_CHECKING, Callable, Iterable
+if TYPE_CHECKING:
+    # 只在用到时导入：http.server、ssl 和 inspect 会让 import dns_observe 慢数十毫秒
+    from .metrics import Metrics
+    from .tracing import Tracer
+    from .tcp import TCPConnection, TCPPool
 
 __version__ = "0.8.1"
 
@@ -43,16 +55,70 @@ QTYPE = {
 # 反向查找：数值 -> 类型名称
 QTYPE_NAME = {v: k for k, v in QTYPE.items()}
 
+# 所有已知类型的名称，包括不能在命令行中查询的类型
+RECORD_TYPE_NAME = {v: k for k, v in vars(RecordType).items() if not k.startswith('_')}
+
+# 记录解码器注册表：RecordType -> 记录类，未注册的类型解析为 DNSResourceRecord
+RECORD_DECODERS: dict[int, type[DNSResourceRecord]] = {}
+
+def register_record_type(record_type: int):
+    """
+    类装饰器，把记录类注册为 record_type 的解码器，覆盖已有的注册
+
+    记录类需要提供 from_wire 类方法，继承 DNSResourceRecord 即可::
+
+        @register_record_type(RecordType.PTR)
+        class PTRRecord(DNSResourceRecord):
+            @property
+            def data_view(self) -> str:
+                return self._read_name()[0]
+    """
+    def decorator(cls: type[DNSResourceRecord]) -> type[DNSResourceRecord]:
+        RECORD_DECODERS[record_type] = cls
+        return cls
+    return decorator
+
+# RTT 画像的指数加权移动平均系数
+_RTT_ALPHA = 0.3
+
 class DNSQuery:
-    def __init__(self, server='1.1.1.1', port=53, wait_time=5, timeout=3, transaction_id=0):
+    # 每个实例缓存的查询数据包模板数量
+    TEMPLATE_CACHE_SIZE = 256
+
+    def __init__(self, server='1.1.1.1', port=53, wait_time=5, timeout=3, transaction_id=0,
+                 adaptive=False, grace=0.2, rtt_tolerance=0.5, sinks: Iterable[Sink] = (), capture: PcapWriter | None = None,
+                 poison: PoisonIndex | None = None, cache: ObservationCache | None = None,
+                 metrics: Metrics | None = None, tracer: Tracer | None = None, tcp_pool: TCPPool | None = None,
+                 tcp_fallback: bool = True, tls_pool: TCPPool | None = None, tls_port: int = 853):
         self.server: str = server
         self.port: int = port
         self.wait_time: float = float(wait_time)  # 设置持续监听的时间
         self.timeout: int = timeout  # 设置 socket 超时时间
         self.transaction_id: int = transaction_id  # 默认值0则随机生成 transaction ID，用户也可以指定一个固定的 ID 以便于追踪
+        # adaptive 模式：符合 RTT 画像的 NOERROR 响应到达后，只再监听 grace 秒
+        self.adaptive: bool = adaptive
+        self.grace: float = float(grace)
+        self.rtt_tolerance: float = rtt_tolerance  # RTT 不低于画像的 (1 - rtt_tolerance) 倍才视为真实响应
+        self.rtt_profile: dict[str, float] = {}  # server_view -> 真实响应的平均 RTT（秒）
         self.sock = None
-        self.stdout_msg = []
-        self._msg_lock = threading.Lock()
+        self.sinks: list[Sink] = list(sinks)  # 每个响应到达时依次通知
+        self.capture: PcapWriter | None = capture  # 发出的查询和收到的数据包都写入该 pcap
+        self.poison: PoisonIndex | None = poison  # 设置后按已知污染地址为每个响应判定 verdict
+        self.cache: ObservationCache | None = cache  # 设置后 query() 在有效期内直接返回缓存的观测结果
+        self.metrics: Metrics | None = metrics  # 设置后在接收循环中更新计数器和直方图
+        # TCP 查询使用的持久连接池，没有传入时第一次使用才创建自己的连接池，并在 close() 时关闭
+        self._tcp_pool: TCPPool | None = tcp_pool
+        self._owns_tcp_pool = tcp_pool is None
+        self.tcp_fallback: bool = tcp_fallback  # UDP 响应设置了 TC 位时自动通过 TCP 重新查询
+        # DNS over TLS 的连接池，没有传入时第一次使用才创建（加载系统 CA 证书需要数毫秒）
+        self._tls_pool: TCPPool | None = tls_pool
+        self._owns_tls_pool = tls_pool is None
+        self.tls_port: int = tls_port
+        self._templates: OrderedDict[tuple[str, int], bytearray] = OrderedDict()
+        self.tracer: Tracer | None = tracer  # 设置后各阶段的方法被替换为带追踪的包装，见 tracing.install
+        if tracer is not None:
+            from .tracing import install
+            install(self, tracer)
 
     def query(self, qname: str, qtype: RecordType=RecordType.A) -> ResponseList:
         """
@@ -68,189 +134,568 @@ class DNSQuery:
         Raises:
             - RuntimeError: 当 DNS 请求失败时抛出运行时错误
         """
+        if self.cache is not None:
+            cached = self.cache.get(self._cache_key(qname, qtype))
+            if cached is not None:
+                return cached
         responses = ResponseList()
         qdata = self._build_request(qname, qtype)
+
+        def on_packet(packet: Datagram, deadline: float) -> float:
+            # 每次查询都有自己的 arena，复制数据包，避免每个结果都占住整个 arena
+            dns_resp = self._accept(packet.detach(), receiver, start_time)
+            if dns_resp is None:
+                return deadline
+            responses.append(dns_resp)
+            self._emit(dns_resp)
+            return self._early_deadline(dns_resp, packet.time, deadline)
+
+        self._open_socket()
+        try:
+            receiver = DatagramReceiver(self.sock)
+            try:
+                self._send(receiver, qdata, (self.server, self.port))
+            except socket.error as err:
+                self._socket_error('send')
+                raise RuntimeError('DNS request failed: %s' % err)
+            start_time = time.monotonic()
+            self._listen(receiver, start_time + self.wait_time, on_packet)
+        finally:
+            # sink 抛出异常时也要关闭 socket
+            self.sock.close()
+        if self.tcp_fallback and any(dns_resp.truncated for dns_resp in responses):
+            self._fallback_tcp((self.server, self.port), [(qname, qname, qtype)], {qname: responses})
+        self._learn_rtt(responses)
+        self._observe(responses, (self.server, self.port))
+        if self.cache is not None:
+            self.cache.put(self._cache_key(qname, qtype), responses)
+        return responses
+
+    def _cache_key(self, qname: str, qtype: int) -> tuple[str, str, int]:
+        return (self.server_view, _idna_name(qname).lower(), qtype)
+
+    def _open_socket(self):
+        """为本次查询创建 UDP socket，调用方负责在 finally 中关闭"""
         try:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.sock.settimeout(self.timeout)
-            self.sock.sendto(qdata, (self.server, self.port))
         except socket.error as err:
+            self._socket_error('send')
             raise RuntimeError('DNS request failed: %s' % err)
-        
-        start_time = time.time()
-        while time.time() - start_time < self.wait_time:
+
+    def _listen(self, receiver: DatagramReceiver, deadline: float, on_packet: Callable[[Datagram, float], float]):
+        """
+        监听直到截止时间，每次 socket 可读时一次取走所有排队的数据包
+
+        on_packet(packet, deadline) 处理一个数据包并返回（可能提前的）新截止时间。
+        """
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # 等待时间不超过剩余时间，避免越过监听截止时间
+            if not self._wait(receiver, min(self.timeout, remaining)):
+                continue
+            for packet in self._drain(receiver):
+                deadline = on_packet(packet, deadline)
+
+    def _wait(self, receiver: DatagramReceiver, timeout: float) -> bool:
+        """等待 socket 可读，单独成为方法以便追踪等待时间"""
+        return receiver.wait(timeout)
+
+    def _send(self, receiver: DatagramReceiver, qdata: bytes, address: tuple):
+        """发送查询，开启抓包时同时写入 pcap"""
+        receiver.sock.sendto(qdata, address)
+        if self.capture is not None:
+            self.capture.write_udp(qdata, receiver.sock.getsockname(), address, time.time())
+        if self.metrics is not None:
+            self.metrics.probes.inc((self.metrics.server_label(address),))
+
+    def _drain(self, receiver: DatagramReceiver) -> list[Datagram]:
+        """取走所有已到达的数据包，开启抓包时包括无法解析和不相关的数据包"""
+        packets = receiver.drain()
+        if self.capture is not None and packets:
+            local = receiver.sock.getsockname()
+            for packet in packets:
+                self.capture.write_udp(packet.data, packet.address, local, receiver.wall_time(packet.time))
+        return packets
+
+    def _accept(self, packet: Datagram, receiver: DatagramReceiver, sent_time: float,
+                dns_resp: DNSResponse | None = None) -> DNSResponse | None:
+        """
+        解析收到的数据包并记录到达信息，畸形的数据包返回 None
+
+        已经用 _parse_packet 解析过（例如为了按 ID 分发）时传入 dns_resp，避免重复解析。
+        """
+        if dns_resp is None:
+            dns_resp = self._parse_packet(packet)
+            if dns_resp is None:
+                return None
+        dns_resp.address = packet.address
+        dns_resp.timestamp = receiver.wall_time(packet.time)
+        dns_resp.rtt = packet.time - sent_time
+        self._label(dns_resp)
+        return dns_resp
+
+    def _parse_packet(self, packet: Datagram) -> DNSResponse | None:
+        """解析数据包，畸形的返回 None；开启指标时记录解析时间、rcode 和畸形数据包"""
+        metrics = self.metrics
+        if metrics is None:
             try:
-                response, address = self.sock.recvfrom(1024)
-                dns_resp = self._parse_response(response)
-                responses.append(dns_resp)
-                # output DNS response summary
-                now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
-                reply = dns_resp.reply
-                code  = dns_resp.rcode                    
-                stdout = f"↯ Time: {now}, Reply: {reply}({code}), Answer: {dns_resp.answer_n}, Authority: {dns_resp.authority_n}, Additional: {dns_resp.additional_n}"
-                log_msgs = self._print_resource_records(dns_resp, now)
-                with self._msg_lock:
-                    self.stdout_msg.append(stdout)
-                    self.stdout_msg.extend(log_msgs)         
-            except socket.timeout:
-                # print('{} fail'.format(time))
-                pass # 超时是预期行为，继续监听直到 wait_time 结束
-        self.sock.close()
-        return responses
+                return self._parse_response(packet.data)
+            except (IndexError, struct.error):
+                return None
+        start = time.perf_counter_ns()
+        try:
+            dns_resp = self._parse_response(packet.data)
+        except (IndexError, struct.error):
+            metrics.malformed.inc((metrics.server_label(packet.address),))
+            return None
+        metrics.parse_time.observe((time.perf_counter_ns() - start) / 1e9)
+        metrics.responses.inc((metrics.server_label(packet.address), dns_resp.rcode))
+        return dns_resp
+
+    def _observe(self, responses: ResponseList, address: tuple):
+        """发往 address 的查询监听窗口结束，开启指标时记录 RTT 和伪造响应数量"""
+        if self.metrics is not None:
+            self.metrics.observe_probe(self.metrics.server_label(address), responses, self.poison)
+
+    def _socket_error(self, operation: str):
+        if self.metrics is not None:
+            self.metrics.socket_errors.inc((operation,))
+
+    def _label(self, dns_resp: DNSResponse):
+        """设置了污染地址索引时判定响应的 verdict"""
+        if self.poison is not None:
+            dns_resp.classify(self.poison)
+
+    def _early_deadline(self, dns_resp: DNSResponse, now: float, deadline: float) -> float:
+        """
+        adaptive 模式下，第一个 RTT 符合画像的 NOERROR 响应到达后，把截止时间提前到 now + grace
 
-    def _print_record_section(self, records: list[DNSResourceRecord], now: str, label: str = "") -> list[str]:
-        """打印一组 DNS 记录（answer/authority/additional）"""
-        if not records:
-            return []
-        single = len(records) == 1
-        stdout_msgs = []
-        for i, record in enumerate(records):
-            if single:
-                mark = '-'
-            else:
-                if i == 0:
-                    mark = '┌'
-                elif i == len(records) - 1:
-                    mark = '└'
-                else:
-                    mark = '│'
-            if record.type in QTYPE_NAME:
-                stdout = f"{mark} {label}: {record.name}, TTL: {record.ttl_view}, {record.type_name}: {record.data_view}"
-            else:
-                stdout = f"{mark} {label}: {record.name}, TTL: {record.ttl_view}, Type: {record.type_name}, Data: \"{record.data_view}\""
-            stdout_msgs.append(stdout)
-            
-        return stdout_msgs
+        伪造的响应通常比真实响应到达得更早，所以只要求 RTT 不低于画像的 (1 - rtt_tolerance) 倍。
+        还没有画像的服务器总是监听完整的 wait_time。
+        """
+        if not self.adaptive or dns_resp.rcode != 0:
+            return deadline
+        expected = self.rtt_profile.get(self.server_view)
+        if expected is None or dns_resp.rtt < expected * (1 - self.rtt_tolerance):
+            return deadline
+        return min(deadline, now + self.grace)
+
+    def _learn_rtt(self, responses: ResponseList, server_view: str | None = None):
+        """用判定为真实的 NOERROR 响应更新服务器的 RTT 画像"""
+        real = responses.real()
+        if real is None or real.rcode != 0 or real.rtt is None:
+            return
+        key = server_view if server_view is not None else self.server_view
+        expected = self.rtt_profile.get(key)
+        if expected is None:
+            self.rtt_profile[key] = real.rtt
+        else:
+            self.rtt_profile[key] = expected + (real.rtt - expected) * _RTT_ALPHA
 
-    def _print_resource_records(self, dns_resp: DNSResponse, now: str) -> list[str]:
-        """打印完整的 DNS 响应（包含 answer/authority/additional）"""
-        stdout_msgs = []
+    def query_many(self, domains: Iterable[str], qtype: RecordType=RecordType.A) -> dict[str, ResponseList]:
+        """
+        通过同一个 socket 批量查询多个域名，所有查询的监听窗口相互重叠
 
-        if dns_resp.answer_RRs:
-            stdout_msgs.extend(self._print_record_section(dns_resp.answer_RRs, now, label="Answer"))
+        每个查询使用不同的 transaction ID，收到的数据包按 ID 和 question 分发回对应的域名。
+        总耗时约为发送时间加上一个 wait_time，而不是 N × wait_time。
 
-        if dns_resp.authority_RRs:
-            stdout_msgs.extend(self._print_record_section(dns_resp.authority_RRs, now, label="Authority"))
+        Parameters:
+            - domains(Iterable[str]): 查询记录的域名列表
+            - qtype(RecordType): 查询的记录类型，默认为 A 类型
 
-        if dns_resp.additional_RRs:
-            stdout_msgs.extend(self._print_record_section(dns_resp.additional_RRs, now, label="Additional"))
+        Returns:
+            - dict[str, ResponseList]: 按输入顺序排列的 域名 -> 响应列表 映射
 
-        return stdout_msgs
+        Raises:
+            - RuntimeError: 当 DNS 请求失败时抛出运行时错误
+        """
+        results: dict[str, ResponseList] = {}
+        pending: dict[tuple[int, str, int], tuple[str, float]] = {}
+
+        def on_packet(packet: Datagram, deadline: float) -> float:
+            # 按 (ID, question) 分发，忽略不属于本次扫描的数据包
+            dns_resp = self._parse_packet(packet)
+            if dns_resp is None:
+                return deadline
+            query = pending.get((dns_resp.id, dns_resp.qname.lower(), dns_resp.qtype))
+            if query is None:
+                return deadline
+            domain, sent_time = query
+            # 结果比本次扫描的 arena 存活得更久，保存不引用 arena 的副本
+            dns_resp = self._accept(packet, receiver, sent_time, dns_resp.detach())
+            results[domain].append(dns_resp)
+            self._emit(dns_resp, qname=domain)
+            return deadline
+
+        # 固定 transaction ID 时从该值开始依次递增，便于在 wireshark 中追踪；否则随机起始
+        first_id = self.transaction_id or random.randint(1, 65535)
+        self._open_socket()
+        try:
+            receiver = DatagramReceiver(self.sock)
+            try:
+                for i, domain in enumerate(domains):
+                    if domain in results:
+                        continue
+                    # 超过 65535 个查询时 ID 会回绕，此时依靠 question 区分
+                    tid = (first_id - 1 + i) % 65535 + 1
+                    results[domain] = ResponseList()
+                    self._send(receiver, self._build_request(domain, qtype, tid), (self.server, self.port))
+                    pending[(tid, _idna_name(domain).lower(), qtype)] = (domain, time.monotonic())
+                    # 发送的同时取走已到达的响应，避免 socket 接收缓冲区溢出
+                    for packet in self._drain(receiver):
+                        on_packet(packet, 0)
+            except socket.error as err:
+                self._socket_error('send')
+                raise RuntimeError('DNS request failed: %s' % err)
+            self._listen(receiver, time.monotonic() + self.wait_time, on_packet)
+        finally:
+            self.sock.close()
+        if self.tcp_fallback:
+            truncated = [(domain, domain, qtype) for domain, responses in results.items()
+                         if any(dns_resp.truncated for dns_resp in responses)]
+            if truncated:
+                self._fallback_tcp((self.server, self.port), truncated, results)
+        for responses in results.values():
+            self._observe(responses, (self.server, self.port))
+        return results
+
+    def query_servers(self, servers: Iterable[str], qname: str, qtype: RecordType=RecordType.A) -> dict[str, ResponseList]:
+        """
+        同时向多个 DNS 服务器发送同一个查询，在同一个监听窗口内按来源地址收集各服务器的响应
 
-    def _build_request(self, qname: str, qtype: int) -> bytes:
-        if self.transaction_id == 0:
-            self.transaction_id = random.randint(1, 65535)
-        flag = 0x0100
-        qdcount = 1
-        ancount = 0
-        nscount = 0
-        arcount = 0
+        Parameters:
+            - servers(Iterable[str]): DNS 服务器地址或域名，端口使用 self.port
+            - qname(str): 查询记录的域名
+            - qtype(RecordType): 查询的记录类型，默认为 A 类型
 
-        qname = qname.split('.')
-        qdata = b''
-        for q in qname:
-            qdata += struct.pack('>B', len(q)) + q.encode('utf-8')
-        qdata += b'\x00'
+        Returns:
+            - dict[str, ResponseList]: 按输入顺序排列的 服务器 -> 响应列表 映射
 
-        # label_size = [len(i) for i in qname]
-        # qname = struct.pack('>' + 'B' * len(qname), *label_size) + b''.join([bytes(part, 'utf-8') for part in qname]) + b'\x00'
+        Raises:
+            - RuntimeError: 当 DNS 请求失败时抛出运行时错误
+        """
+        results: dict[str, ResponseList] = {}
+        sources: dict[tuple[str, int], str] = {}
+        try:
+            # 先解析所有服务器地址，保证查询在同一时刻发出，且能按来源地址对应回服务器
+            for server in servers:
+                if server in results:
+                    continue
+                address = socket.getaddrinfo(server, self.port, socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+                results[server] = ResponseList()
+                sources[address] = server
+        except socket.error as err:
+            self._socket_error('resolve')
+            raise RuntimeError('DNS request failed: %s' % err)
 
-        header = struct.pack('>HHHHHH', self.transaction_id, flag, qdcount, ancount, nscount, arcount)
-        question = qdata + struct.pack('>HH', qtype, 1)
+        qdata = self._build_request(qname, qtype)
 
-        return header + question
-    
-    def _parse_name(self, response: bytes, offset: int) -> tuple[str, int]:
-        # https://www.rfc-editor.org/rfc/rfc1035#section-4.1.4
-        nlen = response[offset]
-        parts = []
-        while nlen != 0:
-            if nlen & 0b11000000 == 0b11000000:
-                (message_compression,) = struct.unpack('>H', response[offset: offset+2])
-                _offset = message_compression & 0b11111111111111
-                p, _set = self._parse_name(response, _offset)  # 递归调用
-                parts.extend(p)                                # list extend
-                offset += 1
-                nlen = 0  # break
+        def on_packet(packet: Datagram, deadline: float) -> float:
+            # 按来源地址分发，忽略不是来自所查询服务器的数据包
+            server = sources.get(packet.address)
+            if server is None:
+                return deadline
+            packet = packet.detach()
+            dns_resp = self._parse_packet(packet)
+            if dns_resp is None or dns_resp.id != self.transaction_id:
+                return deadline
+            dns_resp = self._accept(packet, receiver, start_time, dns_resp)
+            results[server].append(dns_resp)
+            self._emit(dns_resp, server=server)
+            return deadline
+
+        self._open_socket()
+        try:
+            receiver = DatagramReceiver(self.sock)
+            start_time = time.monotonic()
+            try:
+                for address in sources:
+                    self._send(receiver, qdata, address)
+            except socket.error as err:
+                self._socket_error('send')
+                raise RuntimeError('DNS request failed: %s' % err)
+            self._listen(receiver, start_time + self.wait_time, on_packet)
+        finally:
+            self.sock.close()
+        if self.tcp_fallback:
+            for address, server in sources.items():
+                if any(dns_resp.truncated for dns_resp in results[server]):
+                    self._fallback_tcp(address, [(server, qname, qtype)], results, by_server=True)
+        for server, responses in results.items():
+            self._learn_rtt(responses, self._server_view(server))
+        for address, server in sources.items():
+            self._observe(results[server], address)
+        return results
+
+    def query_tcp(self, qname: str, qtype: RecordType=RecordType.A) -> ResponseList:
+        """
+        通过 TCP 查询 DNS 记录，使用连接池中的持久连接
+
+        旁路注入无法伪造已建立 TCP 连接中的响应，与同一域名的 UDP 响应对比是判断污染的依据之一。
+
+        Parameters:
+            - qname(str): 查询记录的域名
+            - qtype(RecordType): 查询的记录类型，默认为 A 类型
+
+        Returns:
+            - ResponseList: 收到的响应（最多一个），transport 为 'tcp'
+
+        Raises:
+            - RuntimeError: 当无法建立连接时抛出运行时错误
+        """
+        return self.query_many_tcp([qname], qtype)[qname]
+
+    def query_many_tcp(self, domains: Iterable[str], qtype: RecordType=RecordType.A) -> dict[str, ResponseList]:
+        """
+        通过 TCP 批量查询多个域名，查询在持久连接上流水线发送，响应按 transaction ID 和 question 匹配
+
+        Parameters:
+            - domains(Iterable[str]): 查询记录的域名列表
+            - qtype(RecordType): 查询的记录类型，默认为 A 类型
+
+        Returns:
+            - dict[str, ResponseList]: 按输入顺序排列的 域名 -> 响应列表 映射，超时的域名响应列表为空
+
+        Raises:
+            - RuntimeError: 当无法建立连接时抛出运行时错误
+        """
+        return self._query_stream(domains, qtype, self.tcp_pool, (self.server, self.port), 'tcp')
+
+    def _query_stream(self, domains: Iterable[str], qtype: int, pool: TCPPool, address: tuple,
+                      transport: str) -> dict[str, ResponseList]:
+        """query_many_tcp 和 query_many_tls 的实现，pool 为所用的连接池"""
+        results: dict[str, ResponseList] = {}
+        requests = []
+        for domain in domains:
+            if domain not in results:
+                results[domain] = ResponseList()
+                requests.append((domain, domain, qtype))
+
+        def on_response(domain: str, dns_resp: DNSResponse):
+            results[domain].append(dns_resp)
+            self._emit(dns_resp, qname=domain)
+
+        self._exchange_tcp(address, requests, on_response, pool, transport)
+        for responses in results.values():
+            self._observe(responses, address)
+        return results
+
+    def query_tls(self, qname: str, qtype: RecordType=RecordType.A) -> ResponseList:
+        """
+        通过 DNS over TLS（RFC 7858，端口 self.tls_port）查询 DNS 记录
+
+        连接保持在 tls_pool 中供后续查询复用，重新连接时恢复之前的 TLS 会话，只有第一次连接需要完整握手。
+
+        Parameters:
+            - qname(str): 查询记录的域名
+            - qtype(RecordType): 查询的记录类型，默认为 A 类型
+
+        Returns:
+            - ResponseList: 收到的响应（最多一个），transport 为 'tls'
+
+        Raises:
+            - RuntimeError: 当无法建立连接或 TLS 握手失败（包括证书验证失败）时抛出运行时错误
+        """
+        return self.query_many_tls([qname], qtype)[qname]
+
+    def query_many_tls(self, domains: Iterable[str], qtype: RecordType=RecordType.A) -> dict[str, ResponseList]:
+        """通过 DNS over TLS 批量查询多个域名，与 query_many_tcp 相同，查询在持久连接上流水线发送"""
+        return self._query_stream(domains, qtype, self.tls_pool, (self.server, self.tls_port), 'tls')
+
+    @property
+    def tcp_pool(self) -> TCPPool:
+        if self._tcp_pool is None:
+            from .tcp import TCPPool
+            self._tcp_pool = TCPPool(timeout=self.timeout)
+        return self._tcp_pool
+
+    @property
+    def tls_pool(self) -> TCPPool:
+        if self._tls_pool is None:
+            import ssl
+            from .tcp import TCPPool
+            self._tls_pool = TCPPool(timeout=self.timeout, ssl_context=ssl.create_default_context())
+        return self._tls_pool
+
+    def _fallback_tcp(self, address: tuple, requests: list[tuple], results: dict[object, ResponseList],
+                      by_server: bool = False):
+        """UDP 响应被截断时通过 TCP 重新查询，完整的响应追加在 UDP 响应之后；TCP 不可用时保留截断的响应"""
+        def on_response(key, dns_resp: DNSResponse):
+            results[key].append(dns_resp)
+            if by_server:
+                self._emit(dns_resp, server=key)
             else:
-                parts.append(response[offset+1:offset+nlen+1]) # list append
-                offset += nlen + 1
-                nlen = response[offset]
+                self._emit(dns_resp, qname=key)
+
+        try:
+            self._exchange_tcp(address, requests, on_response)
+        except RuntimeError:
+            pass
+
+    def _exchange_tcp(self, address: tuple, requests: list[tuple[object, str, int]],
+                      on_response: Callable[[object, DNSResponse], object], pool: TCPPool | None = None,
+                      transport: str = 'tcp'):
+        """
+        通过连接池（默认为 tcp_pool）中的连接流水线发送 (key, qname, qtype) 查询，每个匹配的响应调用一次 on_response(key, dns_resp)
+
+        每条连接上最多有 max_pipeline 个未完成的查询，收到响应后补发；查询较多时分散到最多 max_connections 条连接上。
+        连接被服务器关闭时，其上未完成的查询在新连接上重试一次。超过 timeout 秒没有收到任何数据时放弃剩余的查询。
+        """
+        pool = pool if pool is not None else self.tcp_pool
+        first_id = self.transaction_id or random.randint(1, 65535)
+        # 与 query_many 相同，ID 按查询的顺序递增
+        queue = deque((key, qname, qtype, (first_id - 1 + i) % 65535 + 1) for i, (key, qname, qtype) in enumerate(requests))
+        retried: set[int] = set()
+        connections = min(pool.max_connections, -(-len(requests) // pool.max_pipeline))
+        inflight: dict[TCPConnection, dict[tuple, tuple]] = {}
+
+        def fail(conn: TCPConnection):
+            # 连接失效，未完成的查询放回队列重试一次
+            self._socket_error('tcp')
+            pool.discard(conn)
+            for request in inflight.pop(conn).values():
+                if request[3] not in retried:
+                    retried.add(request[3])
+                    queue.appendleft(request[:4])
+
+        try:
+            deadline = time.monotonic() + self.timeout
+            while queue or any(inflight.values()):
+                while queue and len(inflight) < connections:
+                    try:
+                        conn = pool.acquire(address)
+                    except OSError as err:
+                        self._socket_error('connect')
+                        raise RuntimeError('DNS request failed: %s' % err)
+                    inflight[conn] = {}
+                for conn, pending in list(inflight.items()):
+                    batch = []
+                    while queue and len(pending) < pool.max_pipeline:
+                        key, qname, qtype, tid = queue.popleft()
+                        batch.append(self._build_request(qname, qtype, tid))
+                        pending[(tid, _idna_name(qname).lower(), qtype)] = (key, qname, qtype, tid, time.monotonic())
+                    if batch:
+                        try:
+                            conn.send(batch)
+                        except OSError:
+                            fail(conn)
+                            continue
+                        if self.metrics is not None:
+                            self.metrics.probes.inc((self.metrics.server_label(address),), len(batch))
+                if not any(inflight.values()):
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                readable, _, _ = select.select(list(inflight), [], [], remaining)
+                for conn in readable:
+                    try:
+                        messages = conn.read()
+                    except OSError:
+                        fail(conn)
+                        continue
+                    now = time.monotonic()
+                    deadline = now + self.timeout
+                    pending = inflight[conn]
+                    for message in messages:
+                        dns_resp = self._parse_packet(Datagram(message, conn.peer, now))
+                        if dns_resp is None:
+                            continue
+                        request = pending.pop((dns_resp.id, dns_resp.qname.lower(), dns_resp.qtype), None)
+                        if request is None:
+                            continue
+                        dns_resp.address = conn.peer
+                        dns_resp.timestamp = time.time()
+                        dns_resp.rtt = now - request[4]
+                        dns_resp.transport = transport
+                        self._label(dns_resp)
+                        on_response(request[0], dns_resp)
+        finally:
+            for conn in inflight:
+                pool.release(conn)
+
+    def add_sink(self, sink: Sink) -> Sink:
+        """注册一个接收响应的 sink，返回该 sink"""
+        self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink: Sink):
+        self.sinks.remove(sink)
+
+    def _emit(self, dns_resp: DNSResponse, qname: str | None = None, server: str | None = None):
+        """把响应交给所有 sink，这里不做任何格式化"""
+        if self.sinks:
+            event = ResponseEvent(dns_resp, qname, server)
+            for sink in self.sinks:
+                sink.on_response(event)
+
+    def _build_request(self, qname: str, qtype: int, transaction_id: int | None = None) -> bytes:
+        """
+        生成查询数据包
+
+        同一 (qname, qtype) 的数据包模板缓存在 LRU 中，之后只改写模板中的 transaction ID。
+        返回模板的 bytes 副本，之后的调用改写模板不会影响已经返回的数据包（例如 AsyncDNSQuery 在 await 期间持有的查询）。
+        """
+        if transaction_id is None:
+            if self.transaction_id == 0:
+                self.transaction_id = random.randint(1, 65535)
+            transaction_id = self.transaction_id
+        key = (qname, qtype)
+        template = self._templates.get(key)
+        if template is None:
+            template = _build_template(qname, qtype)
+            self._templates[key] = template
+            if len(self._templates) > self.TEMPLATE_CACHE_SIZE:
+                self._templates.popitem(last=False)
+        else:
+            self._templates.move_to_end(key)
+        _pack_u16_into(template, 0, transaction_id)
+        return bytes(template)
 
-        return parts, offset+1
+    def _parse_name(self, response: bytes, offset: int, names: dict[int, str] | None = None) -> tuple[list[bytes], int]:
+        # https://www.rfc-editor.org/rfc/rfc1035#section-4.1.4
+        name, offset = _read_name(response, offset, names)
+        return [label.encode('utf-8') for label in name.split('.')] if name else [], offset
     
-    def _parse_record(self, response: bytes, offset: int) -> tuple[DNSResourceRecord, int]:
-            # 解析域名
-            name, offset = self._parse_name(response, offset)
-            record_name = '.'.join(map(lambda x: x.decode('utf-8'), name))
-            # 解析类型和类
-            record_type, record_class = struct.unpack('>HH', response[offset:offset+4])
-            offset += 4
-            # 解析ttl和数据长度
-            record_ttl, size = struct.unpack('>LH', response[offset:offset+6])
-            offset += 6
-            # 解析数据
-            record_data = response[offset:offset+size]
-            offset += size
-
-            if record_type == RecordType.A:
-                record = DNSRecordTypeA(record_name, record_type, record_class, record_ttl, record_data)
-            elif record_type == RecordType.AAAA:
-                record = DNSRecordTypeAAAA(record_name, record_type, record_class, record_ttl, record_data)
-            elif record_type == RecordType.CNAME:
-                record = DNSRecordTypeCNAME(record_name, record_type, record_class, record_ttl, record_data, response)
-            elif record_type == RecordType.TXT:
-                record = DNSRecordTypeTXT(record_name, record_type, record_class, record_ttl, record_data)
-            elif record_type == RecordType.HTTPS:
-                record = DNSRecordTypeHTTPS(record_name, record_type, record_class, record_ttl, record_data, response)
-            elif record_type == RecordType.NS:
-                record = DNSRecordTypeNS(record_name, record_type, record_class, record_ttl, record_data, response)
-            elif record_type == RecordType.MX:
-                record = DNSRecordTypeMX(record_name, record_type, record_class, record_ttl, record_data, response)
-            elif record_type == RecordType.SOA:
-                record = DNSRecordTypeSOA(record_name, record_type, record_class, record_ttl, record_data, response)
-            else:
-                record = DNSResourceRecord(record_name, record_type, record_class, record_ttl, record_data)
-            
-            return record, offset
+    def _parse_record(self, response: bytes, offset: int, names: dict[int, str] | None = None) -> tuple[DNSResourceRecord, int]:
+        return _parse_record(response, offset, names)
 
     def _parse_response(self, response: bytes) -> DNSResponse:
+        # 字段用预编译的 Struct.unpack_from 直接从原始数据包读取，不做切片
         dns = DNSResponse()
-        dns.id = struct.unpack('>H', response[:2])[0]
-        dns.flags = struct.unpack('>H', response[2:4])[0]
-        dns.questions = struct.unpack('>H', response[4:6])[0]
-        dns.answer_n = struct.unpack('>H', response[6:8])[0]
-        dns.authority_n = struct.unpack('>H', response[8:10])[0]
-        dns.additional_n = struct.unpack('>H', response[10:12])[0]
+        dns._names = {}
+        (dns.id, dns.flags, dns.questions,
+         dns.answer_n, dns.authority_n, dns.additional_n) = _unpack_header(response, 0)
 
         # Queries
         offset = 12
-        for _ in range(dns.questions):
-            nlen = response[offset]
-            while nlen != 0:
-                offset += nlen + 1
-                nlen = response[offset]
+        for i in range(dns.questions):
+            if i == 0:
+                # 记录第一个 question，用于将响应与查询对应起来
+                dns.qname, offset = _read_name(response, offset, dns._names, errors='replace')
+                dns.qtype, dns.qclass = _unpack_question(response, offset)
+                offset += 4
+                continue
+            offset = _skip_name(response, offset)
             # skip Type and Class
-            offset += 1 + 4
+            offset += 4
 
-        # print('answer length', answer_n, 'offset', offset,':',' '.join(['{:02x}'.format(b) for b in response[offset:]]))
-        for _ in range(dns.answer_n):
-            record, offset = self._parse_record(response, offset)
-            dns.answer_RRs.append(record)
-        
+        # answer/authority/additional 在第一次访问时才解析
         # test: dns-observe -s a.gtld-servers.net example.com
-        for _ in range(dns.authority_n):
-            record, offset = self._parse_record(response, offset)
-            dns.authority_RRs.append(record)
-
-        for _ in range(dns.additional_n):
-            record, offset = self._parse_record(response, offset)
-            dns.additional_RRs.append(record)
-
+        dns._response = response
+        dns._offsets = [offset, None, None]
+        dns._sections = [None, None, None]
         return dns
     
     def close(self):
-        self.sock.close()
+        if self.sock is not None:
+            self.sock.close()
+        if self._owns_tcp_pool and self._tcp_pool is not None:
+            self._tcp_pool.close()
+        if self._owns_tls_pool and self._tls_pool is not None:
+            self._tls_pool.close()
 
     def __enter__(self):
         return self
@@ -258,36 +703,154 @@ class DNSQuery:
     def __exit__(self, exc_type, exc_value, traceback):
         self.close()
     
+    def _server_view(self, server: str) -> str:
+        return f"{server}:{self.port}" if self.port != 53 else server
+
     @property
     def server_view(self) -> str:
-        return f"{self.server}:{self.port}" if self.port != 53 else self.server
+        return self._server_view(self.server)
 
     def __str__(self):
-        return f"DNSQuery(server={self.server_view}, duration={self.wait_time}s, id={self.transaction_id}, msg=[{len(self.stdout_msg)} messages])"
+        return f"DNSQuery(server={self.server_view}, duration={self.wait_time}s, id={self.transaction_id}, sinks={len(self.sinks)})"
 
     def __repr__(self):
         return f"DNSQuery(server={self.server_view!r}, id={self.transaction_id!r})"
 
+_SECTION_NAMES = ('answer', 'authority', 'additional')
+
 class DNSResponse:
     def __init__(self):
         self.id = None
         self.flags = None
         self.questions:int    = None
+        self.qname:str        = ''
+        self.qtype:int        = None
+        self.qclass:int       = None
         self.answer_n:int     = None
         self.authority_n:int  = None
         self.additional_n:int = None
-        self.answer_RRs:list[DNSResourceRecord]     = []
-        self.authority_RRs:list[DNSResourceRecord]  = []
-        self.additional_RRs:list[DNSResourceRecord] = []
+        self.rtt: float | None = None  # 从发出查询到收到该响应的时间（秒）
+        self.timestamp: float = time.time()  # 到达时间（Unix 时间戳）
+        self.address: tuple | None = None    # 来源地址
+        self.verdict: str | None = None      # 判定结果 'fake' / 'real' / 'malformed'，见 classify()
+        self.transport: str = 'udp'          # 收到该响应的传输协议 'udp' / 'tcp' / 'tls'
+        self._response: bytes | None = None               # 原始数据包
+        self._offsets: list[int | None] = [None, None, None]  # 各 section 在数据包中的起始位置
+        self._names: dict[int, str] = {}         # 本数据包的域名解码缓存
+        self._sections: list[list[DNSResourceRecord] | None] = [[], [], []]
+        self._tracer: Tracer | None = None       # 设置后每个 section 的解析记录为一个 decode span
+
+    def _section(self, index: int) -> list[DNSResourceRecord]:
+        """第一次访问时解析 answer(0)/authority(1)/additional(2) section"""
+        records = self._sections[index]
+        if records is None:
+            tracer = self._tracer
+            if tracer is None:
+                return self._decode_section(index)
+            tracer.span_start('decode', 'packet', time.perf_counter_ns(), {'section': _SECTION_NAMES[index]})
+            try:
+                return self._decode_section(index)
+            finally:
+                tracer.span_end('decode', 'packet', time.perf_counter_ns())
+        return records
+
+    def _decode_section(self, index: int) -> list[DNSResourceRecord]:
+        counts = (self.answer_n, self.authority_n, self.additional_n)
+        offset = self._offsets[index]
+        if offset is None:
+            # 前面的 section 尚未解析，只跳过其中的记录而不解码
+            offset = self._offsets[0]
+            for i in range(index):
+                if self._offsets[i+1] is None:
+                    self._offsets[i+1] = _skip_records(self._response, self._offsets[i], counts[i])
+                offset = self._offsets[i+1]
+        records = []
+        for _ in range(counts[index]):
+            record, offset = _parse_record(self._response, offset, self._names)
+            records.append(record)
+        if index < 2:
+            self._offsets[index+1] = offset
+        self._sections[index] = records
+        return records
+
+    @property
+    def answer_RRs(self) -> list[DNSResourceRecord]:
+        return self._section(0)
+
+    @answer_RRs.setter
+    def answer_RRs(self, records: list[DNSResourceRecord]):
+        self._sections[0] = records
+
+    @property
+    def authority_RRs(self) -> list[DNSResourceRecord]:
+        return self._section(1)
+
+    @authority_RRs.setter
+    def authority_RRs(self, records: list[DNSResourceRecord]):
+        self._sections[1] = records
+
+    @property
+    def additional_RRs(self) -> list[DNSResourceRecord]:
+        return self._section(2)
+
+    @additional_RRs.setter
+    def additional_RRs(self, records: list[DNSResourceRecord]):
+        self._sections[2] = records
 
     @property
     def rcode(self) -> int:
         return self.flags & 0b1111
 
+    def detach(self) -> DNSResponse:
+        """
+        返回不引用接收缓冲区的响应
+
+        原始数据包是 arena 中的 memoryview 时复制为 bytes，记录区在副本上重新延迟解析；已经是 bytes 时返回自身。
+        """
+        if self._response is None or type(self._response) is bytes:
+            return self
+        copy = DNSResponse.__new__(DNSResponse)
+        copy.__dict__.update(self.__dict__)
+        copy._response = bytes(self._response)
+        copy._offsets = [self._offsets[0], None, None]
+        copy._sections = [None, None, None]
+        copy._names = dict(self._names)
+        copy._tracer = None   # 副本可能比追踪存活得更久
+        return copy
+
+    @property
+    def truncated(self) -> bool:
+        """TC 位：响应超出 UDP 长度被截断，需要通过 TCP 重新查询"""
+        return bool(self.flags & 0x0200)
+
     @property
     def reply(self) -> str:
         return REPLY_CODE.get(self.rcode, 'Unassigned')
 
+    def classify(self, index: PoisonIndex) -> str | None:
+        """
+        按污染地址索引判定真假，结果同时保存在 verdict 中
+
+        任一 A/AAAA 答案命中索引为 'fake'；有 A/AAAA 答案且都未命中为 'real'；
+        答案区无法解析，或者地址长度不是 4/16 字节时为 'malformed'；
+        没有地址答案（例如 NXDOMAIN、CNAME 之外无记录）时无法判定，返回 None。
+        """
+        verdict = None
+        try:
+            for record in self.answer_RRs:
+                if record.type == RecordType.A or record.type == RecordType.AAAA:
+                    if len(record.data) != (4 if record.type == RecordType.A else 16):
+                        verdict = 'malformed'
+                    elif index.match(record.data) is not None:
+                        verdict = 'fake'
+                        break
+                    elif verdict is None:
+                        verdict = 'real'
+        except (IndexError, struct.error, ValueError):
+            verdict = 'malformed'
+        self.verdict = verdict
+        return verdict
+
     def __str__(self):
         return f"DNSResponse(id=0x{self.id:04x}, reply='{self.reply}({self.rcode})', questions={self.questions}, answers={self.answer_n}, authoritative={self.authority_n}, additional={self.additional_n})"
 
@@ -300,15 +863,49 @@ class DNSResourceRecord:
         self.type: int = type_
         self.class_: int = class_
         self.ttl: int = ttl
-        self.data: bytes = data
+        self._data: bytes | memoryview | None = data
+        self._response: bytes | None = None  # 所在的完整数据包
+        self._offset: int | None = None      # RDATA 在数据包中的位置
+        self._size: int = len(data)
+        self._names: dict[int, str] | None = None  # 所在数据包共享的域名缓存
+
+    @classmethod
+    def from_wire(cls, response: bytes, offset: int, size: int, name: str, type_: int, class_: int, ttl: int,
+                  names: dict[int, str] | None = None) -> DNSResourceRecord:
+        """
+        从数据包构造记录，RDATA 只记录位置，访问 data 时才创建指向原始数据包的 memoryview，
+        类型相关的字段也在第一次访问时才解析
+        """
+        record = cls.__new__(cls)
+        record.name = name
+        record.type = type_
+        record.class_ = class_
+        record.ttl = ttl
+        record._data = None
+        record._response = response
+        record._offset = offset
+        record._size = size
+        record._names = names
+        return record
+
+    @property
+    def data(self) -> bytes | memoryview:
+        if self._data is None:
+            self._data = memoryview(self._response)[self._offset:self._offset+self._size]
+        return self._data
    
     @property
     def type_name(self) -> str:
-        return QTYPE_NAME.get(self.type, f'TYPE{self.type}')
+        return RECORD_TYPE_NAME.get(self.type, f'TYPE{self.type}')
     
     @property
     def data_length(self) -> int:
-        return len(self.data)
+        return self._size
+
+    @property
+    def data_bytes(self) -> bytes:
+        """复制出独立的 bytes，不再引用原始数据包"""
+        return bytes(self.data)
 
     @property
     def ttl_view(self) -> str:
@@ -340,7 +937,25 @@ class DNSResourceRecord:
 
     def __repr__(self):
         return f"Answer(name={self.name!r}, type={self.type_name!r})"
+
+    def _read_name(self, skip: int = 0) -> tuple[str, int]:
+        """
+        读取 RDATA 中第 skip 个字节开始的域名，返回 (域名, 占用的字节数)
+
+        直接构造的记录不知道 RDATA 在数据包中的位置，退回到 decompression_message 在 data 上解析。
+        """
+        if self._offset is None:
+            return decompression_message(self._response, self.data[skip:], self._names)
+        name, end = _read_name(self._response, self._offset + skip, self._names)
+        return name, end - self._offset - skip
+
+    def _unpack(self, unpack_from, skip: int = 0) -> tuple:
+        """用预编译的 Struct 从 RDATA 第 skip 个字节开始读取定长字段"""
+        if self._offset is None:
+            return unpack_from(self._data, skip)
+        return unpack_from(self._response, self._offset + skip)
     
+@register_record_type(RecordType.A)
 class DNSRecordTypeA(DNSResourceRecord):
     @property
     def A(self) -> str:
@@ -350,6 +965,7 @@ class DNSRecordTypeA(DNSResourceRecord):
     def data_view(self) -> str:
         return self.A
 
+@register_record_type(RecordType.AAAA)
 class DNSRecordTypeAAAA(DNSResourceRecord):
     @property
     def AAAA(self) -> str:
@@ -359,25 +975,32 @@ class DNSRecordTypeAAAA(DNSResourceRecord):
     def data_view(self) -> str:
         return self.AAAA
 
+@register_record_type(RecordType.CNAME)
 class DNSRecordTypeCNAME(DNSResourceRecord):
     def __init__(self, name: str, type_: int, class_: int, ttl: int, data: bytes, response: bytes):
         super().__init__(name, type_, class_, ttl, data)
-        self.CNAME,_ = decompression_message(response, self.data)
+        self._response = response
+
+    @cached_property
+    def CNAME(self) -> str:
+        return self._read_name()[0]
 
     @property
     def data_view(self) -> str:
         return self.CNAME
 
+@register_record_type(RecordType.TXT)
 class DNSRecordTypeTXT(DNSResourceRecord):
     @property
     def TXT(self) -> str:
         length = self.data[0]
-        return self.data[1:1+length].decode('utf-8')
+        return str(self.data[1:1+length], 'utf-8')
     
     @property
     def data_view(self) -> str:
         return self.TXT
 
+@register_record_type(RecordType.HTTPS)
 class DNSRecordTypeHTTPS(DNSResourceRecord):
     """HTTPS SVCB记录解析 (RFC 9460)"""
 
@@ -397,19 +1020,31 @@ class DNSRecordTypeHTTPS(DNSResourceRecord):
     def __init__(self, name: str, type_: int, class_: int, ttl: int, data: bytes, response: bytes):
         super().__init__(name, type_, class_, ttl, data)
         self._response = response
-        offset = 0
-        self.priority: int = struct.unpack('>H', data[offset:offset+2])[0]
-        offset += 2
-        self.target, self.target_len = decompression_message(response, data[offset:])
-        offset += self.target_len
-        self.params: dict[str, str] = self._parse_svc_params(data[offset:])
-
-    def _parse_svc_params(self, data: bytes) -> dict[str, str]:
+
+    @cached_property
+    def priority(self) -> int:
+        return self._unpack(_unpack_u16)[0]
+
+    @cached_property
+    def _target(self) -> tuple[str, int]:
+        return self._read_name(2)
+
+    @property
+    def target(self) -> str:
+        return self._target[0]
+
+    @property
+    def target_len(self) -> int:
+        return self._target[1]
+
+    @cached_property
+    def params(self) -> dict[str, str]:
+        return self._parse_svc_params(self.data, 2 + self.target_len)
+
+    def _parse_svc_params(self, data: memoryview, offset: int = 0) -> dict[str, str]:
         params = {}
-        offset = 0
         while offset + 4 <= len(data):
-            key = struct.unpack('>H', data[offset:offset+2])[0]
-            length = struct.unpack('>H', data[offset+2:offset+4])[0]
+            key, length = _unpack_u16_pair(data, offset)
             offset += 4
             if offset + length > len(data):
                 break
@@ -419,7 +1054,7 @@ class DNSRecordTypeHTTPS(DNSResourceRecord):
             params[param_name] = self._format_param_value(param_name, value)
         return params
 
-    def _format_param_value(self, name: str, value: bytes) -> str:
+    def _format_param_value(self, name: str, value: memoryview) -> str:
         if name == 'alpn':
             alpns = []
             offset = 0
@@ -427,11 +1062,11 @@ class DNSRecordTypeHTTPS(DNSResourceRecord):
                 length = value[offset]
                 offset += 1
                 if offset + length <= len(value):
-                    alpns.append(value[offset:offset+length].decode('utf-8'))
+                    alpns.append(str(value[offset:offset+length], 'utf-8'))
                     offset += length
             return ','.join(alpns)
         elif name == 'port':
-            return str(struct.unpack('>H', value)[0])
+            return str(_unpack_u16(value)[0])
         elif name == 'ipv4hint':
             ips = [socket.inet_ntop(socket.AF_INET, value[i:i+4]) for i in range(0, len(value), 4)]
             return ','.join(ips)
@@ -439,7 +1074,7 @@ class DNSRecordTypeHTTPS(DNSResourceRecord):
             ips = [socket.inet_ntop(socket.AF_INET6, value[i:i+16]) for i in range(0, len(value), 16)]
             return ','.join(ips)
         elif name in ('dohpath', 'mandatory'):
-            return value.decode('utf-8', errors='replace')
+            return str(value, 'utf-8', errors='replace')
         elif name == 'no-default-alpn':
             return ''
         else:
@@ -455,85 +1090,221 @@ class DNSRecordTypeHTTPS(DNSResourceRecord):
             parts.append(f'{k}={v}' if v else k)
         return ' '.join(parts)
 
+@register_record_type(RecordType.NS)
 class DNSRecordTypeNS(DNSResourceRecord):
     def __init__(self, name: str, type_: int, class_: int, ttl: int, data: bytes, response: bytes):
         super().__init__(name, type_, class_, ttl, data)
-        self.NS, _ = decompression_message(response, self.data)
+        self._response = response
+
+    @cached_property
+    def NS(self) -> str:
+        return self._read_name()[0]
 
     @property
     def data_view(self) -> str:
         return self.NS
 
+@register_record_type(RecordType.MX)
 class DNSRecordTypeMX(DNSResourceRecord):
     def __init__(self, name: str, type_: int, class_: int, ttl: int, data: bytes, response: bytes):
         super().__init__(name, type_, class_, ttl, data)
-        self.PRIORITY:int = struct.unpack('>H', data[:2])[0]
-        self.MAIL_EXCHANGE, _ = decompression_message(response, data[2:])
+        self._response = response
+
+    @cached_property
+    def PRIORITY(self) -> int:
+        return self._unpack(_unpack_u16)[0]
+
+    @cached_property
+    def MAIL_EXCHANGE(self) -> str:
+        return self._read_name(2)[0]
 
     @property
     def data_view(self) -> str:
         mx = self.MAIL_EXCHANGE if self.MAIL_EXCHANGE else '<Root>'
         return f'({self.PRIORITY}) {mx}'
 
+@register_record_type(RecordType.SOA)
 class DNSRecordTypeSOA(DNSResourceRecord):
     def __init__(self, name: str, type_: int, class_: int, ttl: int, data: bytes, response: bytes):
         super().__init__(name, type_, class_, ttl, data)
+        self._response = response
+
+    @cached_property
+    def _fields(self) -> tuple[str, str, int, int, int, int, int]:
         # SOA 记录格式: MNAME(域名) + RNAME(域名) + SERIAL + REFRESH + RETRY + EXPIRE + MINIMUM
-        offset = 0
+        skip = 0
 
         # 解析 MNAME (主DNS服务器)
-        self.MNAME, mname_len = decompression_message(response, data[offset:])
-        offset += mname_len
+        mname, mname_len = self._read_name(skip)
+        skip += mname_len
 
         # 解析 RNAME (管理员邮箱)
-        self.RNAME, rname_len = decompression_message(response, data[offset:])
-        offset += rname_len  
+        rname, rname_len = self._read_name(skip)
+        skip += rname_len  
 
-        # 解析 5个32位整数
-        self.SERIAL: int = struct.unpack('>I', data[offset:offset+4])[0]
-        offset += 4
-        self.REFRESH: int = struct.unpack('>I', data[offset:offset+4])[0]
-        offset += 4
-        self.RETRY: int = struct.unpack('>I', data[offset:offset+4])[0]
-        offset += 4
-        self.EXPIRE: int = struct.unpack('>I', data[offset:offset+4])[0]
-        offset += 4
-        self.MINIMUM: int = struct.unpack('>I', data[offset:offset+4])[0]
+        # 一次解析 5个32位整数
+        return (mname, rname) + self._unpack(_unpack_soa_timers, skip)
+
+    @property
+    def MNAME(self) -> str:
+        return self._fields[0]
+
+    @property
+    def RNAME(self) -> str:
+        return self._fields[1]
+
+    @property
+    def SERIAL(self) -> int:
+        return self._fields[2]
+
+    @property
+    def REFRESH(self) -> int:
+        return self._fields[3]
+
+    @property
+    def RETRY(self) -> int:
+        return self._fields[4]
+
+    @property
+    def EXPIRE(self) -> int:
+        return self._fields[5]
+
+    @property
+    def MINIMUM(self) -> int:
+        return self._fields[6]
 
     @property
     def data_view(self) -> str:
         return f"{self.MNAME} {self.RNAME} {self.SERIAL} {self.REFRESH} {self.RETRY} {self.EXPIRE} {self.MINIMUM}"
 
-def decompression_message(buff: bytes, data: bytes) -> tuple[str, int]:
-    parts = []
-    _data = data
-    _offset = 0
-    nlen = _data[_offset]
-    skip = 0
-    jump = 0
+# 预编译的定长字段
+_HEADER = struct.Struct('>HHHHHH')
+_QUESTION = struct.Struct('>HH')
+_pack_header = _HEADER.pack
+_pack_question = _QUESTION.pack
+_pack_u8 = struct.Struct('>B').pack
+_pack_u16_into = struct.Struct('>H').pack_into
+_unpack_header = _HEADER.unpack_from
+_unpack_question = _QUESTION.unpack_from
+_unpack_rr_fixed = struct.Struct('>HHLH').unpack_from
+_unpack_soa_timers = struct.Struct('>IIIII').unpack_from
+_unpack_u16 = struct.Struct('>H').unpack_from
+_unpack_u16_pair = _unpack_question
+
+def _encode_labels(qname: str) -> list[bytes]:
+    """把域名拆分为标签，非 ASCII 标签按 IDNA 编码为 xn-- 形式"""
+    qname = qname.rstrip('.')
+    if not qname:
+        return []
+    return [label.encode('ascii') if label.isascii() else label.encode('idna')
+            for label in qname.split('.')]
+
+def _idna_name(qname: str) -> str:
+    """域名在数据包中的 ASCII 形式，例如 '例子.com' -> 'xn--fsqu00a.com'"""
+    return '.'.join(str(label, 'ascii') for label in _encode_labels(qname))
+
+def _build_template(qname: str, qtype: int) -> bytearray:
+    """生成 transaction ID 为 0 的查询数据包"""
+    labels = _encode_labels(qname)
+    qdata = b''.join([_pack_u8(len(label)) + label for label in labels])
+    return bytearray(_pack_header(0, 0x0100, 1, 0, 0, 0) + qdata + b'\x00' + _pack_question(qtype, 1))
+
+# 防止伪造数据包中的压缩指针形成环
+_MAX_POINTERS = 64
+
+def _read_name(buff: bytes, offset: int, names: dict[int, str] | None = None, errors: str = 'strict', _jumps: int = 0) -> tuple[str, int]:
+    """
+    从 buff 的 offset 处读取一个（可能被压缩的）域名
+
+    names 是同一数据包共享的 指针目标偏移量 -> 后缀域名 缓存，
+    同一个被压缩的后缀在一个数据包中只解码一次。
+
+    Returns:
+        - tuple[str, int]: 域名，以及域名在原位置之后的偏移量
+    """
+    # https://www.rfc-editor.org/rfc/rfc1035#section-4.1.4
+    labels = []
+    nlen = buff[offset]
     while nlen != 0:
         if nlen & 0b11000000 == 0b11000000:
-            # buff
-            (message_compression,) = struct.unpack('>H', _data[_offset: _offset+2])
-            _offset =  message_compression & 0b11111111111111
-            _data = buff
-            nlen = _data[_offset]
-            jump += 1
-
-        # 如果经过压缩指针，此时_data和_offset已经指向了新的位置
-        parts.append(_data[_offset+1:_offset+nlen+1])
+            target = _unpack_u16(buff, offset)[0] & 0b11111111111111
+            suffix = names.get(target) if names is not None else None
+            if suffix is None:
+                if _jumps >= _MAX_POINTERS:
+                    raise IndexError('DNS name compression pointer loop')
+                suffix, _ = _read_name(buff, target, names, errors, _jumps + 1)
+                if names is not None:
+                    names[target] = suffix
+            if suffix:
+                labels.append(suffix)
+            return '.'.join(labels), offset + 2
+        labels.append(str(buff[offset+1:offset+nlen+1], 'utf-8', errors))
+        offset += nlen + 1
+        nlen = buff[offset]
+    return '.'.join(labels), offset + 1
+
+def _skip_name(buff: bytes, offset: int) -> int:
+    """跳过 offset 处的域名而不解码，返回其后的偏移量"""
+    nlen = buff[offset]
+    while nlen != 0:
+        if nlen & 0b11000000 == 0b11000000:
+            return offset + 2
+        offset += nlen + 1
+        nlen = buff[offset]
+    return offset + 1
+
+def _parse_record(response: bytes, offset: int, names: dict[int, str] | None = None) -> tuple[DNSResourceRecord, int]:
+    """解析 offset 处的一条资源记录，返回 (记录, 下一条记录的偏移量)"""
+    # 解析域名
+    record_name, offset = _read_name(response, offset, names)
+    # 一次解析类型、类、ttl 和数据长度
+    record_type, record_class, record_ttl, size = _unpack_rr_fixed(response, offset)
+    offset += 10
+    # 数据不复制，只记录其在数据包中的位置
+    data_offset = offset
+    offset += size
+    if offset > len(response):
+        raise IndexError('DNS record data out of range')
+
+    cls = RECORD_DECODERS.get(record_type, DNSResourceRecord)
+    record = cls.from_wire(response, data_offset, size, record_name, record_type, record_class, record_ttl, names)
+
+    return record, offset
+
+def _skip_records(response: bytes, offset: int, count: int) -> int:
+    """跳过 count 条资源记录而不解码，返回其后的偏移量"""
+    for _ in range(count):
+        offset = _skip_name(response, offset) + 10
+        offset += _unpack_u16(response, offset - 2)[0]
+    if offset > len(response):
+        raise IndexError('DNS record data out of range')
+    return offset
+
+def decompression_message(buff: bytes, data: bytes, names: dict[int, str] | None = None) -> tuple[str, int]:
+    """
+    解析 data 开头的域名，压缩指针指向完整报文 buff
 
-        if jump == 0:  # 没有经过压缩指针的部分
-            skip += nlen + 1
-        if jump == 1:  # 第一次遇到指针，且只增加一次指针的长度。
-            skip += 1  # 指针长度为2，只增加1是因为，函数末尾还会加1
-            jump += 1  # 既然已经经过指针，skip 长度将不再增加。
+    names 为可选的 buff 域名缓存（见 _read_name），指针指向的后缀只解码一次。
 
-        # 读取下一个标签做准备
-        _offset += nlen + 1
-        nlen = _data[_offset]
+    Returns:
+        - tuple[str, int]: 域名，以及域名在 data 中占用的字节数
+    """
+    data = memoryview(data)
+    parts = []
+    offset = 0
+    nlen = data[offset]
+    while nlen != 0:
+        if nlen & 0b11000000 == 0b11000000:
+            # 之后的标签都在 buff 中，data 内只占用 2 字节的指针
+            suffix, _ = _read_name(buff, _unpack_u16(data, offset)[0] & 0b11111111111111, names)
+            if suffix:
+                parts.append(suffix)
+            return '.'.join(parts), offset + 2
+        parts.append(str(data[offset+1:offset+nlen+1], 'utf-8'))
+        offset += nlen + 1
+        nlen = data[offset]
 
-    return '.'.join(map(lambda x: x.decode('utf-8'), parts)), skip+1
+    return '.'.join(parts), offset + 1
 
 class UnsupportTypeError(Exception):
     def __init__(self, message: str):
@@ -570,29 +1341,148 @@ def port_type(value: str) -> int:
         raise argparse.ArgumentTypeError(f"port must be 1-65535, got {value}")
     return ivalue
 
+def read_domains(path: str) -> list[str]:
+    """
+    读取域名列表文件，每行一个域名，忽略空行和 # 开头的注释
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = (line.split('#', 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
 def main():
+    if sys.argv[1:2] == ['analyze']:
+        # dns-observe analyze capture.pcap：离线分析抓包文件
+        from .analyze import main as analyze_main
+        return analyze_main(sys.argv[2:])
+    if sys.argv[1:2] == ['history']:
+        # dns-observe history obs.db twitter.com：查询 --db 保存的观测数据
+        from .store import main as history_main
+        return history_main(sys.argv[2:])
+    if sys.argv[1:2] == ['monitor']:
+        # dns-observe monitor watchlist.txt：按间隔持续探测监控列表
+        from .monitor import main as monitor_main
+        return monitor_main(sys.argv[2:])
     parser = argparse.ArgumentParser(
         description='Observing DNS pollution',
+        epilog='run `dns-observe analyze -h` to re-analyze pcap/pcapng captures, `dns-observe monitor -h` to probe a watch list continuously, '
+               '`dns-observe history -h` to query observations saved with --db',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
         )
-    parser.add_argument('domain', help='query domain')
-    parser.add_argument('-s','--dns_server', default='1.1.1.1', help='DNS server')
+    parser.add_argument('domain', nargs='?', help='query domain')
+    parser.add_argument('-i','--input', metavar='FILE', help='file with one domain per line, queried in bulk over a single socket')
+    parser.add_argument('-s','--dns_server', action='append', help='DNS server, repeat or separate with commas to query several servers at once (default: 1.1.1.1)')
     parser.add_argument('-p','--port', type=port_type, default=53, help='DNS server port')
     parser.add_argument('-q', '--query_type', type=str.upper, default='A', choices=QTYPE.keys(), help="DNS record type")
     parser.add_argument('-t','--wait_time', type=float, default=5, help='socket reception duration in seconds')
     parser.add_argument('-id','--transaction_id', type=transaction_id_type, default=0, help='DNS transaction ID (0=random, 1-65535=fixed),\
                         can use in wireshark display filter like `dns.id == 0x123` to track queries')
+    parser.add_argument('--tcp', action='store_true', help='query over TCP instead of UDP, injected replies cannot reach a TCP answer')
+    parser.add_argument('--tls', action='store_true', help='query over DNS over TLS, on port 853 unless -p is given')
+    parser.add_argument('-w', '--workers', type=int, metavar='N', help='with --input, shard the domains across N processes')
+    parser.add_argument('-f', '--format', choices=('text', 'jsonl', 'csv'), default='text',
+                        help='output format, jsonl and csv write one row per resource record to stdout')
+    parser.add_argument('--poison', metavar='FILE', help='file of known forged IPs/CIDRs, one per line, used to label responses fake or real')
+    parser.add_argument('--pcap', metavar='FILE', help='write every sent query and received datagram to a pcap file')
+    parser.add_argument('--db', metavar='FILE', help='append the responses to a SQLite observation database')
+    parser.add_argument('--trace', metavar='FILE', help='write send/wait/recv/parse/decode/output spans as Chrome trace-event JSON')
     parser.add_argument('-v', '--version', action='version', version=f'version: {__version__}')
     args = parser.parse_args()
-    dns = DNSQuery(server=args.dns_server, port=args.port, wait_time=args.wait_time, transaction_id=args.transaction_id)  # 设置 DNS 服务器 IP及持续监听时间
+    if args.domain is None and args.input is None:
+        parser.error('a domain or --input FILE is required')
+    servers = [server for value in args.dns_server or ['1.1.1.1'] for server in value.split(',') if server]
+    if len(servers) > 1 and args.input is not None:
+        parser.error('--input supports a single DNS server')
+    if args.tcp and args.tls:
+        parser.error('--tcp and --tls are mutually exclusive')
+    if (args.tcp or args.tls) and (len(servers) > 1 or args.workers is not None):
+        parser.error('--tcp and --tls support a single DNS server without --workers')
+    if args.workers is not None:
+        if args.input is None or args.workers < 1:
+            parser.error('--workers needs --input and N >= 1')
+        if args.pcap or args.trace:
+            parser.error('--workers cannot be combined with --pcap or --trace')
+    capture = PcapWriter(args.pcap) if args.pcap else None
+    poison = PoisonIndex.load(args.poison) if args.poison else None
+    if args.trace:
+        from .tracing import ChromeTraceExporter
+        tracer = ChromeTraceExporter(args.trace)
+    else:
+        tracer = None
+    dns = DNSQuery(server=servers[0], port=args.port, wait_time=args.wait_time, transaction_id=args.transaction_id,
+                   capture=capture, poison=poison, tracer=tracer, tls_port=args.port if args.port != 53 else 853)  # 设置 DNS 服务器 IP及持续监听时间
+    try:
+        results = _run_cli(dns, args, servers)
+        if args.db:
+            from .store import ObservationStore
+            with ObservationStore(args.db) as store:
+                for key, responses in results.items():
+                    if len(servers) > 1:
+                        store.add(responses, qname=args.domain, server=key)
+                    else:
+                        store.add(responses, qname=key)
+    finally:
+        if capture is not None:
+            capture.close()
+        if tracer is not None:
+            tracer.close()
+        dns.close()
+
+def _run_cli(dns: DNSQuery, args: argparse.Namespace, servers: list[str]) -> dict[str, ResponseList]:
+    """按命令行参数执行查询并输出，返回 域名（多个服务器时为服务器） -> 响应列表"""
+    qtype = query_type(args.query_type)
+    if args.workers is not None:
+        return _run_sharded(dns, args, qtype)
+    # --tcp/--tls：同样的查询改为通过 TCP 或 DNS over TLS 发送
+    if args.tcp:
+        query, query_many = dns.query_tcp, dns.query_many_tcp
+    elif args.tls:
+        query, query_many = dns.query_tls, dns.query_many_tls
+    else:
+        query, query_many = dns.query, dns.query_many
+    if args.format != 'text':
+        # 机器可读的输出直接写到 stdout，不显示 spinner
+        sink = dns.add_sink(JSONLinesSink() if args.format == 'jsonl' else CSVSink())
+        try:
+            if len(servers) > 1:
+                return dns.query_servers(servers, args.domain, qtype=qtype)
+            elif args.input is not None:
+                return query_many(([args.domain] if args.domain is not None else []) + read_domains(args.input), qtype=qtype)
+            else:
+                return {args.domain: query(args.domain, qtype=qtype)}
+        finally:
+            sink.close()
     from .console import Spinner
+    if len(servers) > 1:
+        with Spinner(dns, message=f'{len(servers)} servers', countdown=args.wait_time) as _:
+            return dns.query_servers(servers, args.domain, qtype=qtype)
+    if args.input is not None:
+        domains = read_domains(args.input)
+        if args.domain is not None:
+            domains.insert(0, args.domain)
+        with Spinner(dns, message=f'{len(domains)} domains') as _:
+            return query_many(domains, qtype=qtype)
     has_time_arg = '-t' in sys.argv or '--wait_time' in sys.argv # 判断是否提供了 wait_time 参数
     if has_time_arg:
         with Spinner(dns, countdown=args.wait_time) as _:     # 有倒计时
-            dns.query(args.domain, qtype=query_type(args.query_type))
+            return {args.domain: query(args.domain, qtype=qtype)}
     else:
         with Spinner(dns) as _:                                 # 无倒计时
-            dns.query(args.domain, qtype=query_type(args.query_type))
+            return {args.domain: query(args.domain, qtype=qtype)}
+
+def _run_sharded(dns: DNSQuery, args: argparse.Namespace, qtype: int) -> dict[str, ResponseList]:
+    """--workers：多进程扫描 --input 中的域名，输出在各个 worker 中格式化，按输入顺序写到 stdout"""
+    from .shard import query_sharded
+    domains = ([args.domain] if args.domain is not None else []) + read_domains(args.input)
+    if args.format != 'text':
+        if args.format == 'csv':
+            sys.stdout.write(','.join(ROW_FIELDS) + '\n')
+        results = query_sharded(dns, domains, qtype, workers=args.workers, output_format=args.format, write=sys.stdout.write)
+        sys.stdout.flush()
+        return results
+    from .console import Spinner
+    with Spinner(dns, message=f'{len(domains)} domains, {args.workers} workers') as spinner:
+        return query_sharded(dns, domains, qtype, workers=args.workers, output_format='text',
+                             write=lambda output: spinner.write(output[:-1]))
 
 def console_script():
     """CLI entry point with KeyboardInterrupt handling"""
@@ -0,0 +1,229 @@
+from __future__ import annotations
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Sequence
+import threading
+
+if TYPE_CHECKING:
+    from .poison import PoisonIndex
+    from .utils import ResponseList
+
+# 响应到达时间的桶（秒），覆盖本地注入的毫秒级到跨洲解析的数秒
+RTT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 单个数据包解析时间的桶（秒）
+PARSE_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3)
+
+
+class Counter:
+    """按标签值分组的计数器"""
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()   # 只在新增标签组合和导出时使用
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        try:
+            self._values[labels] += amount
+        except KeyError:
+            with self._lock:
+                self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _pairs(self.labelnames, labels), value) for labels, value in items]
+
+
+class Histogram:
+    """
+    固定分桶的直方图
+
+    每个标签组合保存各桶的（非累积）计数、总和与数量，observe() 只做一次二分查找和两次加法，
+    导出时才累加为 Prometheus 的累积桶。
+    """
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, list] = {}   # 标签值 -> [各桶计数..., +Inf 桶计数, 总和]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: tuple = ()):
+        try:
+            counts = self._values[labels]
+        except KeyError:
+            with self._lock:
+                counts = self._values.setdefault(labels, [0] * (len(self.buckets) + 2))
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def count(self, labels: tuple = ()) -> int:
+        counts = self._values.get(labels)
+        return sum(counts[:-1]) if counts else 0
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        with self._lock:
+            items = [(labels, list(counts)) for labels, counts in self._values.items()]
+        samples = []
+        for labels, counts in items:
+            pairs = _pairs(self.labelnames, labels)
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                samples.append((self.name + '_bucket', pairs + (('le', _format_value(bound)),), cumulative))
+            samples.append((self.name + '_sum', pairs, counts[-1]))
+            samples.append((self.name + '_count', pairs, cumulative))
+        return samples
+
+
+class Metrics:
+    """
+    dns-observe 的指标集合
+
+    DNSQuery 和 Monitor 在接收循环中更新，render() 输出 Prometheus 文本格式。
+    server 标签与 DNSQuery.server_view 相同（端口不是 53 时带上端口）。
+    """
+
+    def __init__(self, rtt_buckets: Sequence[float] = RTT_BUCKETS, parse_buckets: Sequence[float] = PARSE_BUCKETS):
+        self.probes = Counter('dns_observe_probes_total', 'Queries sent.', ('server',))
+        self.responses = Counter('dns_observe_responses_total', 'Responses received, by rcode.', ('server', 'rcode'))
+        self.forged = Counter('dns_observe_forged_responses_total', 'Responses classified as forged.', ('server',))
+        self.unanswered = Counter('dns_observe_unanswered_probes_total', 'Probes that got no response within the listening window.', ('server',))
+        self.malformed = Counter('dns_observe_malformed_packets_total', 'Datagrams that could not be parsed.', ('server',))
+        self.socket_errors = Counter('dns_observe_socket_errors_total', 'Socket errors while sending or receiving.', ('operation',))
+        self.first_rtt = Histogram('dns_observe_first_response_seconds', 'Time from query to the first response.', rtt_buckets, ('server',))
+        self.last_rtt = Histogram('dns_observe_last_response_seconds', 'Time from query to the response classified as genuine.', rtt_buckets, ('server',))
+        self.parse_time = Histogram('dns_observe_parse_seconds', 'Time to parse the header and question of one datagram.', parse_buckets)
+        self._labels: dict[tuple, str] = {}   # 地址 -> server 标签
+        self.all = [self.probes, self.responses, self.forged, self.unanswered, self.malformed, self.socket_errors,
+                    self.first_rtt, self.last_rtt, self.parse_time]
+
+    def server_label(self, address: tuple) -> str:
+        """地址对应的 server 标签，格式与 DNSQuery.server_view 相同，按地址缓存"""
+        label = self._labels.get(address)
+        if label is None:
+            label = address[0] if address[1] == 53 else f'{address[0]}:{address[1]}'
+            if len(self._labels) < 4096:
+                self._labels[address] = label
+        return label
+
+    def observe_probe(self, server: str, responses: ResponseList, poison: PoisonIndex | None = None):
+        """
+        一次查询的监听窗口结束时调用，记录首个和真实响应的 RTT 以及伪造响应数量
+
+        设置了 poison 时响应在接收时已经判定过 verdict，这里只按 verdict 计数，不再解析答案区；
+        答案区畸形的响应计入 malformed。
+        """
+        labels = (server,)
+        if not responses:
+            self.unanswered.inc(labels)
+            return
+        if responses[0].rtt is not None:
+            self.first_rtt.observe(responses[0].rtt, labels)
+        if poison is None:
+            real = responses.real()
+            forged = len(responses.fakes())
+        else:
+            real = None
+            forged = malformed = 0
+            for response in responses:
+                if response.verdict == 'fake':
+                    forged += 1
+                elif response.verdict == 'malformed':
+                    malformed += 1
+                else:
+                    real = response
+            if malformed:
+                self.malformed.inc(labels, malformed)
+        if real is not None and real.rtt is not None:
+            self.last_rtt.observe(real.rtt, labels)
+        if forged:
+            self.forged.inc(labels, forged)
+
+    def render(self) -> str:
+        """Prometheus 文本格式（version 0.0.4）"""
+        lines = []
+        for metric in self.all:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, pairs, value in metric.samples():
+                if pairs:
+                    label_text = ','.join(f'{key}="{_escape(value_)}"' for key, value_ in pairs)
+                    lines.append(f'{name}{{{label_text}}} {_format_value(value)}')
+                else:
+                    lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _pairs(labelnames: tuple, labels: tuple) -> tuple:
+    return tuple(zip(labelnames, (str(label) for label in labels)))
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsServer:
+    """
+    在后台线程中提供 /metrics 的 HTTP 服务
+
+    默认只监听本机地址；port 为 0 时由系统分配，实际端口见 self.port。
+    """
+
+    def __init__(self, metrics: Metrics, host: str = '127.0.0.1', port: int = 9153):
+        # 只有提供 HTTP 服务时才导入，import http.server 需要数十毫秒
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?', 1)[0] != '/metrics':
+                    handler.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                pass  # 不在 stderr 输出每个抓取请求
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.address = self.httpd.server_address
+        self.port = self.address[1]
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> MetricsServer:
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,339 @@
+from __future__ import annotations
+from collections import deque
+from typing import Callable, Hashable, Iterable, NamedTuple
+import argparse
+import math
+import random
+import signal
+import socket
+import sys
+import time
+from .dns import DNSQuery, RecordType, UnsupportTypeError, _idna_name, port_type, query_type
+from .metrics import Metrics, MetricsServer
+from .pcap import PcapWriter
+from .poison import PoisonIndex
+from .receiver import Datagram, DatagramReceiver
+from .sinks import CSVSink, JSONLinesSink, TextSink
+from .store import ObservationStore
+from .tracing import ChromeTraceExporter, release
+from .utils import ResponseList
+
+
+class WatchEntry(NamedTuple):
+    """监控列表中的一项：每 interval 秒查询一次 name 的 qtype 记录"""
+    name: str
+    qtype: int = RecordType.A
+    interval: float = 60.0
+
+
+def load_watchlist(path: str, interval: float = 60.0) -> list[WatchEntry]:
+    """
+    读取监控列表文件，每行 `域名 [类型] [间隔秒数]`，忽略空行和 # 之后的注释
+
+    没有写类型时为 A，没有写间隔时为 interval。同一 (域名, 类型) 出现多次时以最后一次为准。
+    """
+    entries: dict[tuple[str, int], WatchEntry] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) > 3:
+                raise ValueError(f'{path}:{number}: expected "domain [qtype] [interval]", got {line.strip()!r}')
+            qtype = query_type(fields[1].upper()) if len(fields) > 1 else RecordType.A
+            seconds = float(fields[2]) if len(fields) > 2 else interval
+            if seconds <= 0:
+                raise ValueError(f'{path}:{number}: interval must be positive, got {fields[2]}')
+            entries[(fields[0].lower(), qtype)] = WatchEntry(fields[0], qtype, seconds)
+    return list(entries.values())
+
+
+# 换算 tick 序号时容忍的浮点误差，例如 0.3 / 0.1 = 2.9999999999999996
+_EPSILON = 1e-9
+
+class TimerWheel:
+    """
+    哈希时间轮
+
+    时间按 tick 秒划分，第 n 个 tick 到期的定时器放在 n % slots 号槽中。
+    添加和取消都是 O(1)；advance() 每个 tick 只访问一个槽，槽中未到期的定时器
+    （超过一圈的长间隔）留在原处等下一圈，10 万个定时器时每个 tick 的开销只与当期到期的数量有关。
+    """
+
+    def __init__(self, tick: float = 0.1, slots: int = 4096, now: float | None = None):
+        self.tick = tick
+        self.slots: list[dict[Hashable, int]] = [{} for _ in range(slots)]  # 键 -> 到期的 tick 序号
+        self._where: dict[Hashable, int] = {}   # 键 -> 所在槽，用于 O(1) 取消
+        self._start = time.monotonic() if now is None else now
+        self._current = 0                        # 下一个要处理的 tick 序号
+
+    def schedule(self, key: Hashable, delay: float, now: float | None = None):
+        """delay 秒后到期，同一个键已存在时重新安排"""
+        self.cancel(key)
+        now = time.monotonic() if now is None else now
+        # 向上取整到 tick，保证不会早于 delay 到期；已经过去的 tick 按下一个 tick 处理
+        due = max(self._current, math.ceil((now + delay - self._start) / self.tick - _EPSILON))
+        slot = due % len(self.slots)
+        self.slots[slot][key] = due
+        self._where[key] = slot
+
+    def cancel(self, key: Hashable) -> bool:
+        slot = self._where.pop(key, None)
+        if slot is None:
+            return False
+        del self.slots[slot][key]
+        return True
+
+    def advance(self, now: float | None = None) -> list[Hashable]:
+        """处理到 now 为止的所有 tick，返回按到期顺序排列的到期键"""
+        now = time.monotonic() if now is None else now
+        last = math.floor((now - self._start) / self.tick + _EPSILON)
+        expired = []
+        size = len(self.slots)
+        # 停顿超过一圈时每个槽只需要扫描一次
+        first = max(self._current, last - size + 1)
+        while first <= last:
+            slot = self.slots[first % size]
+            if slot:
+                due = [key for key, tick in slot.items() if tick <= last]
+                for key in due:
+                    del slot[key]
+                    del self._where[key]
+                expired.extend(due)
+            first += 1
+        self._current = max(self._current, last + 1)
+        return expired
+
+    def next_tick(self) -> float:
+        """下一个 tick 开始的单调时钟时间"""
+        return self._start + self._current * self.tick
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+
+class _Probe(NamedTuple):
+    """一次已发出、还在监听窗口内的探测"""
+    entry: WatchEntry
+    key: tuple[int, str, int]   # (transaction ID, 小写的 IDNA 域名, qtype)
+    sent_time: float
+    deadline: float
+    responses: ResponseList
+
+
+class Monitor:
+    """
+    持续监控守护进程
+
+    按监控列表中每一项的间隔反复查询，所有探测共用一个 socket 和接收缓冲区。
+    到期的探测由 TimerWheel 调度，响应在到达时就交给 dns 上注册的 sink，
+    每个探测的监听窗口为 dns.wait_time，结束后调用 on_probe(entry, responses)。
+
+    reload() 替换监控列表：删除的项不再调度，新增的项立即分散安排，
+    已经发出的探测照常收完各自的监听窗口。request_reload() 之后由 loader 读取的列表出错时保留当前的列表。
+    """
+
+    def __init__(self, dns: DNSQuery, watchlist: Iterable[WatchEntry] = (), tick: float = 0.1, slots: int = 4096,
+                 on_probe: Callable[[WatchEntry, ResponseList], object] | None = None,
+                 loader: Callable[[], Iterable[WatchEntry]] | None = None):
+        self.dns = dns
+        self.on_probe = on_probe
+        self.loader = loader              # reload 时重新读取监控列表
+        self.wheel = TimerWheel(tick, slots)
+        self.entries: dict[tuple[str, int], WatchEntry] = {}
+        self.probes_sent = 0
+        self.probes_done = 0
+        self.responses = 0
+        self._inflight: dict[tuple[int, str, int], _Probe] = {}
+        # 所有探测的监听窗口相同，按发出顺序排列即按截止时间排列
+        self._expiry: deque[_Probe] = deque()
+        # 固定 transaction ID 时从该值开始依次递增，否则随机起始
+        self._next_id = dns.transaction_id or random.randint(1, 65535)
+        self._running = False
+        self._reload_requested = False
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver = DatagramReceiver(self.sock)
+        self._address = socket.getaddrinfo(dns.server, dns.port, socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+        self.reload(watchlist)
+
+    def reload(self, watchlist: Iterable[WatchEntry]):
+        """替换监控列表，不影响已发出的探测"""
+        entries = {(entry.name.lower(), entry.qtype): entry for entry in watchlist}
+        for key in self.entries.keys() - entries.keys():
+            self.wheel.cancel(key)
+        now = time.monotonic()
+        added = [key for key, entry in entries.items() if self.entries.get(key) != entry]
+        for i, key in enumerate(added):
+            # 新增或修改间隔的项在各自的间隔内均匀分散首次探测，避免同时发出
+            self.wheel.schedule(key, entries[key].interval * i / len(added), now)
+        self.entries = entries
+
+    def request_reload(self):
+        """在信号处理函数中调用，由主循环在安全的时机重新加载"""
+        self._reload_requested = True
+
+    def stop(self):
+        self._running = False
+
+    def run(self, duration: float | None = None):
+        """运行到 stop() 被调用或经过 duration 秒，退出前收完所有已发出探测的监听窗口"""
+        self._running = True
+        end = time.monotonic() + duration if duration is not None else float('inf')
+        while self._running and time.monotonic() < end:
+            if self._reload_requested:
+                self._reload_requested = False
+                if self.loader is not None:
+                    try:
+                        self.reload(self.loader())
+                    except (OSError, ValueError, UnsupportTypeError) as e:
+                        # 列表文件被删除或写错时继续使用当前的列表，修正后再次 SIGHUP 即可
+                        sys.stderr.write(f'reload failed, keeping the current watch list: {e}\n')
+            self._step(min(self.wheel.next_tick(), end))
+        self._running = False
+        while self._inflight:
+            self._step(self._expiry[0].deadline)
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _step(self, until: float):
+        """等待到 until 或数据包到达，然后处理响应、到期的监听窗口和到期的探测"""
+        if self._expiry:
+            until = min(until, self._expiry[0].deadline)
+        if self.dns._wait(self.receiver, until - time.monotonic()):
+            self._receive()
+        now = time.monotonic()
+        while self._expiry and self._expiry[0].deadline <= now:
+            self._finish(self._expiry.popleft())
+        if self._running:
+            for key in self.wheel.advance(now):
+                entry = self.entries[key]
+                self._send(entry)
+                self.wheel.schedule(key, entry.interval)
+                # 大量探测同时到期时边发边收，避免 socket 接收缓冲区溢出
+                self._receive()
+
+    def _send(self, entry: WatchEntry):
+        tid = self._next_id
+        self._next_id = tid % 65535 + 1
+        key = (tid, _idna_name(entry.name).lower(), entry.qtype)
+        if key in self._inflight:
+            return  # ID 回绕后仍在监听同一个域名，跳过本次探测
+        qdata = self.dns._build_request(entry.name, entry.qtype, tid)
+        try:
+            self.dns._send(self.receiver, qdata, self._address)
+        except OSError:
+            self.dns._socket_error('send')
+            return  # 发送缓冲区满或网络暂时不可用，等下一个间隔
+        sent_time = time.monotonic()
+        probe = _Probe(entry, key, sent_time, sent_time + self.dns.wait_time, ResponseList())
+        self._inflight[key] = probe
+        self._expiry.append(probe)
+        self.probes_sent += 1
+
+    def _receive(self):
+        for packet in self.dns._drain(self.receiver):
+            self._dispatch(packet)
+
+    def _dispatch(self, packet: Datagram):
+        # 按 (ID, question) 分发，忽略不属于任何探测的数据包
+        dns_resp = self.dns._parse_packet(packet)
+        if dns_resp is None:
+            return
+        probe = self._inflight.get((dns_resp.id, dns_resp.qname.lower(), dns_resp.qtype))
+        if probe is None:
+            return
+        dns_resp = self.dns._accept(packet, self.receiver, probe.sent_time, dns_resp)
+        probe.responses.append(dns_resp)
+        self.responses += 1
+        self.dns._emit(dns_resp, qname=probe.entry.name)
+
+    def _finish(self, probe: _Probe):
+        del self._inflight[probe.key]
+        self.probes_done += 1
+        self.dns._learn_rtt(probe.responses)
+        self.dns._observe(probe.responses, self._address)
+        if self.on_probe is not None:
+            self.on_probe(probe.entry, probe.responses)
+        if self.dns.tracer is not None:
+            release(probe.responses)
+
+    def __repr__(self):
+        return (f"Monitor(server={self.dns.server_view!r}, entries={len(self.entries)}, "
+                f"inflight={len(self._inflight)}, sent={self.probes_sent})")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog='dns-observe monitor',
+        description='Keep probing a watch list and stream every response; SIGHUP reloads the list',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('watchlist', help='file with one "domain [qtype] [interval]" per line')
+    parser.add_argument('-s', '--dns_server', default='1.1.1.1', help='DNS server')
+    parser.add_argument('-p', '--port', type=port_type, default=53, help='DNS server port')
+    parser.add_argument('-t', '--wait_time', type=float, default=5, help='listening window of each probe in seconds')
+    parser.add_argument('-i', '--interval', type=float, default=60, help='probe interval for entries that do not set one')
+    parser.add_argument('--tick', type=float, default=0.1, help='scheduler resolution in seconds')
+    parser.add_argument('-f', '--format', choices=('text', 'jsonl', 'csv'), default='text', help='output format')
+    parser.add_argument('--poison', metavar='FILE', help='file of known forged IPs/CIDRs, used to label responses fake or real')
+    parser.add_argument('--pcap', metavar='FILE', help='write every sent query and received datagram to a pcap file')
+    parser.add_argument('--db', metavar='FILE', help='append every probe to a SQLite observation database')
+    parser.add_argument('--trace', metavar='FILE', help='write send/wait/recv/parse/decode/output spans as Chrome trace-event JSON')
+    parser.add_argument('--metrics', metavar='[HOST:]PORT', help='serve Prometheus metrics on http://HOST:PORT/metrics (HOST defaults to 127.0.0.1)')
+    args = parser.parse_args(argv)
+    if hasattr(sys.stdout, 'reconfigure'):
+        # 输出通常接到管道或日志文件，每行立即写出
+        sys.stdout.reconfigure(line_buffering=True)
+
+    def loader() -> list[WatchEntry]:
+        return load_watchlist(args.watchlist, args.interval)
+
+    capture = PcapWriter(args.pcap) if args.pcap else None
+    poison = PoisonIndex.load(args.poison) if args.poison else None
+    metrics = Metrics() if args.metrics else None
+    tracer = ChromeTraceExporter(args.trace) if args.trace else None
+    dns = DNSQuery(server=args.dns_server, port=args.port, wait_time=args.wait_time, capture=capture, poison=poison,
+                   metrics=metrics, tracer=tracer)
+    if args.format == 'jsonl':
+        sink = dns.add_sink(JSONLinesSink())
+    elif args.format == 'csv':
+        sink = dns.add_sink(CSVSink())
+    else:
+        sink = dns.add_sink(TextSink(lambda line: sys.stdout.write(line + '\n')))
+    store = ObservationStore(args.db) if args.db else None
+    on_probe = (lambda entry, responses: store.add(responses, qname=entry.name)) if store is not None else None
+    monitor = Monitor(dns, loader(), tick=args.tick, on_probe=on_probe, loader=loader)
+    metrics_server = None
+    if metrics is not None:
+        host, _, port = args.metrics.rpartition(':')
+        metrics_server = MetricsServer(metrics, host or '127.0.0.1', int(port)).start()
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda signum, frame: monitor.request_reload())
+    signal.signal(signal.SIGTERM, lambda signum, frame: monitor.stop())
+    try:
+        monitor.run()
+    except KeyboardInterrupt:
+        # 第一次 Ctrl-C 停止发出新的探测，收完已发出探测的响应后退出
+        monitor.stop()
+        monitor.run(0)
+    finally:
+        monitor.close()
+        sink.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        if tracer is not None:
+            tracer.close()
+        if store is not None:
+            store.close()
+        if capture is not None:
+            capture.close()
@@ -0,0 +1,342 @@
+from __future__ import annotations
+from typing import BinaryIO, Iterator, NamedTuple
+import functools
+import mmap
+import socket
+import struct
+import threading
+
+# https://www.tcpdump.org/manpages/pcap-savefile.5.html
+PCAP_MAGIC_US = 0xa1b2c3d4   # 微秒精度时间戳
+PCAP_MAGIC_NS = 0xa1b23c4d   # 纳秒精度时间戳
+PCAPNG_MAGIC = 0x0a0d0d0a    # pcapng Section Header Block
+# https://www.tcpdump.org/linktypes.html
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101           # 数据包直接以 IPv4/IPv6 头开始，不需要伪造以太网头
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+_pcap_header = struct.Struct('<IHHiIII').pack
+_record_header = struct.Struct('<IIII').pack
+_ipv4_header = struct.Struct('!BBHHHBBH4s4s')
+_ipv6_header = struct.Struct('!IHBB16s16s').pack
+_udp_header = struct.Struct('!HHHH').pack
+
+
+class PcapWriter:
+    """
+    把 UDP 数据包写入标准 pcap 文件，可以直接用 Wireshark 打开
+
+    IP/UDP 头按数据包的地址合成，时间戳为纳秒精度。
+    写入经过缓冲，调用 flush() 或 close() 后才保证落盘。
+    """
+
+    def __init__(self, file: str | BinaryIO, snaplen: int = 65535, buffering: int = 1 << 16):
+        if isinstance(file, str):
+            self.file = open(file, 'wb', buffering=buffering)
+            self._owns_file = True
+        else:
+            self.file = file
+            self._owns_file = False
+        self.snaplen = snaplen
+        self.packets = 0
+        self._ip_id = 0
+        self._lock = threading.Lock()  # 多个线程共用一个 PcapWriter 时保证记录完整
+        self.file.write(_pcap_header(PCAP_MAGIC_NS, 2, 4, 0, 0, snaplen, LINKTYPE_RAW))
+
+    def write_udp(self, payload: bytes, src: tuple, dst: tuple, timestamp: float):
+        """
+        写入一个 UDP 数据包
+
+        Parameters:
+            - payload(bytes): UDP 载荷，即 DNS 消息
+            - src(tuple): 源地址 (host, port)，host 为 0.0.0.0 等未指定地址时按 dst 推算本机出口地址
+            - dst(tuple): 目的地址 (host, port)
+            - timestamp(float): Unix 时间戳
+        """
+        src_ip = _resolve(src[0])
+        dst_ip = _resolve(dst[0])
+        if src_ip in (_ANY4, _ANY6):
+            src_ip = _source_address(dst_ip)
+        if len(dst_ip) == 4:
+            packet = self._ipv4(payload, src_ip, src[1], dst_ip, dst[1])
+        else:
+            packet = self._ipv6(payload, src_ip, src[1], dst_ip, dst[1])
+        seconds = int(timestamp)
+        nanoseconds = int((timestamp - seconds) * 1e9)
+        caplen = min(len(packet), self.snaplen)
+        with self._lock:
+            self.file.write(_record_header(seconds, nanoseconds, caplen, len(packet)) + packet[:caplen])
+            self.packets += 1
+
+    def _ipv4(self, payload: bytes, src_ip: bytes, sport: int, dst_ip: bytes, dport: int) -> bytes:
+        self._ip_id = (self._ip_id + 1) & 0xffff
+        length = 28 + len(payload)
+        header = bytearray(_ipv4_header.pack(0x45, 0, length, self._ip_id, 0x4000, 64, socket.IPPROTO_UDP, 0, src_ip, dst_ip))
+        header[10:12] = _checksum(header).to_bytes(2, 'big')
+        # IPv4 中 UDP 校验和可以为 0（未计算）
+        return bytes(header) + _udp_header(sport, dport, 8 + len(payload), 0) + payload
+
+    def _ipv6(self, payload: bytes, src_ip: bytes, sport: int, dst_ip: bytes, dport: int) -> bytes:
+        length = 8 + len(payload)
+        # IPv6 中 UDP 校验和是必需的，按伪首部计算
+        pseudo = src_ip + dst_ip + struct.pack('!IxxxB', length, socket.IPPROTO_UDP)
+        checksum = _checksum(pseudo + _udp_header(sport, dport, length, 0) + payload) or 0xffff
+        return (_ipv6_header(6 << 28, length, socket.IPPROTO_UDP, 64, src_ip, dst_ip)
+                + _udp_header(sport, dport, length, checksum) + payload)
+
+    def flush(self):
+        with self._lock:
+            self.file.flush()
+
+    def close(self):
+        if self._owns_file:
+            self.file.close()
+        else:
+            self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+_ANY4 = bytes(4)
+_ANY6 = bytes(16)
+
+def _checksum(data: bytes) -> int:
+    """RFC 1071 互联网校验和"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+@functools.lru_cache(maxsize=256)
+def _resolve(host: str) -> bytes:
+    """把地址转换为打包的 IP，域名只解析一次"""
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            return socket.inet_pton(family, host)
+        except OSError:
+            pass
+    return socket.inet_aton(socket.gethostbyname(host))
+
+@functools.lru_cache(maxsize=256)
+def _source_address(dst_ip: bytes) -> bytes:
+    """发往 dst_ip 时内核选择的本机地址，connect UDP socket 不会发出数据包"""
+    family = socket.AF_INET if len(dst_ip) == 4 else socket.AF_INET6
+    try:
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.connect((socket.inet_ntop(family, dst_ip), 53))
+            return socket.inet_pton(family, sock.getsockname()[0])
+    except OSError:
+        return _ANY4 if family == socket.AF_INET else _ANY6
+
+
+class Frame(NamedTuple):
+    """抓包文件中的一个数据包"""
+    timestamp: float
+    linktype: int
+    data: memoryview  # 指向映射文件的视图，不复制
+
+
+class UDPDatagram(NamedTuple):
+    """从数据包中解出的 UDP 数据报"""
+    timestamp: float
+    src: tuple   # (host, port)
+    dst: tuple   # (host, port)
+    payload: memoryview
+
+
+def read_capture(path: str) -> Iterator[Frame]:
+    """
+    以内存映射方式逐个读取 pcap 或 pcapng 文件中的数据包
+
+    数据包是映射内存的视图，迭代结束后仍被引用的视图会让映射保持有效，直到它们被释放。
+    """
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # 空文件
+    view = memoryview(mapped)
+    try:
+        if len(view) >= 4 and struct.unpack_from('<I', view)[0] == PCAPNG_MAGIC:
+            yield from _read_pcapng(view)
+        else:
+            yield from _read_pcap(view)
+    finally:
+        view.release()
+        try:
+            mapped.close()
+        except BufferError:
+            pass  # 仍有数据包视图被引用，交给垃圾回收
+
+def _read_pcap(view: memoryview) -> Iterator[Frame]:
+    if len(view) < 24:
+        raise ValueError('not a pcap file')
+    for order in '<>':
+        magic = struct.unpack_from(order + 'I', view)[0]
+        if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            break
+    else:
+        raise ValueError('not a pcap or pcapng file')
+    scale = 1e-9 if magic == PCAP_MAGIC_NS else 1e-6
+    linktype = struct.unpack_from(order + 'I', view, 20)[0] & 0x0fffffff
+    unpack_record = struct.Struct(order + 'IIII').unpack_from
+    offset = 24
+    end = len(view)
+    while offset + 16 <= end:
+        seconds, fraction, caplen, _ = unpack_record(view, offset)
+        offset += 16
+        if offset + caplen > end:
+            break  # 抓包被截断
+        yield Frame(seconds + fraction * scale, linktype, view[offset:offset + caplen])
+        offset += caplen
+
+def _read_pcapng(view: memoryview) -> Iterator[Frame]:
+    # https://www.ietf.org/archive/id/draft-ietf-opsawg-pcapng-02.html
+    order = '<'
+    interfaces: list[tuple[int, float, int]] = []  # (linktype, 时间戳单位, snaplen)
+    offset = 0
+    end = len(view)
+    while offset + 12 <= end:
+        block_type = struct.unpack_from(order + 'I', view, offset)[0]
+        if block_type == PCAPNG_MAGIC:
+            # 每个 section 可以有不同的字节序，接口编号也重新开始
+            order = '<' if struct.unpack_from('<I', view, offset + 8)[0] == 0x1a2b3c4d else '>'
+            interfaces = []
+        block_len = struct.unpack_from(order + 'I', view, offset + 4)[0]
+        if block_len < 12 or offset + block_len > end:
+            break  # 抓包被截断或已损坏
+        body = offset + 8
+        if block_type == 6:  # Enhanced Packet Block
+            interface, high, low, caplen = struct.unpack_from(order + 'IIII', view, body)
+            linktype, unit, _ = interfaces[interface]
+            data = body + 20
+            yield Frame(((high << 32) | low) * unit, linktype, view[data:data + caplen])
+        elif block_type == 3:  # Simple Packet Block，没有时间戳
+            linktype, _, snaplen = interfaces[0]
+            length = struct.unpack_from(order + 'I', view, body)[0]
+            caplen = min(length, snaplen or length, block_len - 16)
+            yield Frame(0.0, linktype, view[body + 4:body + 4 + caplen])
+        elif block_type == 2:  # 已废弃的 Packet Block
+            interface, _, high, low, caplen = struct.unpack_from(order + 'HHIII', view, body)
+            linktype, unit, _ = interfaces[interface]
+            data = body + 20
+            yield Frame(((high << 32) | low) * unit, linktype, view[data:data + caplen])
+        elif block_type == 1:  # Interface Description Block
+            linktype, _, snaplen = struct.unpack_from(order + 'HHI', view, body)
+            interfaces.append((linktype, _tsresol(view, body + 8, offset + block_len - 4, order), snaplen))
+        offset += block_len
+
+def _tsresol(view: memoryview, offset: int, end: int, order: str) -> float:
+    """从 IDB 的选项中读取 if_tsresol，默认微秒"""
+    while offset + 4 <= end:
+        code, length = struct.unpack_from(order + 'HH', view, offset)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            value = view[offset + 4]
+            return 2.0 ** -(value & 0x7f) if value & 0x80 else 10.0 ** -value
+        offset += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+
+_unpack_ipv4 = struct.Struct('!BxHxxHxBxx4s4s').unpack_from   # 版本/头长度、总长度、分片、协议、源、目的
+_unpack_udp = struct.Struct('!HHH').unpack_from
+_unpack_u16_be = struct.Struct('!H').unpack_from
+_IPV6_EXTENSIONS = {0, 43, 60}  # hop-by-hop、路由、目的选项头，可以直接跳过
+_MAX_HOSTS = 1 << 16            # 地址字符串缓存的上限
+
+def iter_udp(frames: Iterator[Frame], port: int | None = 53) -> Iterator[UDPDatagram]:
+    """
+    从数据包中解出 UDP 数据报，载荷是原数据的视图
+
+    port 不为 None 时只保留源端口或目的端口为 port 的数据报。分片的 IP 数据包会被跳过。
+    """
+    inet_ntop = socket.inet_ntop
+    AF_INET, AF_INET6 = socket.AF_INET, socket.AF_INET6
+    hosts: dict[bytes, str] = {}  # 打包的地址 -> 字符串，同一个地址只转换一次
+    linktype = link_offset = None  # 除以太网外，链路层头长度只取决于 linktype
+    for timestamp, frame_linktype, data in frames:
+        if frame_linktype == LINKTYPE_ETHERNET:
+            if len(data) >= 14 and _unpack_u16_be(data, 12)[0] in (0x0800, 0x86dd):
+                offset = 14  # 最常见的情况：没有 VLAN 标签
+            else:
+                offset = _network_offset(frame_linktype, data)
+        else:
+            if frame_linktype != linktype:
+                linktype = frame_linktype
+                link_offset = _network_offset(frame_linktype, data)
+            offset = link_offset
+        if offset is None or offset >= len(data):
+            continue
+        version = data[offset] >> 4
+        if version == 4:
+            if len(data) < offset + 28:
+                continue
+            ver_ihl, total, fragment, protocol, src_ip, dst_ip = _unpack_ipv4(data, offset)
+            if protocol != 17 or fragment & 0x3fff:
+                continue  # 不是 UDP，或是 IP 分片
+            udp = offset + (ver_ihl & 0x0f) * 4
+            end = offset + total
+            family = AF_INET
+        elif version == 6:
+            if len(data) < offset + 48:
+                continue
+            protocol = data[offset + 6]
+            udp = offset + 40
+            while protocol in _IPV6_EXTENSIONS and udp + 8 <= len(data):
+                protocol = data[udp]
+                udp += (data[udp + 1] + 1) * 8
+            if protocol != 17:
+                continue
+            end = offset + 40 + _unpack_u16_be(data, offset + 4)[0]
+            src_ip = bytes(data[offset + 8:offset + 24])
+            dst_ip = bytes(data[offset + 24:offset + 40])
+            family = AF_INET6
+        else:
+            continue
+        if udp + 8 > len(data):
+            continue
+        sport, dport, length = _unpack_udp(data, udp)
+        if port is not None and sport != port and dport != port:
+            continue
+        src = hosts.get(src_ip)
+        if src is None:
+            if len(hosts) >= _MAX_HOSTS:
+                hosts.clear()
+            src = hosts[src_ip] = inet_ntop(family, src_ip)
+        dst = hosts.get(dst_ip)
+        if dst is None:
+            dst = hosts[dst_ip] = inet_ntop(family, dst_ip)
+        yield UDPDatagram(timestamp, (src, sport), (dst, dport), data[udp + 8:min(end, udp + length, len(data))])
+
+def _network_offset(linktype: int, data: memoryview) -> int | None:
+    """链路层头之后 IP 头的偏移量，不是 IP 数据包时返回 None"""
+    if linktype == LINKTYPE_ETHERNET:
+        if len(data) < 14:
+            return None
+        offset = 12
+        ethertype = _unpack_u16_be(data, offset)[0]
+        while ethertype in (0x8100, 0x88a8) and len(data) >= offset + 6:  # VLAN 标签
+            offset += 4
+            ethertype = _unpack_u16_be(data, offset)[0]
+        return offset + 2 if ethertype in (0x0800, 0x86dd) else None
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6, 12, 14):
+        return 0
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        return 4
+    if linktype == LINKTYPE_LINUX_SLL:
+        return 16
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return 20
+    return None
@@ -0,0 +1,75 @@
+from __future__ import annotations
+from typing import Iterable
+import ipaddress
+import struct
+
+_unpack_u32 = struct.Struct('>I').unpack_from
+
+
+class PoisonIndex:
+    """
+    已知污染地址的 CIDR 索引，同时支持 IPv4 和 IPv6
+
+    每个前缀长度对应一个集合，保存网络地址右移掉主机位后的整数。
+    查询时对索引中出现过的每个前缀长度做一次移位和集合查找，最多 33（IPv6 为 129）次，
+    直接在数据包的打包地址上进行，不创建 ipaddress 对象。
+    """
+
+    def __init__(self, networks: Iterable[str] = ()):
+        # 地址长度（4 或 16 字节） -> {前缀长度: {网络号}}
+        self._tables: dict[int, dict[int, set[int]]] = {4: {}, 16: {}}
+        # 地址长度 -> [(主机位数, 网络号集合)]，按前缀从长到短排列，查找时优先命中最长前缀
+        self._levels: dict[int, list[tuple[int, set[int]]]] = {4: [], 16: []}
+        self._count = 0
+        for network in networks:
+            self.add(network)
+
+    @classmethod
+    def load(cls, path: str) -> PoisonIndex:
+        """从文件加载，每行一个地址或 CIDR，# 之后为注释"""
+        index = cls()
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    index.add(line)
+        return index
+
+    def add(self, network: str):
+        """添加一个地址或 CIDR，主机位不为 0 时按所在网络处理"""
+        net = ipaddress.ip_network(network, strict=False)
+        size = 4 if net.version == 4 else 16
+        host_bits = size * 8 - net.prefixlen
+        table = self._tables[size]
+        if net.prefixlen not in table:
+            table[net.prefixlen] = set()
+            self._levels[size] = sorted(((size * 8 - length, values) for length, values in table.items()),
+                                        key=lambda level: level[0])
+        values = table[net.prefixlen]
+        key = int(net.network_address) >> host_bits
+        if key not in values:
+            values.add(key)
+            self._count += 1
+
+    def match(self, packed: bytes | memoryview) -> int | None:
+        """打包的 4 或 16 字节地址命中时返回最长匹配的前缀长度，否则返回 None"""
+        size = len(packed)
+        levels = self._levels.get(size)
+        if not levels:
+            return None
+        value = _unpack_u32(packed)[0] if size == 4 else int.from_bytes(packed, 'big')
+        for host_bits, values in levels:
+            if value >> host_bits in values:
+                return size * 8 - host_bits
+        return None
+
+    def __contains__(self, address: str | bytes | memoryview) -> bool:
+        if isinstance(address, str):
+            address = ipaddress.ip_address(address).packed
+        return self.match(address) is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __repr__(self):
+        return f"PoisonIndex({self._count} networks, prefixes v4={sorted(self._tables[4])}, v6={sorted(self._tables[16])})"
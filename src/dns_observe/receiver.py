@@ -0,0 +1,106 @@
+from __future__ import annotations
+from typing import NamedTuple
+import select
+import socket
+import time
+
+
+class Datagram(NamedTuple):
+    """收到的一个数据包"""
+    data: memoryview   # 指向接收缓冲区的视图，不复制
+    address: tuple     # 来源地址
+    time: float        # 到达时间 time.monotonic()
+
+    def detach(self) -> Datagram:
+        """复制出独立的 bytes，解析结果不再引用整个 arena"""
+        return self._replace(data=bytes(self.data))
+
+
+class DatagramReceiver:
+    """
+    UDP 接收引擎
+
+    数据包通过 recvfrom_into 依次写入预分配的大块缓冲区（arena），每个数据包只是其中一段的 memoryview。
+    socket 可读时 drain() 以非阻塞方式一次取走所有排队的数据包，每个数据包只记录一次单调时钟。
+
+    写满的 arena 退回缓冲池，等其中的数据包都不再被引用后重新使用；
+    仍被 DNSResponse 引用的 arena 由垃圾回收释放。
+    """
+
+    def __init__(self, sock: socket.socket, bufsize: int = 4096, arena_size: int = 256 * 1024,
+                 pool_size: int = 8, rcvbuf: int = 4 * 1024 * 1024, max_burst: int = 4096):
+        self.sock = sock
+        self.bufsize = bufsize        # 单个数据包的最大长度
+        self.arena_size = arena_size
+        self.pool_size = pool_size    # 最多保留多少个写满的 arena 等待复用
+        self.max_burst = max_burst    # 一次 drain 最多读取的数据包数量，避免饿死调用方
+        self.sock.setblocking(False)
+        try:
+            # 加大内核接收缓冲区，抵御注入洪泛时的内核丢包
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        except OSError:
+            pass
+        self._retired: list[bytearray] = []
+        self._arena = bytearray(arena_size)
+        self._view = memoryview(self._arena)
+        self._pos = 0
+        # 单调时钟与墙上时钟的对应关系，用于把到达时间换算成时间戳
+        self._wall_base = time.time()
+        self._mono_base = time.monotonic()
+
+    def wait(self, timeout: float) -> bool:
+        """等待 socket 可读，超时返回 False"""
+        readable, _, _ = select.select([self.sock], [], [], max(0, timeout))
+        return bool(readable)
+
+    def drain(self) -> list[Datagram]:
+        """非阻塞地取走 socket 中所有已到达的数据包"""
+        packets = []
+        recvfrom_into = self.sock.recvfrom_into
+        monotonic = time.monotonic
+        bufsize = self.bufsize
+        while len(packets) < self.max_burst:
+            if self.arena_size - self._pos < bufsize:
+                self._next_arena()
+            pos = self._pos
+            try:
+                n, address = recvfrom_into(self._view[pos:], bufsize)
+            except (BlockingIOError, socket.timeout):
+                break
+            except (ConnectionRefusedError, InterruptedError):
+                # 某些平台会把 ICMP 端口不可达报告给 UDP socket，忽略即可
+                continue
+            packets.append(Datagram(self._view[pos:pos+n], address, monotonic()))
+            self._pos = pos + n
+        return packets
+
+    def wall_time(self, monotonic: float) -> float:
+        """把 time.monotonic() 的到达时间换算为 Unix 时间戳"""
+        return self._wall_base + (monotonic - self._mono_base)
+
+    def _next_arena(self):
+        """换用一个空闲的 arena"""
+        self._view.release()
+        self._retired.append(self._arena)
+        for i, arena in enumerate(self._retired):
+            if _is_unreferenced(arena):
+                del self._retired[i]
+                break
+        else:
+            arena = bytearray(self.arena_size)
+            if len(self._retired) > self.pool_size:
+                # 仍被引用的 arena 不再追踪，交给垃圾回收
+                del self._retired[0]
+        self._arena = arena
+        self._view = memoryview(arena)
+        self._pos = 0
+
+
+def _is_unreferenced(arena: bytearray) -> bool:
+    """arena 上没有任何 memoryview 时才能改变大小，借此判断其中的数据包是否都已释放"""
+    try:
+        arena.append(0)
+    except BufferError:
+        return False
+    del arena[-1]
+    return True
@@ -0,0 +1,125 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Iterable, Iterator
+import io
+import math
+import os
+import random
+
+from .dns import DNSQuery, RecordType
+from .sinks import CSVSink, JSONLinesSink, TextSink
+from .utils import ResponseList
+
+# worker 中格式化输出用的 sink，与命令行的 --format 对应
+OUTPUT_FORMATS = ('text', 'jsonl', 'csv')
+
+# 默认每个分片的最大域名数：分片越小，第一批输出越早，慢的分片也不会拖住太多后续结果
+SHARD_SIZE = 256
+
+# 传给 worker 的 DNSQuery 参数，capture/metrics/tracer 等只在父进程中有意义的参数不传递
+_CONFIG_FIELDS = ('server', 'port', 'wait_time', 'timeout', 'adaptive', 'grace', 'rtt_tolerance', 'poison', 'tcp_fallback')
+
+
+def query_sharded(dns: DNSQuery, domains: Iterable[str], qtype: RecordType = RecordType.A, workers: int | None = None,
+                  chunk_size: int | None = None, output_format: str | None = None,
+                  write: Callable[[str], object] | None = None) -> dict[str, ResponseList]:
+    """
+    把域名列表分片，在 ProcessPoolExecutor 的多个进程中各自用 query_many 扫描
+
+    每个分片在 worker 中使用独立的 socket，transaction ID 从 dns.transaction_id（为 0 时随机）起按
+    域名在输入中的位置依次递增，与单进程的 query_many 相同，分片之间不会重复。
+    worker 只把原始数据包和到达信息传回父进程，父进程在分片完成时重新解析为 DNSResponse
+    （记录区仍然延迟解析）并交给 dns 的 sink。先完成的分片暂存到之前的分片都完成为止，因此输出的顺序与输入一致。
+    指定 output_format 时格式化已在 worker 中完成，响应不再交给 dns 的 sink。
+
+    Parameters:
+        - dns(DNSQuery): 提供服务器、端口、监听时间和污染地址索引等参数
+        - domains(Iterable[str]): 查询记录的域名列表
+        - qtype(RecordType): 查询的记录类型，默认为 A 类型
+        - workers(int | None): 进程数，默认为 CPU 核数
+        - chunk_size(int | None): 每个分片的域名数，默认平均分给各个进程，但不超过 SHARD_SIZE
+        - output_format(str | None): 'text' / 'jsonl' / 'csv' 时在 worker 中完成格式化（csv 不含表头），
+          每个分片的输出按顺序交给 write，父进程不必再格式化
+        - write(Callable[[str], object] | None): 接收每个分片格式化后的输出，以换行结尾
+
+    Returns:
+        - dict[str, ResponseList]: 按输入顺序排列的 域名 -> 响应列表 映射
+
+    Raises:
+        - RuntimeError: 当 DNS 请求失败时抛出运行时错误
+    """
+    if output_format is not None and output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'output_format must be one of {OUTPUT_FORMATS}, got {output_format!r}')
+    domains = list(dict.fromkeys(domains))  # 与 query_many 相同，重复的域名只查询一次
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, min(SHARD_SIZE, math.ceil(len(domains) / workers)))
+    config = {field: getattr(dns, field) for field in _CONFIG_FIELDS}
+    first_id = dns.transaction_id or random.randint(1, 65535)
+
+    results: dict[str, ResponseList] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_scan_shard, shard): start for start, shard
+                   in zip(range(0, len(domains), chunk_size),
+                          _shards(config, domains, first_id, chunk_size, qtype, output_format))}
+        done: dict[int, tuple[list[tuple], str]] = {}  # 已完成但前面还有分片未完成的结果，按起始位置暂存
+        next_start = 0
+        for future in as_completed(futures):
+            done[futures[future]] = future.result()
+            while next_start in done:
+                packets, output = done.pop(next_start)
+                _merge(dns, domains[next_start:next_start + chunk_size], packets, results, output_format)
+                if output and write is not None:
+                    write(output)
+                next_start += chunk_size
+    return results
+
+
+def _merge(dns: DNSQuery, shard: list[str], packets: list[tuple], results: dict[str, ResponseList],
+           output_format: str | None):
+    """把 worker 传回的数据包重新解析为 DNSResponse 并加入 results，未在 worker 中格式化时交给 dns 的 sink"""
+    for domain in shard:
+        results[domain] = ResponseList()
+    for index, data, timestamp, rtt, address, verdict, transport in packets:
+        dns_resp = dns._parse_response(data)
+        dns_resp.timestamp = timestamp
+        dns_resp.rtt = rtt
+        dns_resp.address = address
+        dns_resp.verdict = verdict
+        dns_resp.transport = transport
+        results[shard[index]].append(dns_resp)
+        if output_format is None:
+            dns._emit(dns_resp, qname=shard[index])
+
+
+def _shards(config: dict, domains: list[str], first_id: int, chunk_size: int, qtype: int,
+            output_format: str | None) -> Iterator[tuple]:
+    for start in range(0, len(domains), chunk_size):
+        # 分片的起始 ID 为整个扫描中第 start 个查询的 ID
+        shard_config = dict(config, transaction_id=(first_id - 1 + start) % 65535 + 1)
+        yield shard_config, domains[start:start + chunk_size], qtype, output_format
+
+
+def _scan_shard(shard: tuple[dict, list[str], int, str | None]) -> tuple[list[tuple], str]:
+    """
+    在 worker 进程中扫描一个分片，参数为 _shards 生成的 (DNSQuery 参数, 域名列表, qtype, output_format)
+
+    返回 ([(域名在分片中的位置, 数据包, timestamp, rtt, address, verdict, transport), ...], 格式化后的输出)，
+    只包含 bytes 和基本类型，序列化开销远小于 pickle 整个 DNSResponse。
+    """
+    config, domains, qtype, output_format = shard
+    dns = DNSQuery(**config)
+    buffer = io.StringIO()
+    if output_format == 'text':
+        dns.add_sink(TextSink(lambda line: buffer.write(line + '\n')))
+    elif output_format == 'jsonl':
+        dns.add_sink(JSONLinesSink(buffer))
+    elif output_format == 'csv':
+        dns.add_sink(CSVSink(buffer, header=False))
+    results = dns.query_many(domains, qtype)
+    packets = []
+    for index, responses in enumerate(results.values()):
+        for dns_resp in responses:
+            packets.append((index, bytes(dns_resp._response), dns_resp.timestamp, dns_resp.rtt,
+                            dns_resp.address, dns_resp.verdict, dns_resp.transport))
+    return packets, buffer.getvalue()
@@ -0,0 +1,385 @@
+from __future__ import annotations
+from typing import Iterable, NamedTuple
+import argparse
+import heapq
+import json
+import select
+import socket
+import ssl
+import struct
+import threading
+import time
+from .dns import QTYPE, RecordType, _encode_labels
+
+_header = struct.Struct('>HHHHHH')
+_rr_fixed = struct.Struct('>HHLH')
+
+
+class Injection(NamedTuple):
+    """一个伪造响应：在收到查询 delay 秒后发出，回答 addresses 中的地址"""
+    addresses: tuple[str, ...] = ('31.13.94.41',)
+    delay: float = 0.002
+    ttl: int = 247
+
+
+class PollutionServer:
+    """
+    本地 UDP DNS 服务器，模拟被污染的解析路径
+
+    真实响应来自 zone 表，在收到查询 delay 秒后发出。对匹配 polluted 后缀的域名（None 表示所有域名），
+    先按 injections 发出伪造响应，行为类似 GFW 的旁路注入：同样的 ID 和 question，更短的延迟。
+    zone 的格式为 {域名: {类型: [值, ...]}}，例如 {'example.com': {'A': ['93.184.216.34'], 'MX': ['10 mail.example.com']}}。
+
+    所有响应由一个线程按发送时间调度，不会为每个响应创建线程。
+
+    tcp 为 True 时在同一端口上接受 RFC 7766 格式的 TCP 查询，TCP 上没有注入。匹配 truncate 后缀的域名，
+    UDP 的真实响应设置 TC 位且不带答案，需要通过 TCP 重新查询。tcp_max_queries 模拟服务器的连接复用上限：
+    一条连接回答了这么多查询后由服务器关闭，之后收到的查询不再回答。
+
+    传入 tls_context 时另外在 tls_port（0 表示由系统分配）上接受 DNS over TLS 查询，行为与 TCP 相同。
+    """
+
+    def __init__(self, zone: dict | None = None, host: str = '127.0.0.1', port: int = 0, delay: float = 0.02,
+                 ttl: int = 300, injections: Iterable[Injection] = (), polluted: Iterable[str] | None = None,
+                 tcp: bool = False, truncate: Iterable[str] = (), tcp_max_queries: int | None = None,
+                 tls_context: ssl.SSLContext | None = None, tls_port: int = 0):
+        self.zone = {name.lower().rstrip('.'): records for name, records in (zone or {}).items()}
+        self.delay = delay
+        self.ttl = ttl
+        self.injections = list(injections)
+        self.polluted = tuple(name.lower().rstrip('.') for name in polluted) if polluted is not None else None
+        self.truncate = tuple(name.lower().rstrip('.') for name in truncate)
+        self.tcp_max_queries = tcp_max_queries
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+            try:
+                # 扫描时查询成批到达，注入时响应成倍增加，缓冲区太小会在服务器一侧丢包
+                self.sock.setsockopt(socket.SOL_SOCKET, option, 4 * 1024 * 1024)
+            except OSError:
+                pass
+        self.address = self.sock.getsockname()
+        self.port = self.address[1]
+        self.tcp_sock: socket.socket | None = None
+        if tcp:
+            self.tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.tcp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.tcp_sock.bind((host, self.port))
+            self.tcp_sock.listen(128)
+            self.tcp_sock.setblocking(False)
+        self.tls_context = tls_context
+        self.tls_sock: socket.socket | None = None
+        self.tls_port: int | None = None
+        if tls_context is not None:
+            self.tls_sock = socket.create_server((host, tls_port), backlog=128)
+            self.tls_sock.setblocking(False)
+            self.tls_port = self.tls_sock.getsockname()[1]
+        self._clients: dict[socket.socket, list] = {}  # TCP/TLS 连接 -> [接收缓冲区, 已回答的查询数量, 握手是否完成]
+        self.queries = 0    # 收到的查询数量
+        self.replies = 0    # 发出的响应数量，包括伪造的
+        self.tcp_queries = 0      # 其中通过 TCP 收到的查询数量
+        self.tcp_connections = 0  # 接受的 TCP 连接数量，包括 TLS 连接
+        self.tls_handshakes = 0   # 完成的 TLS 握手数量
+        self.tls_resumed = 0      # 其中恢复了会话的数量
+        self._schedule: list[tuple[float, int, bytes, tuple]] = []  # (发送时间, 序号, 数据, 地址)
+        self._seq = 0
+        self._running = False
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> PollutionServer:
+        """在后台线程中运行"""
+        self._running = True
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._running = True
+        while self._running:
+            timeout = 0.1
+            if self._schedule:
+                timeout = min(timeout, max(0, self._schedule[0][0] - time.monotonic()))
+            sockets = [self.sock]
+            for listener in (self.tcp_sock, self.tls_sock):
+                if listener is not None:
+                    sockets.append(listener)
+            sockets.extend(self._clients)
+            readable, _, _ = select.select(sockets, [], [], timeout)
+            for sock in readable:
+                if sock is self.sock:
+                    self._receive()
+                elif sock is self.tcp_sock or sock is self.tls_sock:
+                    self._accept_tcp(sock)
+                else:
+                    self._receive_tcp(sock)
+            self._send_due()
+
+    def close(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        self.sock.close()
+        for client in list(self._clients):
+            self._close_client(client)
+        for listener in (self.tcp_sock, self.tls_sock):
+            if listener is not None:
+                listener.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _receive(self):
+        while True:
+            try:
+                query, address = self.sock.recvfrom(512)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionRefusedError:
+                continue
+            now = time.monotonic()
+            try:
+                qname, qtype, question = _read_question(query)
+            except (IndexError, struct.error, UnicodeDecodeError):
+                continue
+            self.queries += 1
+            tid = query[:2]
+            if self._is_polluted(qname):
+                for injection in self.injections:
+                    self._push(now + injection.delay, tid + _forged(question, injection), address)
+            if self._matches(qname, self.truncate):
+                self._push(now + self.delay, tid + _header.pack(0, 0x8380, 1, 0, 0, 0)[2:] + question, address)
+            else:
+                self._push(now + self.delay, tid + self._answer(qname, qtype, question), address)
+
+    def _accept_tcp(self, listener: socket.socket):
+        try:
+            client, _ = listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        # 握手和响应分多次写入，Nagle 算法与对端的延迟确认叠加会让每次往返多出约 40ms
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if listener is self.tls_sock:
+            # 握手在接收循环中以非阻塞方式完成，不会阻塞其他连接
+            client.setblocking(False)
+            try:
+                client = self.tls_context.wrap_socket(client, server_side=True, do_handshake_on_connect=False)
+            except (ssl.SSLError, OSError):
+                client.close()
+                return
+            self._clients[client] = [bytearray(), 0, False]
+        else:
+            client.settimeout(1)
+            self._clients[client] = [bytearray(), 0, True]
+        self.tcp_connections += 1
+
+    def _receive_tcp(self, client: socket.socket):
+        """读取 TCP/TLS 连接上的查询，一次可能收到多个（流水线）或半个查询"""
+        state = self._clients[client]
+        try:
+            if not state[2]:
+                client.do_handshake()
+                state[2] = True
+                self.tls_handshakes += 1
+                self.tls_resumed += client.session_reused
+            data = self._recv(client)
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            return  # 握手或 TLS 记录还不完整
+        except OSError:
+            data = b''
+        if not data:
+            self._close_client(client)
+            return
+        buffer = state[0]
+        buffer += data
+        now = time.monotonic()
+        while len(buffer) >= 2:
+            size = struct.unpack_from('>H', buffer)[0]
+            if len(buffer) < 2 + size:
+                break
+            query = bytes(buffer[2:2 + size])
+            del buffer[:2 + size]
+            try:
+                qname, qtype, question = _read_question(query)
+            except (IndexError, struct.error, UnicodeDecodeError):
+                continue
+            self.queries += 1
+            self.tcp_queries += 1
+            self._push(now + self.delay, query[:2] + self._answer(qname, qtype, question), client)
+
+    def _recv(self, client: socket.socket) -> bytes:
+        if not isinstance(client, ssl.SSLSocket):
+            return client.recv(65536)
+        data = client.recv(65536)
+        while client.pending():
+            data += client.recv(client.pending())
+        return data
+
+    def _close_client(self, client: socket.socket):
+        self._clients.pop(client, None)
+        client.close()
+
+    def _push(self, when: float, data: bytes, address: tuple):
+        self._seq += 1
+        heapq.heappush(self._schedule, (when, self._seq, data, address))
+
+    def _send_due(self):
+        now = time.monotonic()
+        while self._schedule and self._schedule[0][0] <= now:
+            _, _, data, address = heapq.heappop(self._schedule)
+            if isinstance(address, socket.socket):
+                self._send_tcp(address, data)
+                continue
+            try:
+                self.sock.sendto(data, address)
+                self.replies += 1
+            except BlockingIOError:
+                pass  # 发送缓冲区满，和网络丢包一样直接丢弃
+
+    def _send_tcp(self, client: socket.socket, data: bytes):
+        state = self._clients.get(client)
+        if state is None:
+            return  # 连接已关闭
+        try:
+            if isinstance(client, ssl.SSLSocket):
+                client.settimeout(1)
+                client.sendall(struct.pack('>H', len(data)) + data)
+                client.setblocking(False)
+            else:
+                client.sendall(struct.pack('>H', len(data)) + data)
+        except OSError:
+            self._close_client(client)
+            return
+        self.replies += 1
+        state[1] += 1
+        if self.tcp_max_queries is not None and state[1] >= self.tcp_max_queries:
+            self._close_client(client)
+
+    def _is_polluted(self, qname: str) -> bool:
+        if not self.injections:
+            return False
+        if self.polluted is None:
+            return True
+        return self._matches(qname, self.polluted)
+
+    def _matches(self, qname: str, suffixes: tuple[str, ...]) -> bool:
+        return any(qname == suffix or qname.endswith('.' + suffix) for suffix in suffixes)
+
+    def _answer(self, qname: str, qtype: int, question: bytes) -> bytes:
+        """按 zone 表生成真实响应（不含 ID），跟随 CNAME，不存在的域名返回 NXDOMAIN"""
+        answers = []
+        name = qname
+        for _ in range(8):
+            records = self.zone.get(name)
+            if records is None:
+                break
+            type_name = _TYPE_NAME.get(qtype)
+            if type_name in records:
+                answers.extend(_rr(name, qtype, self.ttl, value) for value in records[type_name])
+                break
+            if 'CNAME' not in records:
+                break
+            target = records['CNAME'][0]
+            answers.append(_rr(name, RecordType.CNAME, self.ttl, target))
+            name = target.lower().rstrip('.')
+        if not answers and qname not in self.zone:
+            return _header.pack(0, 0x8183, 1, 0, 0, 0)[2:] + question
+        return _header.pack(0, 0x8180, 1, len(answers), 0, 0)[2:] + question + b''.join(answers)
+
+
+_TYPE_NAME = {value: name for name, value in QTYPE.items()}
+
+def _read_question(query: bytes) -> tuple[str, int, bytes]:
+    """返回查询的域名、类型及原始 question 段"""
+    offset = 12
+    labels = []
+    while query[offset]:
+        length = query[offset]
+        labels.append(str(query[offset + 1:offset + 1 + length], 'ascii'))
+        offset += 1 + length
+    qtype = struct.unpack_from('>H', query, offset + 1)[0]
+    return '.'.join(labels).lower(), qtype, query[12:offset + 5]
+
+def _encode_name(name: str) -> bytes:
+    return b''.join(bytes([len(label)]) + label for label in _encode_labels(name)) + b'\x00'
+
+def _rdata(rtype: int, value: str) -> bytes:
+    if rtype == RecordType.A:
+        return socket.inet_aton(value)
+    if rtype == RecordType.AAAA:
+        return socket.inet_pton(socket.AF_INET6, value)
+    if rtype in (RecordType.CNAME, RecordType.NS):
+        return _encode_name(value)
+    if rtype == RecordType.MX:
+        preference, exchange = value.split()
+        return struct.pack('>H', int(preference)) + _encode_name(exchange)
+    if rtype == RecordType.TXT:
+        data = value.encode()
+        return b''.join(bytes([len(data[i:i + 255])]) + data[i:i + 255] for i in range(0, max(len(data), 1), 255))
+    raise ValueError(f'unsupported record type in zone: {rtype}')
+
+def _rr(name: str, rtype: int, ttl: int, value: str) -> bytes:
+    rdata = _rdata(rtype, value)
+    return _encode_name(name) + _rr_fixed.pack(rtype, 1, ttl, len(rdata)) + rdata
+
+def _forged(question: bytes, injection: Injection) -> bytes:
+    """伪造响应（不含 ID）：回显 question，答案的所有者名称用指向 question 的压缩指针"""
+    answers = b''
+    for address in injection.addresses:
+        if ':' in address:
+            rtype, rdata = RecordType.AAAA, socket.inet_pton(socket.AF_INET6, address)
+        else:
+            rtype, rdata = RecordType.A, socket.inet_aton(address)
+        answers += b'\xc0\x0c' + _rr_fixed.pack(rtype, 1, injection.ttl, len(rdata)) + rdata
+    return _header.pack(0, 0x8180, 1, len(injection.addresses), 0, 0)[2:] + question + answers
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog='python -m dns_observe.simulator',
+        description='Local DNS server that answers from a zone table and injects forged replies first',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='listen address')
+    parser.add_argument('-p', '--port', type=int, default=5353, help='listen port')
+    parser.add_argument('-z', '--zone', metavar='FILE', help='JSON zone table {"name": {"A": ["1.2.3.4"]}}')
+    parser.add_argument('-d', '--delay', type=float, default=0.05, help='seconds before the genuine reply')
+    parser.add_argument('-n', '--inject', type=int, default=1, help='forged replies sent before the genuine one')
+    parser.add_argument('--inject-delay', type=float, default=0.002, help='seconds before the first forged reply, later ones follow 1ms apart')
+    parser.add_argument('--inject-ttl', type=int, default=247, help='TTL of forged records')
+    parser.add_argument('--inject-ip', action='append', help='address in forged replies, repeatable (default: 31.13.94.41)')
+    parser.add_argument('--polluted', action='append', metavar='DOMAIN', help='only inject for these domains and their subdomains (default: all)')
+    parser.add_argument('--tcp', action='store_true', help='also answer DNS over TCP on the same port')
+    parser.add_argument('--tls', metavar='PEM', help='also answer DNS over TLS, with the certificate and private key in this PEM file')
+    parser.add_argument('--tls-port', type=int, default=8853, help='DNS over TLS listen port')
+    parser.add_argument('--truncate', action='append', metavar='DOMAIN', help='set TC and drop the answers of genuine UDP replies for these domains')
+    args = parser.parse_args(argv)
+    zone = {}
+    if args.zone:
+        with open(args.zone) as f:
+            zone = json.load(f)
+    addresses = tuple(args.inject_ip or ['31.13.94.41'])
+    injections = [Injection(addresses, args.inject_delay + i * 0.001, args.inject_ttl) for i in range(args.inject)]
+    tls_context = None
+    if args.tls:
+        tls_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        tls_context.load_cert_chain(args.tls)
+    server = PollutionServer(zone, args.host, args.port, args.delay, injections=injections, polluted=args.polluted,
+                             tcp=args.tcp, truncate=args.truncate or (), tls_context=tls_context, tls_port=args.tls_port)
+    transports = 'udp+tcp' if args.tcp else 'udp'
+    if args.tls:
+        transports += f', tls on {server.tls_port}'
+    print(f'listening on {server.address[0]}:{server.port} ({transports}), {len(zone)} names, {args.inject} forged replies per query')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
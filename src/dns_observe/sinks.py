@@ -0,0 +1,196 @@
+from __future__ import annotations
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Iterator, NamedTuple, TextIO
+import csv
+import datetime
+import json
+import struct
+import sys
+import threading
+
+if TYPE_CHECKING:
+    from .dns import DNSResponse, DNSResourceRecord
+
+
+class ResponseEvent(NamedTuple):
+    """接收循环交给 sink 的一个响应"""
+    response: DNSResponse
+    qname: str | None = None   # query_many 中对应的查询域名
+    server: str | None = None  # query_servers 中对应的服务器
+
+
+class Sink:
+    """
+    响应的消费者
+
+    DNSQuery 每解析出一个响应就在接收循环中调用 on_response，
+    实现应尽快返回，格式化等耗时的工作放到真正需要输出时再做。
+    """
+
+    def on_response(self, event: ResponseEvent):
+        pass
+
+    def close(self):
+        pass
+
+
+class CallbackSink(Sink):
+    """把每个响应交给回调函数"""
+
+    def __init__(self, callback: Callable[[ResponseEvent], object]):
+        self.callback = callback
+
+    def on_response(self, event: ResponseEvent):
+        self.callback(event)
+
+
+class QueueSink(Sink):
+    """
+    有界队列，供其他线程取走响应
+
+    队列满时丢弃最早的响应，并累计到 dropped；maxsize 为 None 时不限长度。
+    """
+
+    def __init__(self, maxsize: int | None = 1024):
+        self.events: deque[ResponseEvent] = deque(maxlen=maxsize)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def on_response(self, event: ResponseEvent):
+        with self._lock:
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append(event)
+
+    def drain(self) -> list[ResponseEvent]:
+        """取走当前队列中的所有响应"""
+        with self._lock:
+            events = list(self.events)
+            self.events.clear()
+        return events
+
+    def __len__(self):
+        return len(self.events)
+
+
+class TextSink(Sink):
+    """把响应渲染为命令行的文本输出，每行调用一次 write"""
+
+    def __init__(self, write: Callable[[str], object]):
+        self.write = write
+
+    def on_response(self, event: ResponseEvent):
+        for line in render_text(event):
+            self.write(line)
+
+
+class JSONLinesSink(Sink):
+    """每条资源记录输出一行 JSON，字段见 ROW_FIELDS"""
+
+    def __init__(self, stream: TextIO | None = None):
+        self.stream = stream if stream is not None else sys.stdout
+
+    def on_response(self, event: ResponseEvent):
+        write = self.stream.write
+        for row in iter_rows(event):
+            write(json.dumps(row, ensure_ascii=False))
+            write('\n')
+
+    def close(self):
+        self.stream.flush()
+
+
+class CSVSink(Sink):
+    """每条资源记录输出一行 CSV，第一行为表头 ROW_FIELDS"""
+
+    def __init__(self, stream: TextIO | None = None, header: bool = True):
+        self.stream = stream if stream is not None else sys.stdout
+        self._writer = csv.DictWriter(self.stream, ROW_FIELDS, lineterminator='\n')
+        if header:
+            self._writer.writeheader()
+
+    def on_response(self, event: ResponseEvent):
+        self._writer.writerows(iter_rows(event))
+
+    def close(self):
+        self.stream.flush()
+
+
+# 导出的每一行对应一条资源记录；没有资源记录的响应输出一行，section 等字段为空
+ROW_FIELDS = ('timestamp', 'rtt', 'address', 'port', 'id', 'qname', 'qtype', 'server',
+              'rcode', 'reply', 'verdict', 'transport', 'section', 'name', 'type', 'ttl', 'data')
+
+def iter_rows(event: ResponseEvent) -> Iterator[dict]:
+    """把响应展开为导出的行"""
+    from .dns import RECORD_TYPE_NAME
+    dns_resp = event.response
+    address, port = dns_resp.address[:2] if dns_resp.address else (None, None)
+    head = {
+        'timestamp': round(dns_resp.timestamp, 6),
+        'rtt': round(dns_resp.rtt, 6) if dns_resp.rtt is not None else None,
+        'address': address,
+        'port': port,
+        'id': dns_resp.id,
+        'qname': event.qname if event.qname is not None else dns_resp.qname,
+        'qtype': RECORD_TYPE_NAME.get(dns_resp.qtype, dns_resp.qtype),
+        'server': event.server,
+        'rcode': dns_resp.rcode,
+        'reply': dns_resp.reply,
+        'verdict': dns_resp.verdict,
+        'transport': dns_resp.transport,
+    }
+    empty = {'section': None, 'name': None, 'type': None, 'ttl': None, 'data': None}
+    try:
+        rows = [
+            {**head, 'section': section, 'name': record.name, 'type': record.type_name,
+             'ttl': record.ttl, 'data': record.data_view}
+            for section, records in (('answer', dns_resp.answer_RRs),
+                                     ('authority', dns_resp.authority_RRs),
+                                     ('additional', dns_resp.additional_RRs))
+            for record in records
+        ]
+    except (IndexError, struct.error, ValueError):
+        # 畸形的记录区只输出头部信息
+        rows = [{**head, **empty, 'section': 'malformed'}]
+    yield from rows or [{**head, **empty}]
+
+
+def render_text(event: ResponseEvent) -> list[str]:
+    """格式化响应摘要及资源记录"""
+    dns_resp = event.response
+    now = datetime.datetime.fromtimestamp(dns_resp.timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')
+    query = f", Query: {event.qname}" if event.qname is not None else ""
+    query += f", Server: {event.server}" if event.server is not None else ""
+    verdict = f", Verdict: {dns_resp.verdict}" if dns_resp.verdict is not None else ""
+    verdict += f", Transport: {dns_resp.transport.upper()}" if dns_resp.transport != 'udp' else ""
+    lines = [f"↯ Time: {now}{query}, Reply: {dns_resp.reply}({dns_resp.rcode}), Answer: {dns_resp.answer_n}, "
+             f"Authority: {dns_resp.authority_n}, Additional: {dns_resp.additional_n}{verdict}"]
+    try:
+        lines.extend(_render_section(dns_resp.answer_RRs, label="Answer"))
+        lines.extend(_render_section(dns_resp.authority_RRs, label="Authority"))
+        lines.extend(_render_section(dns_resp.additional_RRs, label="Additional"))
+    except (IndexError, struct.error, ValueError):
+        # 资源记录延迟解析，畸形的记录区到这里才会暴露，保留头部信息即可
+        del lines[1:]
+        lines.append('! Malformed resource records')
+    return lines
+
+
+def _render_section(records: list[DNSResourceRecord], label: str = "") -> list[str]:
+    """格式化一组 DNS 记录（answer/authority/additional）"""
+    from .dns import QTYPE_NAME
+    lines = []
+    for i, record in enumerate(records):
+        if len(records) == 1:
+            mark = '-'
+        elif i == 0:
+            mark = '┌'
+        elif i == len(records) - 1:
+            mark = '└'
+        else:
+            mark = '│'
+        if record.type in QTYPE_NAME:
+            lines.append(f"{mark} {label}: {record.name}, TTL: {record.ttl_view}, {record.type_name}: {record.data_view}")
+        else:
+            lines.append(f"{mark} {label}: {record.name}, TTL: {record.ttl_view}, Type: {record.type_name}, Data: \"{record.data_view}\"")
+    return lines
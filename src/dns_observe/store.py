@@ -0,0 +1,332 @@
+from __future__ import annotations
+from typing import NamedTuple
+import argparse
+import datetime
+import json
+import pathlib
+import sqlite3
+import struct
+import sys
+import time
+from .dns import RECORD_TYPE_NAME, RecordType
+from .sinks import ResponseEvent, Sink
+from .utils import ResponseList
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS servers (
+    id INTEGER PRIMARY KEY,
+    server TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS names (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS responses (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    server_id INTEGER NOT NULL REFERENCES servers(id),
+    qname_id INTEGER NOT NULL REFERENCES names(id),
+    qtype INTEGER NOT NULL,
+    txid INTEGER NOT NULL,
+    rcode INTEGER NOT NULL,
+    rtt REAL,
+    verdict TEXT,
+    transport TEXT                     -- 'udp' / 'tcp' / 'tls'
+);
+CREATE TABLE IF NOT EXISTS records (
+    response_id INTEGER NOT NULL REFERENCES responses(id),
+    section INTEGER NOT NULL,          -- 0 answer, 1 authority, 2 additional
+    position INTEGER NOT NULL,
+    name_id INTEGER NOT NULL REFERENCES names(id),
+    type INTEGER NOT NULL,
+    ttl INTEGER NOT NULL,
+    ip TEXT,                           -- A/AAAA 记录的地址
+    data TEXT,                         -- 其他类型记录的数据
+    PRIMARY KEY (response_id, section, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS responses_qname_time ON responses (qname_id, time);
+CREATE INDEX IF NOT EXISTS responses_server_time ON responses (server_id, time);
+CREATE INDEX IF NOT EXISTS records_ip ON records (ip) WHERE ip IS NOT NULL;
+"""
+
+
+class HistoryRow(NamedTuple):
+    """数据库中的一个响应"""
+    time: float
+    server: str
+    qname: str
+    qtype: str
+    rcode: int
+    rtt: float | None
+    verdict: str | None
+    answers: tuple[str, ...]   # 答案区的地址或数据
+    transport: str | None = None   # 增加该列之前写入的响应为 None
+
+
+class PoisonedAddress(NamedTuple):
+    """某个服务器对某个域名返回过的一个伪造地址"""
+    server: str
+    ip: str
+    first_seen: float
+    last_seen: float
+    count: int
+
+
+class AddressUse(NamedTuple):
+    """某个地址作为答案出现过的域名"""
+    qname: str
+    server: str
+    verdict: str | None
+    first_seen: float
+    last_seen: float
+    count: int
+
+
+class ObservationStore(Sink):
+    """
+    SQLite 观测数据库
+
+    作为 sink 接收响应，先缓存在内存中，达到 batch_size 个或距上次写入超过 flush_interval 秒时
+    在一个事务中批量写入。数据库使用 WAL 模式，写入时可以同时用 history 查询。
+    响应和资源记录分表保存，服务器和域名单独编号；A/AAAA 记录的地址单独一列并建立索引。
+
+    响应的 id 由 SQLite 在插入时分配，多个进程可以同时写入同一个数据库。
+    readonly 为 True 时以只读方式打开已有的数据库，文件不存在时抛出 sqlite3.OperationalError，不会创建空数据库。
+    """
+
+    def __init__(self, path: str, batch_size: int = 1000, flush_interval: float = 1.0, readonly: bool = False):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        if readonly:
+            self.conn = sqlite3.connect(pathlib.Path(path).absolute().as_uri() + '?mode=ro', uri=True)
+        else:
+            self.conn = sqlite3.connect(path)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            # WAL 模式下 NORMAL 只在检查点时 fsync，断电最多丢失最近的事务，不会损坏数据库
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.executescript(SCHEMA)
+        # 旧版本创建的数据库没有 transport 列，写入时补上，只读时按 NULL 查询
+        self._transport = 'r.transport'
+        if 'transport' not in [row[1] for row in self.conn.execute('PRAGMA table_info(responses)')]:
+            if readonly:
+                self._transport = 'NULL'
+            else:
+                self.conn.execute('ALTER TABLE responses ADD COLUMN transport TEXT')
+        self._pending: list[ResponseEvent] = []
+        self._last_flush = time.monotonic()
+        self._ids: dict[str, dict[str, int]] = {'servers': {}, 'names': {}}
+        self.written = 0   # 已写入的响应数量
+
+    def on_response(self, event: ResponseEvent):
+        self._pending.append(event)
+        if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def add(self, responses: ResponseList, qname: str | None = None, server: str | None = None):
+        """
+        写入一次查询的所有响应
+
+        响应都还没有判定结果时按到达顺序判定：最后一个为真实响应，其余为伪造。
+        """
+        if all(response.verdict is None for response in responses):
+            for response in responses.fakes():
+                response.verdict = 'fake'
+            if responses:
+                responses.real().verdict = 'real'
+        for response in responses:
+            self.on_response(ResponseEvent(response, qname, server))
+
+    def flush(self):
+        """在一个事务中写入所有缓存的响应"""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        events, self._pending = self._pending, []
+        records = []
+        with self.conn:
+            for event in events:
+                dns_resp = event.response
+                qname = event.qname if event.qname is not None else dns_resp.qname
+                response_id = self.conn.execute(
+                    'INSERT INTO responses (time, server_id, qname_id, qtype, txid, rcode, rtt, verdict, transport)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (dns_resp.timestamp, self._id('servers', _server_of(event)), self._id('names', _normalize(qname)),
+                     dns_resp.qtype, dns_resp.id, dns_resp.rcode, dns_resp.rtt, dns_resp.verdict,
+                     dns_resp.transport)).lastrowid
+                try:
+                    rows = []
+                    for section, rrs in enumerate((dns_resp.answer_RRs, dns_resp.authority_RRs, dns_resp.additional_RRs)):
+                        for position, record in enumerate(rrs):
+                            if record.type == RecordType.A or record.type == RecordType.AAAA:
+                                ip, data = record.data_view, None
+                            else:
+                                ip, data = None, str(record.data_view)
+                            rows.append((response_id, section, position, self._id('names', _normalize(record.name)),
+                                         record.type, record.ttl, ip, data))
+                    records.extend(rows)
+                except (IndexError, struct.error, ValueError):
+                    pass  # 畸形的记录区只保存响应本身
+            self.conn.executemany('INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)', records)
+        self.written += len(events)
+
+    def _id(self, table: str, value: str) -> int:
+        """servers/names 表中 value 的编号，不存在时插入；需在事务中调用"""
+        ids = self._ids[table]
+        ident = ids.get(value)
+        if ident is None:
+            column = 'server' if table == 'servers' else 'name'
+            self.conn.execute(f'INSERT OR IGNORE INTO {table} ({column}) VALUES (?)', (value,))
+            ident = self.conn.execute(f'SELECT id FROM {table} WHERE {column} = ?', (value,)).fetchone()[0]
+            if len(ids) >= 100000:
+                ids.clear()  # 限制内存占用，之后按需重新查询
+            ids[value] = ident
+        return ident
+
+    def history(self, qname: str, server: str | None = None, since: float | None = None,
+                until: float | None = None, limit: int | None = None) -> list[HistoryRow]:
+        """按时间顺序返回 qname 的所有响应"""
+        self.flush()
+        sql = f"""
+            SELECT r.id, r.time, s.server, n.name, r.qtype, r.rcode, r.rtt, r.verdict, {self._transport}
+            FROM responses r JOIN names n ON n.id = r.qname_id JOIN servers s ON s.id = r.server_id
+            WHERE n.name = ?"""
+        params: list = [_normalize(qname)]
+        sql, params = _filter(sql, params, server, since, until)
+        sql += ' ORDER BY r.time'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        rows = self.conn.execute(sql, params).fetchall()
+        answers: dict[int, list[str]] = {row[0]: [] for row in rows}
+        for start in range(0, len(rows), 500):
+            chunk = [row[0] for row in rows[start:start + 500]]
+            for response_id, ip, data in self.conn.execute(
+                    f"SELECT response_id, ip, data FROM records WHERE section = 0 AND response_id IN ({','.join('?' * len(chunk))})"
+                    " ORDER BY response_id, position", chunk):
+                answers[response_id].append(ip if ip is not None else data)
+        return [HistoryRow(time_, server_, name, RECORD_TYPE_NAME.get(qtype, str(qtype)), rcode, rtt, verdict,
+                           tuple(answers[response_id]), transport)
+                for response_id, time_, server_, name, qtype, rcode, rtt, verdict, transport in rows]
+
+    def poisoning(self, qname: str, server: str | None = None, since: float | None = None,
+                  until: float | None = None) -> list[PoisonedAddress]:
+        """qname 收到过的伪造地址，按首次出现的时间排列"""
+        self.flush()
+        sql = """
+            SELECT s.server, rec.ip, min(r.time), max(r.time), count(*)
+            FROM responses r JOIN names n ON n.id = r.qname_id JOIN servers s ON s.id = r.server_id
+            JOIN records rec ON rec.response_id = r.id
+            WHERE n.name = ? AND r.verdict = 'fake' AND rec.section = 0 AND rec.ip IS NOT NULL"""
+        sql, params = _filter(sql, [_normalize(qname)], server, since, until)
+        sql += ' GROUP BY s.server, rec.ip ORDER BY min(r.time)'
+        return [PoisonedAddress(*row) for row in self.conn.execute(sql, params)]
+
+    def names_for_ip(self, ip: str, since: float | None = None, until: float | None = None) -> list[AddressUse]:
+        """答案中出现过 ip 的域名，按首次出现的时间排列"""
+        self.flush()
+        sql = """
+            SELECT n.name, s.server, r.verdict, min(r.time), max(r.time), count(*)
+            FROM records rec JOIN responses r ON r.id = rec.response_id
+            JOIN names n ON n.id = r.qname_id JOIN servers s ON s.id = r.server_id
+            WHERE rec.ip = ?"""
+        sql, params = _filter(sql, [ip], None, since, until)
+        sql += ' GROUP BY n.name, s.server, r.verdict ORDER BY min(r.time)'
+        return [AddressUse(*row) for row in self.conn.execute(sql, params)]
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return f"ObservationStore({self.path!r}, written={self.written}, pending={len(self._pending)})"
+
+
+def _normalize(name: str) -> str:
+    return name.rstrip('.').lower()
+
+def _server_of(event: ResponseEvent) -> str:
+    """sink 事件中指定的服务器，否则为响应的来源地址，端口不是 53 时带上端口"""
+    if event.server is not None:
+        return event.server
+    address = event.response.address
+    if not address:
+        return ''
+    return address[0] if address[1] == 53 else f'{address[0]}:{address[1]}'
+
+def _filter(sql: str, params: list, server: str | None, since: float | None, until: float | None) -> tuple[str, list]:
+    if server is not None:
+        sql += ' AND s.server = ?'
+        params.append(server)
+    if since is not None:
+        sql += ' AND r.time >= ?'
+        params.append(since)
+    if until is not None:
+        sql += ' AND r.time < ?'
+        params.append(until)
+    return sql, params
+
+
+def time_type(value: str) -> float:
+    """Unix 时间戳或 ISO 8601 日期/时间（本地时区）"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected a Unix timestamp or ISO 8601 time, got {value!r}')
+
+def _format_time(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog='dns-observe history',
+        description='Query observations stored with --db: when a name got poisoned, with which IPs, and where an IP showed up',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('db', help='SQLite database written with --db')
+    parser.add_argument('qname', nargs='?', help='domain to report on')
+    parser.add_argument('--ip', help='list the domains an address was returned for, instead of a domain report')
+    parser.add_argument('-s', '--dns_server', help='only this server, as stored (address, or address:port when not 53)')
+    parser.add_argument('--since', type=time_type, help='start time, Unix timestamp or ISO 8601')
+    parser.add_argument('--until', type=time_type, help='end time, Unix timestamp or ISO 8601')
+    parser.add_argument('--timeline', action='store_true', help='list every response of the domain instead of the forged addresses')
+    parser.add_argument('--json', action='store_true', help='one JSON object per line')
+    args = parser.parse_args(argv)
+    if (args.qname is None) == (args.ip is None):
+        parser.error('give either a domain or --ip')
+    try:
+        store = ObservationStore(args.db, readonly=True)
+        try:
+            if args.ip is not None:
+                rows = store.names_for_ip(args.ip, args.since, args.until)
+            elif args.timeline:
+                rows = store.history(args.qname, args.dns_server, args.since, args.until)
+            else:
+                rows = store.poisoning(args.qname, args.dns_server, args.since, args.until)
+        finally:
+            store.close()
+    except sqlite3.Error as e:
+        # 文件不存在、不是数据库或者不是 --db 写入的数据库
+        parser.error(f'cannot read {args.db}: {e}')
+    write = sys.stdout.write
+    for row in rows:
+        if args.json:
+            write(json.dumps(row._asdict(), ensure_ascii=False) + '\n')
+        elif isinstance(row, HistoryRow):
+            transport = f"  {row.transport.upper()}" if row.transport not in (None, 'udp') else ""
+            write(f"{_format_time(row.time)}  {row.server}  {row.qtype}{transport}  rcode={row.rcode}  {row.verdict or '-'}  {', '.join(row.answers)}\n")
+        elif isinstance(row, PoisonedAddress):
+            write(f"{row.server}  {row.ip}  first={_format_time(row.first_seen)}  last={_format_time(row.last_seen)}  count={row.count}\n")
+        else:
+            write(f"{row.qname}  {row.server}  {row.verdict or '-'}  first={_format_time(row.first_seen)}  last={_format_time(row.last_seen)}  count={row.count}\n")
@@ -0,0 +1,197 @@
+from __future__ import annotations
+from collections import defaultdict
+import select
+import socket
+import ssl
+import struct
+import time
+
+_length = struct.Struct('>H')
+
+
+class TCPConnection:
+    """
+    到一个 DNS 服务器的 TCP 连接，消息使用 RFC 7766 的 2 字节长度前缀
+
+    发送使用带超时的阻塞写；读取只在 select 报告可读后进行，一次 recv 可能包含多个消息，
+    也可能只有半个消息，不完整的部分留在缓冲区等待下一次读取。
+
+    传入 ssl_context 时为 DNS over TLS（RFC 7858）连接，session 为之前连接保存的 ssl.SSLSession，
+    服务器接受时跳过完整握手（session_reused 为 True）。
+    """
+
+    def __init__(self, address: tuple, timeout: float = 3, ssl_context: ssl.SSLContext | None = None,
+                 server_hostname: str | None = None, session: ssl.SSLSession | None = None):
+        self.address = address
+        self.timeout = timeout
+        sock = socket.create_connection(address, timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.tls = ssl_context is not None
+        if self.tls:
+            try:
+                sock = ssl_context.wrap_socket(sock, server_hostname=server_hostname or address[0], session=session)
+            except BaseException:
+                sock.close()
+                raise
+        self.sock = sock
+        self.local_address = self.sock.getsockname()
+        self.peer = self.sock.getpeername()   # 解析后的服务器地址
+        self.outstanding = 0            # 已发送但还没有收到响应的查询数量
+        self.last_used = time.monotonic()
+        self._buffer = bytearray()
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def send(self, messages: list[bytes]):
+        """把多个查询合并为一次写入（流水线）"""
+        self.sock.sendall(b''.join(_length.pack(len(message)) + message for message in messages))
+        self.outstanding += len(messages)
+        self.last_used = time.monotonic()
+
+    @property
+    def session(self) -> ssl.SSLSession | None:
+        """可用于恢复的 TLS 会话；TLS 1.3 的会话票据在握手之后才到达，读取过响应后才有"""
+        return self.sock.session if self.tls else None
+
+    @property
+    def session_reused(self) -> bool:
+        return self.tls and self.sock.session_reused
+
+    def _recv(self) -> bytes | None:
+        """
+        读取 socket 中已到达的数据，对端关闭时返回 b''
+
+        TLS 连接可读时可能只收到会话票据等非应用数据，此时返回 None；
+        解密后留在 SSL 缓冲区中的数据不会让 select 再次报告可读，所以一并取走。
+        """
+        if not self.tls:
+            return self.sock.recv(65536)
+        self.sock.setblocking(False)
+        try:
+            data = self.sock.recv(65536)
+            while self.sock.pending():
+                data += self.sock.recv(self.sock.pending())
+            return data
+        except ssl.SSLWantReadError:
+            return None
+        finally:
+            self.sock.settimeout(self.timeout)
+
+    def read(self) -> list[bytes]:
+        """读取已到达的数据，返回其中完整的消息；对端关闭连接时抛出 ConnectionError"""
+        data = self._recv()
+        if data is None:
+            return []
+        if not data:
+            raise ConnectionError('connection closed by server')
+        buffer = self._buffer
+        buffer += data
+        messages = []
+        offset = 0
+        while len(buffer) - offset >= 2:
+            (size,) = _length.unpack_from(buffer, offset)
+            if len(buffer) - offset - 2 < size:
+                break
+            messages.append(bytes(buffer[offset + 2:offset + 2 + size]))
+            offset += 2 + size
+        del buffer[:offset]
+        self.outstanding -= len(messages)
+        self.last_used = time.monotonic()
+        return messages
+
+    def is_stale(self, idle_timeout: float) -> bool:
+        """空闲太久，或者对端已经关闭（空闲连接上不应有响应，可读只可能是 EOF、RST 或 TLS 会话票据）"""
+        if time.monotonic() - self.last_used > idle_timeout:
+            return True
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+            return bool(readable) and self._recv() is not None
+        except (OSError, ValueError):
+            return True
+
+    def close(self):
+        self.sock.close()
+
+    def __repr__(self):
+        tls = ', tls' if self.tls else ''
+        return f'TCPConnection({self.address[0]}:{self.address[1]}{tls}, outstanding={self.outstanding})'
+
+
+class TCPPool:
+    """
+    按服务器地址保存的持久 TCP 连接池
+
+    acquire() 优先复用空闲的连接，失效的连接（空闲超过 idle_timeout 或已被服务器关闭）直接丢弃；
+    用完后 release() 放回，出错的连接用 discard() 关闭。每个服务器最多保留 max_connections 条空闲连接，
+    一条连接上最多同时有 max_pipeline 个未完成的查询。
+
+    传入 ssl_context 时为 DNS over TLS 连接池。每个服务器最近一次的 TLS 会话在连接关闭后仍然保留，
+    重新连接时用于会话恢复，省去完整握手；server_hostname 为 None 时用服务器地址验证证书。
+    """
+
+    def __init__(self, max_connections: int = 4, max_pipeline: int = 64, idle_timeout: float = 30, timeout: float = 3,
+                 ssl_context: ssl.SSLContext | None = None, server_hostname: str | None = None):
+        self.max_connections = max_connections
+        self.max_pipeline = max_pipeline
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        self.server_hostname = server_hostname
+        self._idle: defaultdict[tuple, list[TCPConnection]] = defaultdict(list)
+        self._sessions: dict[tuple, ssl.SSLSession] = {}
+        self.connects = 0   # 新建连接的次数
+        self.resumed = 0    # 其中恢复了 TLS 会话的次数
+
+    def acquire(self, address: tuple) -> TCPConnection:
+        idle = self._idle[address]
+        while idle:
+            conn = idle.pop()
+            if not conn.is_stale(self.idle_timeout):
+                return conn
+            self.discard(conn)
+        self.connects += 1
+        if self.ssl_context is None:
+            return TCPConnection(address, self.timeout)
+        conn = TCPConnection(address, self.timeout, self.ssl_context, self.server_hostname, self._sessions.get(address))
+        if conn.session_reused:
+            self.resumed += 1
+        return conn
+
+    def release(self, conn: TCPConnection):
+        """放回连接池；还有未完成查询的连接无法复用，直接关闭"""
+        idle = self._idle[conn.address]
+        if conn.outstanding or len(idle) >= self.max_connections:
+            self.discard(conn)
+        else:
+            self._remember(conn)
+            idle.append(conn)
+
+    def discard(self, conn: TCPConnection):
+        self._remember(conn)
+        conn.close()
+
+    def _remember(self, conn: TCPConnection):
+        if conn.tls:
+            try:
+                session = conn.session
+            except (OSError, ValueError):
+                return  # 连接已关闭
+            if session is not None:
+                self._sessions[conn.address] = session
+
+    def idle_count(self, address: tuple) -> int:
+        return len(self._idle.get(address, ()))
+
+    def close(self):
+        """关闭所有空闲连接，保存的 TLS 会话仍然保留"""
+        for idle in self._idle.values():
+            for conn in idle:
+                self.discard(conn)
+        self._idle.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
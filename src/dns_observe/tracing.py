@@ -0,0 +1,183 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, BinaryIO, Callable, Iterable
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+if TYPE_CHECKING:
+    from .dns import DNSQuery, DNSResponse
+
+# DNSQuery 中被追踪的阶段：(方法名, span 名称, 类别)
+QUERY_STAGES = (
+    ('query', 'query', 'query'),
+    ('query_many', 'query_many', 'query'),
+    ('query_servers', 'query_servers', 'query'),
+    ('query_tcp', 'query_tcp', 'query'),
+    ('query_many_tcp', 'query_many_tcp', 'query'),
+    ('query_tls', 'query_tls', 'query'),
+    ('query_many_tls', 'query_many_tls', 'query'),
+)
+PACKET_STAGES = (
+    ('_send', 'send', 'socket'),
+    ('_wait', 'wait', 'socket'),
+    ('_drain', 'recv', 'socket'),
+    ('_parse_packet', 'parse', 'packet'),
+)
+
+
+class Tracer:
+    """
+    span 事件的接收者
+
+    timestamp 为 time.perf_counter_ns()；同一线程中的 span 严格嵌套，span_end 与最近一个未结束的 span_start 对应。
+    """
+
+    def span_start(self, name: str, category: str, timestamp: int, args: dict | None = None):
+        pass
+
+    def span_end(self, name: str, category: str, timestamp: int):
+        pass
+
+    def close(self):
+        pass
+
+
+class ChromeTraceExporter(Tracer):
+    """
+    把 span 写成 Chrome trace-event JSON（B/E 事件），可用 chrome://tracing 或 Perfetto 打开
+
+    事件边产生边写入缓冲文件，close() 时补上数组结尾，内存占用与追踪时长无关。
+    """
+
+    def __init__(self, file: str | BinaryIO, buffering: int = 256 * 1024):
+        if isinstance(file, (str, os.PathLike)):
+            self._file = open(file, 'wb', buffering=buffering)
+            self._owns = True
+        else:
+            self._file = file
+            self._owns = False
+        self._pid = os.getpid()
+        self._origin = time.perf_counter_ns()   # 时间戳从创建 exporter 开始计算
+        self._lock = threading.Lock()
+        self._file.write(b'[\n')
+        self._first = True
+        self._closed = False
+        self.events = 0
+
+    def span_start(self, name: str, category: str, timestamp: int, args: dict | None = None):
+        event = {'name': name, 'cat': category, 'ph': 'B', 'ts': (timestamp - self._origin) / 1000,
+                 'pid': self._pid, 'tid': threading.get_ident()}
+        if args:
+            event['args'] = args
+        self._write(event)
+
+    def span_end(self, name: str, category: str, timestamp: int):
+        self._write({'name': name, 'cat': category, 'ph': 'E', 'ts': (timestamp - self._origin) / 1000,
+                     'pid': self._pid, 'tid': threading.get_ident()})
+
+    def _write(self, event: dict):
+        data = json.dumps(event, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        with self._lock:
+            if self._closed:
+                return  # close() 之后的事件直接丢弃
+            self._file.write(data if self._first else b',\n' + data)
+            self._first = False
+            self.events += 1
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._file.write(b'\n]\n')
+            if self._owns:
+                self._file.close()
+            else:
+                self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def install(dns: DNSQuery, tracer: Tracer):
+    """
+    在 dns 实例上用带追踪的包装替换各阶段的方法
+
+    只修改实例属性，没有设置 tracer 的 DNSQuery 不受任何影响。协程方法（AsyncDNSQuery.query）
+    在同一线程中并发执行，无法严格嵌套，只追踪其中的数据包阶段。
+    """
+    for method, name, category in QUERY_STAGES:
+        func = getattr(dns, method)
+        if inspect.iscoroutinefunction(func):
+            continue
+        setattr(dns, method, _traced(tracer, name, category, func, _query_args, _release_result))
+    for method, name, category in PACKET_STAGES:
+        setattr(dns, method, _traced(tracer, name, category, getattr(dns, method)))
+    dns._parse_packet = _tag_responses(tracer, dns._parse_packet)
+    dns._emit = _traced(tracer, 'output', 'packet', dns._emit)
+
+def uninstall(dns: DNSQuery):
+    """恢复 install 替换的方法"""
+    for method, _, _ in QUERY_STAGES + PACKET_STAGES + (('_emit', None, None),):
+        dns.__dict__.pop(method, None)
+    dns.tracer = None
+
+
+def _query_args(args: tuple) -> dict:
+    """query 的第一个参数是域名，query_many 是域名列表，query_servers 是服务器列表"""
+    if not args:
+        return {}
+    first = args[0]
+    if isinstance(first, str):
+        return {'qname': first}
+    if isinstance(first, (list, tuple)):
+        return {'count': len(first)}
+    return {}
+
+def release(responses: Iterable[DNSResponse]):
+    """查询结束后解除响应与 tracer 的关联，之后第一次访问记录区不再产生 span"""
+    for dns_resp in responses:
+        dns_resp._tracer = None
+
+def _release_result(result):
+    """query 返回 ResponseList，query_many/query_servers 返回 键 -> ResponseList"""
+    if isinstance(result, dict):
+        for responses in result.values():
+            release(responses)
+    elif result is not None:
+        release(result)
+
+def _traced(tracer: Tracer, name: str, category: str, func: Callable,
+            make_args: Callable[[tuple], dict] | None = None, after: Callable | None = None) -> Callable:
+    start, end, clock = tracer.span_start, tracer.span_end, time.perf_counter_ns
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start(name, category, clock(), make_args(args) if make_args is not None else None)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            end(name, category, clock())
+        if after is not None:
+            after(result)
+        return result
+    return wrapper
+
+def _tag_responses(tracer: Tracer, parse: Callable) -> Callable:
+    """
+    让解析出的响应带上 tracer：记录区延迟解析，decode span 在 DNSResponse._section 中第一次访问时记录，
+    没有被访问的 section 不会被解析，也没有 span
+    """
+    @functools.wraps(parse)
+    def wrapper(packet):
+        dns_resp = parse(packet)
+        if dns_resp is not None:
+            dns_resp._tracer = tracer
+        return dns_resp
+    return wrapper
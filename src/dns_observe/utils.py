@@ -4,23 +4,53 @@ import struct
 
 if TYPE_CHECKING:
     from .dns import DNSResponse
+    from .poison import PoisonIndex
 
 
 class ResponseList(list):
     """DNSResponse 列表，支持 fake/real 分类方法"""
 
-    def fakes(self) -> list[DNSResponse]:
-        """返回判定为伪造的响应列表（除最后一个外的所有响应）"""
+    def classify(self, index: PoisonIndex) -> ResponseList:
+        """按污染地址索引判定每个响应的 verdict"""
+        for response in self:
+            response.classify(index)
+        return self
+
+    def fakes(self, index: PoisonIndex | None = None) -> list[DNSResponse]:
+        """
+        返回判定为伪造的响应列表
+
+        没有 index 时为除最后一个外的所有响应，但不包括设置了 TC 位的响应：它是真实服务器的截断响应，
+        完整的响应通过 TCP 重新查询后追加在列表最后。有 index 时为 A/AAAA 答案命中索引的响应，
+        不受到达顺序影响，真实响应丢失或先到达时也能正确判定。已经判定过的响应直接使用其 verdict。
+        """
+        if index is not None:
+            return [response for response in self if _verdict(response, index) == 'fake']
         if len(self) > 1:
-            return self[:-1]
+            return [response for response in self[:-1] if not response.truncated]
         return []
 
-    def real(self) -> DNSResponse | None:
-        """返回判定为真实的响应（最后一个响应）"""
+    def real(self, index: PoisonIndex | None = None) -> DNSResponse | None:
+        """
+        返回判定为真实的响应
+
+        没有 index 时为最后一个响应；有 index 时为最后一个既未命中索引、也不是畸形的响应，没有时返回 None。
+        """
+        if index is not None:
+            for response in reversed(self):
+                if _verdict(response, index) not in ('fake', 'malformed'):
+                    return response
+            return None
         if len(self) > 0:
             return self[-1]
         return None
 
+def _verdict(response: DNSResponse, index: PoisonIndex) -> str | None:
+    """接收时已经判定过的响应不再重复解析答案区"""
+    if response.verdict is not None:
+        return response.verdict
+    return response.classify(index)
+
 def decompression_message1(buff: bytes, data: bytes) -> tuple[str, int]:
     parts = []
     _data = data
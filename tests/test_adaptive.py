@@ -0,0 +1,64 @@
+"""Test the adaptive early-termination listening window."""
+import asyncio
+import time
+import unittest
+from dns_observe import AsyncDNSQuery, DNSQuery, RecordType
+from test_query_many import LocalResponder
+
+
+class TestAdaptiveWindow(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalResponder(delay=0.05)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_deadline_is_precise(self):
+        """A socket timeout longer than wait_time does not overshoot the deadline."""
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.3, timeout=3)
+        start = time.monotonic()
+        responses = dns.query('example.com', RecordType.A)
+        elapsed = time.monotonic() - start
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(len(responses), 1)
+        self.assertGreaterEqual(responses.real().rtt, 0.05)
+
+    def test_stops_after_grace(self):
+        """Once the RTT profile is learned, listening ends a grace period after the answer."""
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=1, adaptive=True, grace=0.05)
+        # 第一次查询没有 RTT 画像，监听完整的 wait_time
+        start = time.monotonic()
+        dns.query('example.com')
+        self.assertGreaterEqual(time.monotonic() - start, 1)
+        self.assertIn('127.0.0.1:%d' % self.server.port, dns.rtt_profile)
+
+        start = time.monotonic()
+        responses = dns.query('example.com')
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(len(responses), 1)
+
+    def test_early_forged_reply_does_not_stop(self):
+        """A reply far faster than the learned RTT is not taken as the genuine answer."""
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.3, adaptive=True, grace=0.05)
+        dns.rtt_profile[dns.server_view] = 10
+        start = time.monotonic()
+        dns.query('example.com')
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+
+    def test_async_stops_after_grace(self):
+        """AsyncDNSQuery honours the same adaptive window."""
+        async def run():
+            dns = AsyncDNSQuery('127.0.0.1', port=self.server.port, wait_time=1, adaptive=True, grace=0.05)
+            dns.rtt_profile[dns.server_view] = 0.05
+            start = time.monotonic()
+            responses = await dns.query('example.com')
+            return time.monotonic() - start, responses
+
+        elapsed, responses = asyncio.run(run())
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(len(responses), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
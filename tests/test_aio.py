@@ -0,0 +1,97 @@
+"""Test AsyncDNSQuery against a local UDP responder."""
+import asyncio
+import socket
+import time
+import unittest
+from dns_observe import AsyncDNSQuery, RecordType
+from test_query_many import LocalResponder
+
+
+class TestAsyncDNSQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalResponder(delay=0.1)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_query(self):
+        """await query() gathers responses until the deadline."""
+        async def run():
+            async with AsyncDNSQuery('127.0.0.1', port=self.server.port, wait_time=0.3) as dns:
+                return await dns.query('abc.example.com', RecordType.A)
+
+        responses = asyncio.run(run())
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(responses.real().answer_RRs[0].data_view, '10.0.0.3')
+
+    def test_concurrent_queries(self):
+        """Many observations share one thread without blocking each other."""
+        async def run():
+            dns = AsyncDNSQuery('127.0.0.1', port=self.server.port, wait_time=0.5)
+            names = [f'host{i}.example.com' for i in range(100)]
+            return await asyncio.gather(*(dns.query(name) for name in names))
+
+        start = time.time()
+        results = asyncio.run(run())
+        elapsed = time.time() - start
+        self.assertLess(elapsed, 2)
+        self.assertEqual(len(results), 100)
+        self.assertTrue(all(len(responses) == 1 for responses in results))
+
+    def test_close_pools(self):
+        """close() releases the connection pools the client owns."""
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        self.addCleanup(listener.close)
+        dns = AsyncDNSQuery('127.0.0.1', port=self.server.port)
+        conn = dns.tcp_pool.acquire(listener.getsockname())
+        dns.tcp_pool.release(conn)
+        dns.close()
+        self.assertEqual(dns.tcp_pool.idle_count(listener.getsockname()), 0)
+        self.assertEqual(conn.sock.fileno(), -1)
+
+    def test_query_many(self):
+        """await query_many() returns a dict in input order, like DNSQuery.query_many()."""
+        async def run():
+            dns = AsyncDNSQuery('127.0.0.1', port=self.server.port, wait_time=0.3)
+            return await dns.query_many(['a.example.com', 'abc.example.com', 'a.example.com'])
+
+        results = asyncio.run(run())
+        self.assertEqual(list(results), ['a.example.com', 'abc.example.com'])
+        self.assertEqual(results['abc.example.com'].real().answer_RRs[0].data_view, '10.0.0.3')
+
+    def test_query_servers(self):
+        """await query_servers() groups responses by source address within one window."""
+        second = LocalResponder(delay=0.2, host='127.0.0.2', port=self.server.port, prefix='10.0.2')
+        self.addCleanup(second.close)
+
+        async def run():
+            dns = AsyncDNSQuery(port=self.server.port, wait_time=0.5)
+            return await dns.query_servers(['127.0.0.1', '127.0.0.2'], 'abc.example.com')
+
+        start = time.time()
+        results = asyncio.run(run())
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(list(results), ['127.0.0.1', '127.0.0.2'])
+        self.assertEqual(results['127.0.0.1'].real().answer_RRs[0].data_view, '10.0.0.3')
+        self.assertEqual(results['127.0.0.2'].real().answer_RRs[0].data_view, '10.0.2.3')
+
+    def test_tcp_fallback_rejected(self):
+        """The blocking TCP fallback is off by default and cannot be turned on."""
+        self.assertFalse(AsyncDNSQuery('127.0.0.1').tcp_fallback)
+        with self.assertRaises(ValueError):
+            AsyncDNSQuery('127.0.0.1', tcp_fallback=True)
+
+    def test_blocking_methods(self):
+        """Inherited TCP/TLS methods refuse to run instead of stalling the loop."""
+        dns = AsyncDNSQuery('127.0.0.1', port=self.server.port)
+        for method, args in (('query_tcp', ('a.com',)), ('query_many_tcp', (['a.com'],)),
+                             ('query_tls', ('a.com',)), ('query_many_tls', (['a.com'],))):
+            with self.subTest(method=method), self.assertRaises(NotImplementedError):
+                getattr(dns, method)(*args)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+"""Test offline analysis of pcap and pcapng captures."""
+import unittest
+import contextlib
+import io
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+from dns_observe import DNSQuery, PcapWriter, RecordType
+from dns_observe.analyze import analyze_capture, main as analyze_main
+from dns_observe.pcap import read_capture, iter_udp
+from test_query_many import build_answer
+
+CLIENT = ('192.0.2.10', 40000)
+SERVER = ('198.51.100.1', 53)
+
+
+def query_packet(qname, tid):
+    return bytes(DNSQuery()._build_request(qname, RecordType.A, tid))
+
+
+def ethernet_udp(payload, src, dst, vlan=False):
+    """An Ethernet/IPv4/UDP frame, optionally 802.1Q tagged."""
+    udp = struct.pack('!HHHH', src[1], dst[1], 8 + len(payload), 0) + payload
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0,
+                     socket.inet_aton(src[0]), socket.inet_aton(dst[0]))
+    ether = b'\x00' * 12 + (b'\x81\x00\x00\x01' if vlan else b'') + b'\x08\x00'
+    return ether + ip + udp
+
+
+def pcapng_block(block_type, body):
+    body += b'\x00' * (-len(body) % 4)
+    length = 12 + len(body)
+    return struct.pack('<II', block_type, length) + body + struct.pack('<I', length)
+
+
+class TestAnalyzeCapture(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.pcap')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write_session(self):
+        query = query_packet('twitter.com', 0x1234)
+        with PcapWriter(self.path) as capture:
+            capture.write_udp(query, CLIENT, SERVER, 100.0)
+            capture.write_udp(build_answer(query, '10.0.0.1'), SERVER, CLIENT, 100.01)   # 伪造
+            capture.write_udp(b'\x12', SERVER, CLIENT, 100.02)                            # 畸形
+            capture.write_udp(build_answer(query, '10.0.0.2'), SERVER, CLIENT, 100.2)    # 真实
+            capture.write_udp(b'not dns', ('192.0.2.10', 1000), ('192.0.2.11', 2000), 100.3)
+            capture.write_udp(build_answer(query_packet('x.com', 7), '10.0.0.3'), SERVER, CLIENT, 100.4)
+
+    def test_pair_and_classify(self):
+        self.write_session()
+        observations = list(analyze_capture(self.path))
+        self.assertEqual(len(observations), 2)
+
+        unmatched, observation = observations
+        self.assertIsNone(unmatched.query)
+        self.assertEqual(unmatched.responses[0].qname, 'x.com')
+
+        self.assertEqual(observation.query.qname, 'twitter.com')
+        self.assertEqual((observation.client, observation.server), (CLIENT, SERVER))
+        fake, real = observation.responses
+        self.assertEqual((fake.verdict, real.verdict), ('fake', 'real'))
+        self.assertEqual(real.answer_RRs[0].data_view, '10.0.0.2')
+        self.assertAlmostEqual(fake.rtt, 0.01, places=6)
+        self.assertAlmostEqual(real.rtt, 0.2, places=6)
+        self.assertEqual(real.address, SERVER)
+        self.assertIsInstance(real._response, memoryview)
+
+    def test_window(self):
+        """Responses after the window are not paired with the query."""
+        query = query_packet('twitter.com', 1)
+        with PcapWriter(self.path) as capture:
+            capture.write_udp(query, CLIENT, SERVER, 100.0)
+            capture.write_udp(build_answer(query, '10.0.0.1'), SERVER, CLIENT, 100.5)
+            capture.write_udp(build_answer(query, '10.0.0.2'), SERVER, CLIENT, 103.0)
+        observations = list(analyze_capture(self.path, window=2))
+        self.assertEqual([len(o.responses) for o in observations], [1, 1])
+        self.assertIsNone(observations[1].query)
+
+    def test_cli_jsonl(self):
+        self.write_session()
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            analyze_main([self.path, '-f', 'jsonl'])
+        rows = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual([(r['qname'], r['verdict'], r['data']) for r in rows],
+                         [('x.com', 'real', '10.0.0.3'), ('twitter.com', 'fake', '10.0.0.1'), ('twitter.com', 'real', '10.0.0.2')])
+        self.assertEqual(rows[1]['server'], '198.51.100.1:53')
+
+
+class TestCaptureFormats(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_pcap_big_endian_ethernet(self):
+        frame = ethernet_udp(b'payload', CLIENT, SERVER)
+        with open(self.path, 'wb') as f:
+            f.write(struct.pack('>IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+            f.write(struct.pack('>IIII', 100, 250000, len(frame), len(frame)) + frame)
+        [datagram] = iter_udp(read_capture(self.path))
+        self.assertEqual(datagram.timestamp, 100.25)
+        self.assertEqual((datagram.src, datagram.dst), (CLIENT, SERVER))
+        self.assertEqual(bytes(datagram.payload), b'payload')
+
+    def test_pcapng(self):
+        frames = [ethernet_udp(b'first', CLIENT, SERVER), ethernet_udp(b'second', SERVER, CLIENT, vlan=True)]
+        shb = pcapng_block(0x0a0d0d0a, struct.pack('<IHHq', 0x1a2b3c4d, 1, 0, -1))
+        # if_tsresol = 9 -> 纳秒
+        idb = pcapng_block(1, struct.pack('<HHI', 1, 0, 0) + struct.pack('<HHB3x', 9, 1, 9) + struct.pack('<HH', 0, 0))
+        data = shb + idb
+        for i, frame in enumerate(frames):
+            ts = 1_700_000_000_500_000_000 + i
+            data += pcapng_block(6, struct.pack('<IIIII', 0, ts >> 32, ts & 0xffffffff, len(frame), len(frame)) + frame)
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        datagrams = list(iter_udp(read_capture(self.path)))
+        self.assertEqual([bytes(d.payload) for d in datagrams], [b'first', b'second'])
+        self.assertAlmostEqual(datagrams[0].timestamp, 1_700_000_000.5, places=6)
+        self.assertEqual(datagrams[1].src, SERVER)
+
+    def test_port_filter(self):
+        frame = ethernet_udp(b'x', ('192.0.2.1', 1000), ('192.0.2.2', 2000))
+        with open(self.path, 'wb') as f:
+            f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+            f.write(struct.pack('<IIII', 1, 0, len(frame), len(frame)) + frame)
+        self.assertEqual(list(iter_udp(read_capture(self.path))), [])
+        self.assertEqual(len(list(iter_udp(read_capture(self.path), port=None))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
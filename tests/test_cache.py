@@ -0,0 +1,108 @@
+"""Test the TTL-aware observation cache in front of DNSQuery.query."""
+import unittest
+import asyncio
+import time
+from dns_observe import AsyncDNSQuery, DNSQuery, ObservationCache, PoisonIndex, RecordType
+from dns_observe.simulator import Injection, PollutionServer
+from dns_observe.utils import ResponseList
+from test_poison import response
+
+ZONE = {
+    'twitter.com': {'A': ['104.244.42.1']},
+    'example.com': {'A': ['93.184.216.34', '93.184.216.35']},
+    'example.org': {'A': ['93.184.216.36']},
+}
+
+
+class TestObservationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.server = PollutionServer(ZONE, delay=0.02, ttl=120, injections=[Injection(delay=0.005, ttl=247)],
+                                      polluted=['twitter.com']).start()
+        self.cache = ObservationCache(maxsize=2, max_ttl=300, poisoned_ttl=30, negative_ttl=10)
+        self.dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.1, timeout=0.05, cache=self.cache)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_hit_within_ttl(self):
+        first = self.dns.query('example.com')
+        start = time.perf_counter()
+        second = self.dns.query('EXAMPLE.com')
+        self.assertLess(time.perf_counter() - start, 0.001)
+        self.assertEqual(self.server.queries, 1)
+        self.assertEqual(second, first)
+        self.assertIsNot(second, first)
+        info = self.cache.cache_info()
+        self.assertEqual((info.hits, info.misses, info.size), (1, 1, 1))
+        # 不同的类型和服务器分别缓存
+        self.dns.query('example.com', RecordType.AAAA)
+        self.assertEqual(self.server.queries, 2)
+
+    def test_ttl_rules(self):
+        self.assertEqual(self.cache.put(('s', 'example.com', 1), self.dns.query('example.com')), 120)
+        # 伪造响应 TTL 为 247，真实响应为 120，收到伪造响应时不超过 poisoned_ttl
+        self.assertEqual(self.cache.ttl_for(self.dns.query('twitter.com')), 30)
+        self.assertEqual(self.cache.ttl_for(self.dns.query('missing.example.com')), 10)
+        self.cache.max_ttl = 5
+        self.assertEqual(self.cache.ttl_for(self.dns.query('example.org')), 5)
+
+    def test_poisoned_without_genuine(self):
+        self.server.delay = 1   # 真实响应在监听窗口之后才到达
+        cache = ObservationCache(poisoned_ttl=30, poison=PoisonIndex(['31.13.94.0/24']))
+        responses = self.dns.query('twitter.com')
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(cache.ttl_for(responses), 30)
+        # 没有收到响应的结果不缓存
+        self.assertEqual(cache.put(('s', 'x', 1), ResponseList()), 0)
+        self.assertEqual(len(cache), 0)
+
+    def test_malformed_forged_reply(self):
+        index = PoisonIndex(['31.13.94.0/24'])
+        cache = ObservationCache(poisoned_ttl=30, poison=index)
+        # 截断 RDATA 的伪造响应，接收时判定为 malformed
+        forged = DNSQuery()._parse_response(response('31.13.94.41')._response[:-2])
+        genuine = response('104.244.42.1')
+        self.assertEqual(cache.put(('s', 'twitter.com', 1), ResponseList([forged, genuine])), 30)
+        self.assertEqual(forged.verdict, 'malformed')
+        self.assertEqual(cache.get(('s', 'twitter.com', 1)).real(index).answer_RRs[0].data_view, '104.244.42.1')
+
+    def test_detached_copies(self):
+        # 引用接收 arena 的响应在缓存中保存为独立的副本
+        packet = self.dns.query_many(['example.com'])['example.com'][0]._response
+        self.assertIs(type(packet), bytes)   # query_many 的结果已经不引用 arena
+        responses = ResponseList([self.dns._parse_response(memoryview(bytearray(packet)))])
+        self.cache.put(('s', 'example.com', 1), responses)
+        cached = self.cache.get(('s', 'example.com', 1))
+        self.assertIs(type(cached[0]._response), bytes)
+        self.assertEqual([r.data_view for r in cached[0].answer_RRs], ['93.184.216.34', '93.184.216.35'])
+        self.assertIs(cached[0].detach(), cached[0])
+
+    def test_lru_and_expiry(self):
+        self.dns.query('example.com')
+        self.dns.query('example.org')
+        self.dns.query('example.com')          # 命中，移到最近使用
+        self.dns.query('missing.example.com')  # 淘汰 example.org
+        self.assertEqual(self.cache.cache_info().evictions, 1)
+        self.dns.query('example.com')
+        self.assertEqual(self.server.queries, 3)
+        self.cache.max_ttl = 0.05
+        self.cache.clear()
+        self.dns.query('example.com')
+        time.sleep(0.06)
+        self.dns.query('example.com')
+        self.assertEqual(self.cache.cache_info().expirations, 1)
+        self.assertEqual(self.server.queries, 5)
+
+    def test_async_query(self):
+        dns = AsyncDNSQuery('127.0.0.1', port=self.server.port, wait_time=0.1, cache=self.cache)
+
+        async def run():
+            return await dns.query('example.com'), await dns.query('example.com')
+        first, second = asyncio.run(run())
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.queries, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+"""Check the checked-in benchmark corpus still parses and matches its builders."""
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'benchmarks'))
+
+from corpus import build_corpus, load_corpus
+from dns_observe import DNSQuery
+
+
+class TestCorpus(unittest.TestCase):
+
+    def test_corpus_up_to_date(self):
+        self.assertEqual(load_corpus(), dict(sorted(build_corpus().items())))
+
+    def test_corpus_decodes(self):
+        dns = DNSQuery()
+        for name, packet in load_corpus().items():
+            with self.subTest(name=name):
+                dns_resp = dns._parse_response(packet)
+                records = dns_resp.answer_RRs + dns_resp.authority_RRs + dns_resp.additional_RRs
+                self.assertEqual(len(records), dns_resp.answer_n + dns_resp.authority_n + dns_resp.additional_n)
+                for record in records:
+                    self.assertTrue(record.data_view)
+
+
+if __name__ == '__main__':
+    unittest.main()
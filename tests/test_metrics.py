@@ -0,0 +1,109 @@
+"""Test the metrics subsystem and the /metrics endpoint."""
+import unittest
+import urllib.error
+import urllib.request
+from dns_observe import DNSQuery, Metrics, MetricsServer, PoisonIndex
+from dns_observe.metrics import Counter, Histogram
+from dns_observe.simulator import Injection, PollutionServer
+from dns_observe.utils import ResponseList
+from test_poison import response
+
+ZONE = {'twitter.com': {'A': ['104.244.42.1']}, 'example.com': {'A': ['93.184.216.34']}}
+
+
+class TestInstruments(unittest.TestCase):
+
+    def test_counter(self):
+        counter = Counter('requests_total', 'Requests.', ('server',))
+        counter.inc(('a',))
+        counter.inc(('a',), 2)
+        counter.inc(('b"\\',))
+        self.assertEqual(counter.value(('a',)), 3)
+        self.assertEqual(counter.samples()[1], ('requests_total', (('server', 'b"\\'),), 1))
+
+    def test_histogram_buckets(self):
+        histogram = Histogram('rtt_seconds', 'RTT.', (0.01, 0.1, 1))
+        for value in (0.005, 0.01, 0.05, 2):
+            histogram.observe(value)
+        samples = {(name, labels): value for name, labels, value in histogram.samples()}
+        # 桶的上界包含在内，累积计数
+        self.assertEqual(samples[('rtt_seconds_bucket', (('le', '0.01'),))], 2)
+        self.assertEqual(samples[('rtt_seconds_bucket', (('le', '0.1'),))], 3)
+        self.assertEqual(samples[('rtt_seconds_bucket', (('le', '1'),))], 3)
+        self.assertEqual(samples[('rtt_seconds_bucket', (('le', '+Inf'),))], 4)
+        self.assertEqual(samples[('rtt_seconds_count', ())], 4)
+        self.assertAlmostEqual(samples[('rtt_seconds_sum', ())], 2.065)
+        self.assertEqual(histogram.count(), 4)
+
+
+class TestQueryMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.server = PollutionServer(ZONE, delay=0.03, injections=[Injection(delay=0.005), Injection(delay=0.01)],
+                                      polluted=['twitter.com']).start()
+        self.metrics = Metrics()
+        self.dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.15, timeout=0.05, metrics=self.metrics)
+        self.label = (f'127.0.0.1:{self.server.port}',)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_query(self):
+        self.dns.query('twitter.com')
+        self.dns.query('missing.example.com')
+        m = self.metrics
+        self.assertEqual(m.probes.value(self.label), 2)
+        self.assertEqual(m.responses.value(self.label + (0,)), 3)
+        self.assertEqual(m.responses.value(self.label + (3,)), 1)
+        self.assertEqual(m.forged.value(self.label), 2)
+        self.assertEqual(m.first_rtt.count(self.label), 2)
+        self.assertEqual(m.last_rtt.count(self.label), 2)
+        self.assertEqual(m.parse_time.count(), 4)
+        # 伪造响应先到，首个响应的 RTT 小于真实响应
+        first = m.first_rtt._values[self.label][-1]
+        last = m.last_rtt._values[self.label][-1]
+        self.assertLess(first, last)
+
+    def test_query_many_and_unanswered(self):
+        self.dns.query_many(['twitter.com', 'example.com'])
+        self.assertEqual(self.metrics.probes.value(self.label), 2)
+        self.assertEqual(self.metrics.forged.value(self.label), 2)
+        self.server.close()
+        self.dns.query('example.com')
+        self.assertEqual(self.metrics.unanswered.value(self.label), 1)
+
+    def test_poison_verdicts(self):
+        index = PoisonIndex(['31.13.94.0/24'])
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.15, timeout=0.05, metrics=self.metrics, poison=index)
+        self.assertEqual(len(dns.query('twitter.com')), 3)
+        self.assertEqual(self.metrics.forged.value(self.label), 2)
+        # 截断 RDATA 的伪造响应计入 malformed，不会在窗口结束时抛出异常
+        forged = DNSQuery()._parse_response(response('31.13.94.41')._response[:-2])
+        forged.classify(index)
+        genuine = response('104.244.42.1')
+        genuine.classify(index)
+        genuine.rtt = 0.03
+        self.metrics.observe_probe('resolver', ResponseList([forged, genuine]), index)
+        self.assertEqual(self.metrics.malformed.value(('resolver',)), 1)
+        self.assertEqual(self.metrics.forged.value(('resolver',)), 0)
+        self.assertEqual(self.metrics.last_rtt.count(('resolver',)), 1)
+
+    def test_endpoint(self):
+        self.dns.query('twitter.com')
+        with MetricsServer(self.metrics, port=0) as server:
+            url = f'http://127.0.0.1:{server.port}/metrics'
+            with urllib.request.urlopen(url) as response:
+                self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+                text = response.read().decode()
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(f'http://127.0.0.1:{server.port}/')
+        self.assertIn('# TYPE dns_observe_probes_total counter', text)
+        self.assertIn(f'dns_observe_probes_total{{server="{self.label[0]}"}} 1\n', text)
+        self.assertIn(f'dns_observe_responses_total{{server="{self.label[0]}",rcode="0"}} 3\n', text)
+        self.assertIn(f'dns_observe_forged_responses_total{{server="{self.label[0]}"}} 2\n', text)
+        self.assertIn(f'dns_observe_first_response_seconds_bucket{{server="{self.label[0]}",le="+Inf"}} 1\n', text)
+        self.assertIn('dns_observe_parse_seconds_count 3\n', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+"""Test the monitor daemon: timer wheel, watch list loading and continuous probing."""
+import unittest
+import contextlib
+import io
+import os
+import tempfile
+import threading
+from dns_observe import DNSQuery, QueueSink, RecordType
+from dns_observe.monitor import Monitor, TimerWheel, WatchEntry, load_watchlist
+from dns_observe.simulator import Injection, PollutionServer
+
+ZONE = {
+    'twitter.com': {'A': ['104.244.42.1']},
+    'example.com': {'A': ['93.184.216.34'], 'MX': ['10 mail.example.com']},
+}
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def test_expire_in_order(self):
+        wheel = TimerWheel(tick=0.1, slots=8, now=0)
+        wheel.schedule('b', 0.25, now=0)
+        wheel.schedule('a', 0.05, now=0)
+        self.assertEqual(wheel.advance(0.05), [])
+        self.assertEqual(wheel.advance(0.1), ['a'])
+        self.assertEqual(wheel.advance(0.29), [])
+        self.assertEqual(wheel.advance(0.3), ['b'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_multiple_rounds(self):
+        # 8 个槽 × 0.1 秒为一圈，2.05 秒的定时器要在槽中留过两圈
+        wheel = TimerWheel(tick=0.1, slots=8, now=0)
+        wheel.schedule('long', 2.05, now=0)
+        wheel.schedule('short', 0.5, now=0)
+        expired = []
+        for i in range(1, 30):
+            expired += [(key, round(i * 0.1, 1)) for key in wheel.advance(i * 0.1)]
+        self.assertEqual(expired, [('short', 0.5), ('long', 2.1)])
+
+    def test_stall_and_cancel(self):
+        wheel = TimerWheel(tick=0.1, slots=4, now=0)
+        for i in range(10):
+            wheel.schedule(i, i * 0.3, now=0)
+        self.assertTrue(wheel.cancel(3))
+        self.assertFalse(wheel.cancel(3))
+        self.assertNotIn(3, wheel)
+        # 停顿超过一圈后一次取出所有到期的定时器
+        self.assertEqual(sorted(wheel.advance(10)), [0, 1, 2, 4, 5, 6, 7, 8, 9])
+        # 过去的时间按下一个 tick 处理
+        wheel.schedule('late', -5, now=10)
+        self.assertEqual(wheel.advance(10.1), ['late'])
+
+
+class TestWatchlist(unittest.TestCase):
+
+    def test_load(self):
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w') as f:
+            f.write('# watch list\ntwitter.com\nexample.com mx 30  # mail\n\nexample.com MX 10\n')
+        try:
+            entries = load_watchlist(path, interval=120)
+        finally:
+            os.remove(path)
+        self.assertEqual(entries, [WatchEntry('twitter.com', RecordType.A, 120), WatchEntry('example.com', RecordType.MX, 10)])
+
+
+class TestMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.server = PollutionServer(ZONE, delay=0.02, injections=[Injection(delay=0.005)], polluted=['twitter.com']).start()
+        self.sink = QueueSink()
+        self.dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.15, sinks=[self.sink])
+        self.probes = []
+        self.monitor = Monitor(self.dns, tick=0.02, on_probe=lambda entry, responses: self.probes.append((entry, responses)))
+
+    def tearDown(self):
+        self.monitor.close()
+        self.server.close()
+
+    def test_probe_on_interval(self):
+        self.monitor.reload([WatchEntry('twitter.com', RecordType.A, 0.2), WatchEntry('example.com', RecordType.MX, 0.2)])
+        self.monitor.run(0.5)
+        # 每项在 0.5 秒内约探测 2-3 次，退出前收完所有监听窗口
+        self.assertGreaterEqual(self.monitor.probes_sent, 4)
+        self.assertEqual(self.monitor.probes_done, self.monitor.probes_sent)
+        self.assertEqual(self.server.queries, self.monitor.probes_sent)
+        for entry, responses in self.probes:
+            if entry.name == 'twitter.com':
+                self.assertEqual(len(responses), 2)
+                self.assertEqual(responses.real().answer_RRs[0].data_view, '104.244.42.1')
+            else:
+                self.assertEqual(responses.real().answer_RRs[0].data_view, '(10) mail.example.com')
+        # 所有响应都实时交给了 sink
+        events = self.sink.drain()
+        self.assertEqual(len(events), self.monitor.responses)
+        self.assertEqual({event.qname for event in events}, {'twitter.com', 'example.com'})
+
+    def test_reload_keeps_inflight(self):
+        self.server.delay = 0.1
+        self.monitor.reload([WatchEntry('twitter.com', RecordType.A, 10)])
+        self.monitor.run(0.05)
+        self.assertEqual((self.monitor.probes_sent, len(self.probes)), (1, 1))
+        # 第一次探测在 run 中已经结束，再发一次后在监听窗口内移除该项
+        self.monitor.wheel.schedule(('twitter.com', RecordType.A), 0)
+        timer = threading.Timer(0.05, self.monitor.request_reload)
+        self.monitor.loader = lambda: [WatchEntry('example.com', RecordType.A, 10)]
+        timer.start()
+        self.monitor.run(0.3)
+        timer.join()
+        self.assertNotIn(('twitter.com', RecordType.A), self.monitor.entries)
+        twitter = [responses for entry, responses in self.probes if entry.name == 'twitter.com']
+        self.assertEqual(len(twitter), 2)
+        # 重新加载发生在真实响应到达之前，它仍被收集
+        self.assertEqual(twitter[1].real().answer_RRs[0].data_view, '104.244.42.1')
+        self.assertIn('example.com', [entry.name for entry, _ in self.probes])
+
+    def test_failed_reload_keeps_list(self):
+        watchlist = [WatchEntry('example.com', RecordType.A, 10)]
+        self.monitor.reload(watchlist)
+
+        def loader():
+            return load_watchlist(os.path.join(tempfile.gettempdir(), 'missing-watchlist.txt'))
+
+        self.monitor.loader = loader
+        self.monitor.request_reload()
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            self.monitor.run(0.05)
+        self.assertIn('keeping the current watch list', err.getvalue())
+        self.assertEqual(list(self.monitor.entries.values()), watchlist)
+        self.assertEqual(self.monitor.probes_sent, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+"""Test wire-format parsing of DNS responses."""
+import socket
+import struct
+import unittest
+from dns_observe import DNSQuery, RecordType
+
+
+def encode_name(name: str) -> bytes:
+    return b''.join(struct.pack('>B', len(p)) + p.encode() for p in name.split('.')) + b'\x00'
+
+
+def build_response(answers: list[bytes], qname: str = 'example.com', qtype: int = RecordType.A) -> bytes:
+    header = struct.pack('>HHHHHH', 0x1234, 0x8180, 1, len(answers), 0, 0)
+    question = encode_name(qname) + struct.pack('>HH', qtype, 1)
+    return header + question + b''.join(answers)
+
+
+def rr(rtype: int, rdata: bytes, name: bytes = b'\xc0\x0c', ttl: int = 60) -> bytes:
+    return name + struct.pack('>HHLH', rtype, 1, ttl, len(rdata)) + rdata
+
+
+class TestParseResponse(unittest.TestCase):
+
+    def setUp(self):
+        self.dns = DNSQuery()
+
+    def test_rdata_is_view_of_packet(self):
+        """RDATA is a memoryview into the datagram, bytes only on request."""
+        packet = build_response([rr(RecordType.A, socket.inet_aton('1.2.3.4'))])
+        record = self.dns._parse_response(packet).answer_RRs[0]
+
+        self.assertIsInstance(record.data, memoryview)
+        self.assertIs(record.data.obj, packet)
+        self.assertEqual(record.data_bytes, b'\x01\x02\x03\x04')
+        self.assertEqual(record.data_length, 4)
+        self.assertEqual(record.A, '1.2.3.4')
+
+    def test_question_and_names(self):
+        """Question and compressed owner/target names are decoded."""
+        packet = build_response([
+            rr(RecordType.CNAME, b'\x03cdn\xc0\x0c'),
+            rr(RecordType.MX, b'\x00\x0a\x02mx\xc0\x0c'),
+        ], qname='www.example.com')
+        dns_resp = self.dns._parse_response(packet)
+
+        self.assertEqual((dns_resp.qname, dns_resp.qtype, dns_resp.qclass), ('www.example.com', RecordType.A, 1))
+        cname, mx = dns_resp.answer_RRs
+        self.assertEqual(cname.name, 'www.example.com')
+        self.assertEqual(cname.CNAME, 'cdn.www.example.com')
+        self.assertEqual(mx.data_view, '(10) mx.www.example.com')
+
+    def test_pointer_loop(self):
+        """A compression pointer loop is rejected instead of recursing forever."""
+        packet = build_response([rr(RecordType.A, b'\x01\x02\x03\x04', name=b'\xc0\x21')])
+        packet = packet[:0x21] + b'\xc0\x21' + packet[0x23:]
+        with self.assertRaises(IndexError):
+            self.dns._parse_response(packet).answer_RRs
+
+    def test_truncated_rdata(self):
+        """RDATA running past the end of the datagram is rejected."""
+        packet = build_response([rr(RecordType.A, socket.inet_aton('1.2.3.4'))])[:-2]
+        with self.assertRaises(IndexError):
+            self.dns._parse_response(packet).answer_RRs
+
+
+
+class TestLazyDecoding(unittest.TestCase):
+
+    def setUp(self):
+        self.dns = DNSQuery()
+
+    def test_sections_decoded_on_access(self):
+        """Only the header is decoded until a section is accessed."""
+        packet = build_response([rr(RecordType.A, socket.inet_aton('1.2.3.4'))])
+        # 破坏 answer 记录的名字，只有解析 answer section 时才会出错
+        packet = packet[:29] + b'\xc0\xff' + packet[31:]
+        dns_resp = self.dns._parse_response(packet)
+        self.assertEqual(dns_resp.answer_n, 1)
+        self.assertEqual(dns_resp.rcode, 0)
+        with self.assertRaises(IndexError):
+            dns_resp.answer_RRs
+
+    def test_later_section_skips_earlier(self):
+        """Authority records are found without decoding the answers."""
+        header = struct.pack('>HHHHHH', 1, 0x8180, 1, 2, 1, 0)
+        question = encode_name('example.com') + struct.pack('>HH', RecordType.A, 1)
+        answers = rr(RecordType.A, b'\x01\x02\x03\x04') + rr(RecordType.A, b'\x05\x06\x07\x08')
+        soa = b'\x02ns\xc0\x0c\x04root\xc0\x0c' + struct.pack('>IIIII', 2024, 7200, 3600, 1209600, 300)
+        packet = header + question + answers + rr(RecordType.SOA, soa)
+        dns_resp = self.dns._parse_response(packet)
+
+        soa_record = dns_resp.authority_RRs[0]
+        self.assertIsNone(dns_resp._sections[0])
+        self.assertNotIn('_fields', soa_record.__dict__)
+        self.assertEqual(soa_record.MNAME, 'ns.example.com')
+        self.assertEqual(soa_record.MINIMUM, 300)
+        self.assertEqual([r.A for r in dns_resp.answer_RRs], ['1.2.3.4', '5.6.7.8'])
+        self.assertEqual(dns_resp.additional_RRs, [])
+
+
+
+class TestNameCache(unittest.TestCase):
+
+    def test_shared_suffix_decoded_once(self):
+        """Pointer targets are decoded once per message and reused."""
+        from dns_observe.dns import decompression_message
+        packet = build_response([
+            rr(RecordType.NS, b'\x01a\x0cgtld-servers\x03net\x00'),
+            rr(RecordType.NS, b'\x01b\xc0\x23'),
+            rr(RecordType.NS, b'\x01c\xc0\x23'),
+        ], qname='com', qtype=RecordType.NS)
+        dns_resp = DNSQuery()._parse_response(packet)
+
+        self.assertEqual([r.NS for r in dns_resp.answer_RRs],
+                         ['a.gtld-servers.net', 'b.gtld-servers.net', 'c.gtld-servers.net'])
+        self.assertEqual(dns_resp._names, {0x0c: 'com', 0x23: 'gtld-servers.net'})
+        # decompression_message 复用同一个缓存
+        self.assertEqual(decompression_message(packet, b'\x01d\xc0\x23', dns_resp._names), ('d.gtld-servers.net', 4))
+
+
+
+class TestRecordRegistry(unittest.TestCase):
+
+    def test_builtin_types_registered(self):
+        from dns_observe import RECORD_DECODERS
+        from dns_observe.dns import DNSRecordTypeA, DNSRecordTypeSOA
+        self.assertIs(RECORD_DECODERS[RecordType.A], DNSRecordTypeA)
+        self.assertIs(RECORD_DECODERS[RecordType.SOA], DNSRecordTypeSOA)
+
+    def test_register_custom_type(self):
+        """A registered PTR decoder is used for PTR records."""
+        from dns_observe import RECORD_DECODERS, DNSResourceRecord, register_record_type
+
+        @register_record_type(RecordType.PTR)
+        class PTRRecord(DNSResourceRecord):
+            @property
+            def data_view(self) -> str:
+                return self._read_name()[0]
+
+        self.addCleanup(RECORD_DECODERS.pop, RecordType.PTR)
+        packet = build_response([rr(RecordType.PTR, b'\x03one\x03one\x03one\x03one\x00')],
+                                qname='1.1.1.1.in-addr.arpa', qtype=RecordType.PTR)
+        record = DNSQuery()._parse_response(packet).answer_RRs[0]
+
+        self.assertIsInstance(record, PTRRecord)
+        self.assertEqual(record.type_name, 'PTR')
+        self.assertEqual(record.data_view, 'one.one.one.one')
+
+    def test_unregistered_type(self):
+        """Types without a decoder fall back to DNSResourceRecord."""
+        from dns_observe import DNSResourceRecord
+        packet = build_response([rr(RecordType.SSHFP, b'\x01\x02\xab')])
+        record = DNSQuery()._parse_response(packet).answer_RRs[0]
+        self.assertIs(type(record), DNSResourceRecord)
+        self.assertEqual(record.data_view, '0x0102ab')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Test writing sent and received datagrams to a pcap file."""
+import unittest
+import io
+import os
+import socket
+import struct
+import tempfile
+import time
+from dns_observe import DNSQuery, PcapWriter
+from dns_observe.pcap import _checksum
+from test_query_many import LocalResponder
+
+
+def read_pcap(data: bytes) -> list[tuple[float, bytes]]:
+    magic, major, minor, _, _, snaplen, linktype = struct.unpack_from('<IHHiIII', data)
+    assert (magic, major, minor, linktype) == (0xa1b23c4d, 2, 4, 101)
+    packets = []
+    offset = 24
+    while offset < len(data):
+        seconds, nanoseconds, caplen, length = struct.unpack_from('<IIII', data, offset)
+        offset += 16
+        packets.append((seconds + nanoseconds / 1e9, data[offset:offset + caplen]))
+        offset += caplen
+    return packets
+
+
+class TestPcapWriter(unittest.TestCase):
+
+    def test_ipv4_udp(self):
+        stream = io.BytesIO()
+        writer = PcapWriter(stream)
+        writer.write_udp(b'hello', ('10.0.0.1', 5353), ('10.0.0.2', 53), 1700000000.123456789)
+        writer.close()
+        [(timestamp, packet)] = read_pcap(stream.getvalue())
+        self.assertAlmostEqual(timestamp, 1700000000.123456789, places=6)
+        self.assertEqual(packet[0], 0x45)
+        self.assertEqual(struct.unpack('!H', packet[2:4])[0], len(packet))
+        self.assertEqual(_checksum(packet[:20]), 0)
+        self.assertEqual(packet[12:20], socket.inet_aton('10.0.0.1') + socket.inet_aton('10.0.0.2'))
+        self.assertEqual(struct.unpack('!HHH', packet[20:26]), (5353, 53, 13))
+        self.assertEqual(packet[28:], b'hello')
+
+    def test_ipv6_udp(self):
+        stream = io.BytesIO()
+        with PcapWriter(stream) as writer:
+            writer.write_udp(b'hello', ('2001:db8::1', 5353), ('2001:db8::2', 53), 1700000000.0)
+        [(_, packet)] = read_pcap(stream.getvalue())
+        self.assertEqual(packet[0] >> 4, 6)
+        self.assertEqual(packet[48:], b'hello')
+        # 包含伪首部在内的校验和应为 0
+        pseudo = packet[8:40] + struct.pack('!IxxxB', 13, 17)
+        self.assertEqual(_checksum(pseudo + packet[40:]), 0)
+
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalResponder(delay=0.05)
+        fd, self.path = tempfile.mkstemp(suffix='.pcap')
+        os.close(fd)
+
+    def tearDown(self):
+        self.server.close()
+        os.remove(self.path)
+
+    def test_session_capture(self):
+        """Every query and response of a reused DNSQuery ends up in one capture."""
+        with PcapWriter(self.path) as capture:
+            dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.3, timeout=0.1, capture=capture)
+            first = dns.query('a.example.com').real()
+            dns.query_many(['bb.example.com', 'ccc.example.com'])
+            self.assertEqual(capture.packets, 6)
+        with open(self.path, 'rb') as f:
+            packets = read_pcap(f.read())
+        self.assertEqual(len(packets), 6)
+        timestamps = [t for t, _ in packets[:2]]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertAlmostEqual(packets[1][0], first.timestamp, places=5)
+        query, response = packets[0][1], packets[1][1]
+        self.assertEqual(struct.unpack('!H', query[22:24])[0], self.server.port)
+        self.assertEqual(struct.unpack('!H', response[20:22])[0], self.server.port)
+        self.assertEqual(response[12:16], socket.inet_aton('127.0.0.1'))
+        self.assertEqual(query[12:16], socket.inet_aton('127.0.0.1'))
+        self.assertEqual(response[28:], bytes(first._response))
+
+
+if __name__ == '__main__':
+    unittest.main()
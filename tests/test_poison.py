@@ -0,0 +1,121 @@
+"""Test the CIDR index of known forged addresses and the classifier built on it."""
+import unittest
+import os
+import socket
+import struct
+import tempfile
+from dns_observe import DNSQuery, PoisonIndex, RecordType
+from dns_observe.utils import ResponseList
+
+
+def response(*addresses, tid=0x1234):
+    """A response to twitter.com carrying the given A/AAAA answers."""
+    query = bytes(DNSQuery()._build_request('twitter.com', RecordType.A, tid))
+    packet = bytearray(query)
+    for address in addresses:
+        if ':' in address:
+            rtype, rdata = RecordType.AAAA, socket.inet_pton(socket.AF_INET6, address)
+        else:
+            rtype, rdata = RecordType.A, socket.inet_aton(address)
+        packet += b'\xc0\x0c' + struct.pack('>HHLH', rtype, 1, 60, len(rdata)) + rdata
+    struct.pack_into('>HH', packet, 2, 0x8180, 1)
+    struct.pack_into('>H', packet, 6, len(addresses))
+    return DNSQuery()._parse_response(bytes(packet))
+
+
+class TestPoisonIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PoisonIndex(['31.13.94.41', '108.160.160.0/20', '59.24.3.173/16', '2a03:2880::/32'])
+
+    def test_match_v4(self):
+        self.assertEqual(self.index.match(socket.inet_aton('31.13.94.41')), 32)
+        self.assertEqual(self.index.match(socket.inet_aton('108.160.175.255')), 20)
+        self.assertIsNone(self.index.match(socket.inet_aton('108.160.176.0')))
+        # 主机位不为 0 的 CIDR 按所在网络处理
+        self.assertIn('59.24.200.1', self.index)
+        self.assertNotIn('31.13.94.42', self.index)
+
+    def test_match_v6(self):
+        self.assertEqual(self.index.match(socket.inet_pton(socket.AF_INET6, '2a03:2880:f10c::1')), 32)
+        self.assertNotIn('2a03:2881::1', self.index)
+        # IPv4 的前缀不会匹配到 16 字节的地址
+        self.assertNotIn('::ffff:31.13.94.41', self.index)
+
+    def test_longest_prefix(self):
+        self.index.add('108.160.166.0/24')
+        self.assertEqual(self.index.match(socket.inet_aton('108.160.166.9')), 24)
+        self.assertEqual(self.index.match(socket.inet_aton('108.160.167.9')), 20)
+
+    def test_memoryview_and_len(self):
+        self.index.add('31.13.94.41/32')  # 重复的网络不计数
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.match(memoryview(b'xx' + socket.inet_aton('31.13.94.41'))[2:]), 32)
+        self.assertIsNone(self.index.match(b'\x01\x02\x03'))
+
+    def test_load(self):
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w') as f:
+            f.write('# Facebook\n31.13.94.0/24  # edge\n\n   2a03:2880::/32\n')
+        try:
+            index = PoisonIndex.load(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(len(index), 2)
+        self.assertIn('31.13.94.7', index)
+        self.assertIn('2a03:2880::1', index)
+        with self.assertRaises(ValueError):
+            PoisonIndex(['not an address'])
+
+
+class TestClassify(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PoisonIndex(['31.13.94.0/24', '2a03:2880::/32'])
+
+    def test_response_verdict(self):
+        self.assertEqual(response('31.13.94.41').classify(self.index), 'fake')
+        self.assertEqual(response('104.244.42.1', '2a03:2880::1').classify(self.index), 'fake')
+        genuine = response('104.244.42.1')
+        self.assertEqual(genuine.classify(self.index), 'real')
+        self.assertEqual(genuine.verdict, 'real')
+        # 没有地址答案时无法判定
+        self.assertIsNone(response().classify(self.index))
+
+    def test_real_answer_first(self):
+        genuine, forged = response('104.244.42.1'), response('31.13.94.41')
+        responses = ResponseList([genuine, forged])
+        self.assertEqual(responses.fakes(self.index), [forged])
+        self.assertIs(responses.real(self.index), genuine)
+        # 按到达顺序会判断错误
+        self.assertIs(responses.real(), forged)
+
+    def test_real_answer_lost(self):
+        responses = ResponseList([response('31.13.94.41'), response('31.13.94.42')])
+        self.assertEqual(len(responses.fakes(self.index)), 2)
+        self.assertIsNone(responses.real(self.index))
+        self.assertEqual([r.verdict for r in responses.classify(self.index)], ['fake', 'fake'])
+
+    def test_malformed(self):
+        # 截断的 RDATA 无法解码
+        truncated = DNSQuery()._parse_response(response('31.13.94.41')._response[:-2])
+        self.assertEqual(truncated.classify(self.index), 'malformed')
+        # RDLENGTH 为 3 的 A 记录，不能当作未命中索引的真实地址
+        packet = response('104.244.42.1')._response
+        odd = DNSQuery()._parse_response(packet[:-6] + struct.pack('>H', 3) + packet[-4:-1])
+        self.assertEqual(odd.classify(self.index), 'malformed')
+        genuine = response('104.244.42.1')
+        responses = ResponseList([DNSQuery()._parse_response(response('31.13.94.41')._response[:-2]), genuine])
+        self.assertEqual(responses.fakes(self.index), [])
+        self.assertIs(responses.real(self.index), genuine)
+        self.assertIsNone(ResponseList([truncated]).real(self.index))
+
+    def test_reuse_verdict(self):
+        genuine = response('104.244.42.1')
+        genuine.verdict = 'fake'   # 例如接收时用另一个索引判定过
+        self.assertEqual(ResponseList([genuine]).fakes(self.index), [genuine])
+        self.assertIsNone(ResponseList([genuine]).real(self.index))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""Test DNSQuery.query_many against a local UDP responder."""
+import unittest
+import socket
+import struct
+import threading
+import time
+from dns_observe import DNSQuery, RecordType
+from dns_observe.sinks import CallbackSink
+
+
+def build_answer(query: bytes, ip: str) -> bytes:
+    """Echo the question of `query` back with a single A record."""
+    (tid,) = struct.unpack('>H', query[:2])
+    offset = 12
+    while query[offset] != 0:
+        offset += query[offset] + 1
+    question = query[12:offset + 5]
+    header = struct.pack('>HHHHHH', tid, 0x8180, 1, 1, 0, 0)
+    answer = b'\xc0\x0c' + struct.pack('>HHLH', RecordType.A, 1, 60, 4) + socket.inet_aton(ip)
+    return header + question + answer
+
+
+class LocalResponder:
+    """Answer every A query with <prefix>.<label length> after a short delay."""
+
+    def __init__(self, delay=0.2, host='127.0.0.1', port=0, prefix='10.0.0'):
+        self.delay = delay
+        self.prefix = prefix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        timers = []
+        while self.running:
+            try:
+                query, address = self.sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            ip = f'{self.prefix}.{query[12]}'
+            timer = threading.Timer(self.delay, self.sock.sendto, (build_answer(query, ip), address))
+            timer.start()
+            timers.append(timer)
+        for timer in timers:
+            timer.cancel()
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+
+class TestQueryMany(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalResponder(delay=0.2)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_demultiplex_by_domain(self):
+        """Each domain gets exactly its own response back."""
+        domains = [f'{"x" * (i % 50 + 1)}.example{i}.com' for i in range(200)]
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.6, timeout=0.2)
+        results = dns.query_many(domains, RecordType.A)
+
+        self.assertEqual(list(results), domains)
+        for domain, responses in results.items():
+            self.assertEqual(len(responses), 1, domain)
+            response = responses.real()
+            self.assertEqual(response.qname, domain)
+            self.assertEqual(response.answer_RRs[0].data_view, f'10.0.0.{len(domain.split(".")[0])}')
+
+    def test_unique_transaction_ids(self):
+        """A fixed transaction_id is used as the first of consecutive IDs."""
+        domains = ['a.example.com', 'b.example.com', 'c.example.com']
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.5, timeout=0.2, transaction_id=65534)
+        results = dns.query_many(domains)
+        ids = [results[d].real().id for d in domains]
+        self.assertEqual(ids, [65534, 65535, 1])
+
+    def test_windows_overlap(self):
+        """Total scan time is about one wait_time, not N x wait_time."""
+        domains = [f'host{i}.example.com' for i in range(50)]
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.5, timeout=0.2)
+        start = time.time()
+        results = dns.query_many(domains)
+        elapsed = time.time() - start
+        self.assertLess(elapsed, 2)
+        self.assertTrue(all(len(r) == 1 for r in results.values()))
+
+    def test_close_socket_on_error(self):
+        """The socket is closed even when a sink raises inside the receive loop."""
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.5, timeout=0.2)
+
+        def fail(event):
+            raise ValueError('sink failed')
+
+        dns.add_sink(CallbackSink(fail))
+        for method, arg in (('query', 'abc.example.com'), ('query_many', ['abc.example.com'])):
+            with self.subTest(method=method):
+                with self.assertRaises(ValueError):
+                    getattr(dns, method)(arg)
+                self.assertEqual(dns.sock.fileno(), -1)
+
+
+class TestQueryServers(unittest.TestCase):
+
+    def setUp(self):
+        self.first = LocalResponder(delay=0.1, prefix='10.0.1')
+        self.second = LocalResponder(delay=0.2, host='127.0.0.2', port=self.first.port, prefix='10.0.2')
+
+    def tearDown(self):
+        self.first.close()
+        self.second.close()
+
+    def test_fan_out(self):
+        """Responses are grouped by the server they came from, within one window."""
+        dns = DNSQuery(port=self.first.port, wait_time=0.5, timeout=0.2)
+        start = time.time()
+        results = dns.query_servers(['127.0.0.1', '127.0.0.2'], 'abc.example.com')
+        self.assertLess(time.time() - start, 1)
+
+        self.assertEqual(list(results), ['127.0.0.1', '127.0.0.2'])
+        self.assertEqual(results['127.0.0.1'].real().answer_RRs[0].data_view, '10.0.1.3')
+        self.assertEqual(results['127.0.0.2'].real().answer_RRs[0].data_view, '10.0.2.3')
+        self.assertLess(results['127.0.0.1'].real().rtt, results['127.0.0.2'].real().rtt)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Test the burst-draining UDP receive engine."""
+import unittest
+import socket
+import time
+from dns_observe.receiver import DatagramReceiver
+
+
+class TestDatagramReceiver(unittest.TestCase):
+
+    def setUp(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.address = self.sock.getsockname()
+
+    def tearDown(self):
+        self.sock.close()
+        self.sender.close()
+
+    def test_drain_burst(self):
+        """All queued datagrams are returned by a single drain, in order."""
+        receiver = DatagramReceiver(self.sock, bufsize=512, arena_size=4096)
+        payloads = [b'%04d' % i * 10 for i in range(200)]
+        for payload in payloads:
+            self.sender.sendto(payload, self.address)
+        self.assertTrue(receiver.wait(1))
+        time.sleep(0.05)
+        packets = receiver.drain()
+        self.assertEqual([bytes(p.data) for p in packets], payloads)
+        self.assertEqual(packets[0].address[1], self.sender.getsockname()[1])
+        times = [p.time for p in packets]
+        self.assertEqual(times, sorted(times))
+        self.assertEqual(receiver.drain(), [])
+
+    def test_arena_reuse(self):
+        """Arenas are reused only after every packet view into them is released."""
+        receiver = DatagramReceiver(self.sock, bufsize=512, arena_size=1024)
+        first = receiver._arena
+        self.sender.sendto(b'x' * 100, self.address)
+        receiver.wait(1)
+        held = receiver.drain()
+        self.assertEqual(bytes(held[0].data), b'x' * 100)
+
+        # 填满第一个 arena，仍被引用时不能复用
+        for _ in range(8):
+            self.sender.sendto(b'y' * 400, self.address)
+        time.sleep(0.05)
+        receiver.drain()
+        self.assertIsNot(receiver._arena, first)
+        self.assertEqual(bytes(held[0].data), b'x' * 100)
+
+        del held
+        reused = False
+        for _ in range(16):
+            self.sender.sendto(b'z' * 400, self.address)
+            time.sleep(0.005)
+            receiver.drain()
+            reused = reused or receiver._arena is first
+        self.assertTrue(reused)
+
+
+if __name__ == '__main__':
+    unittest.main()
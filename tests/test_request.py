@@ -0,0 +1,59 @@
+"""Test query packet templates."""
+import unittest
+import struct
+from dns_observe import DNSQuery, RecordType
+
+
+class TestQueryTemplate(unittest.TestCase):
+
+    def test_wire_format(self):
+        dns = DNSQuery(transaction_id=0x1234)
+        qdata = dns._build_request('www.example.com.', RecordType.AAAA)
+        self.assertEqual(bytes(qdata),
+                         b'\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00'
+                         b'\x03www\x07example\x03com\x00\x00\x1c\x00\x01')
+
+    def test_patch_transaction_id(self):
+        """The cached template is reused and only its ID changes."""
+        dns = DNSQuery()
+        first = dns._build_request('example.com', RecordType.A, 1)
+        template = dns._templates[('example.com', RecordType.A)]
+        second = dns._build_request('example.com', RecordType.A, 65535)
+        self.assertIs(dns._templates[('example.com', RecordType.A)], template)
+        self.assertEqual(struct.unpack('>H', second[:2])[0], 65535)
+        self.assertEqual(second[2:], first[2:])
+        dns._build_request('example.com', RecordType.MX, 1)
+        self.assertIsNot(dns._templates[('example.com', RecordType.MX)], template)
+
+    def test_returned_packet_is_stable(self):
+        """Rewriting the template for a later query leaves earlier packets untouched."""
+        dns = DNSQuery()
+        first = dns._build_request('example.com', RecordType.A, 1)
+        dns._build_request('example.com', RecordType.A, 2)
+        self.assertIsInstance(first, bytes)
+        self.assertEqual(struct.unpack('>H', first[:2])[0], 1)
+
+    def test_lru_eviction(self):
+        dns = DNSQuery()
+        dns.TEMPLATE_CACHE_SIZE = 2
+        dns._build_request('a.com', RecordType.A, 1)
+        a = dns._templates[('a.com', RecordType.A)]
+        dns._build_request('b.com', RecordType.A, 1)
+        dns._build_request('a.com', RecordType.A, 1)
+        dns._build_request('c.com', RecordType.A, 1)
+        self.assertEqual(list(dns._templates), [('a.com', RecordType.A), ('c.com', RecordType.A)])
+        dns._build_request('a.com', RecordType.A, 1)
+        self.assertIs(dns._templates[('a.com', RecordType.A)], a)
+
+    def test_idna(self):
+        dns = DNSQuery()
+        qdata = dns._build_request('例子.测试', RecordType.A, 1)
+        self.assertEqual(bytes(qdata[12:-4]), b'\x0bxn--fsqu00a\x0bxn--0zwm56d\x00')
+
+    def test_root(self):
+        dns = DNSQuery()
+        self.assertEqual(bytes(dns._build_request('.', RecordType.NS, 1)[12:]), b'\x00\x00\x02\x00\x01')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Test sharded scanning across worker processes."""
+import unittest
+import json
+from dns_observe import DNSQuery, PoisonIndex, query_sharded, shard
+from dns_observe.simulator import Injection, PollutionServer
+from dns_observe.sinks import QueueSink
+
+ZONE = {f'host{i}.example.com': {'A': [f'10.0.0.{i}']} for i in range(6)}
+ZONE['twitter.com'] = {'A': ['104.244.42.1']}
+DOMAINS = ['twitter.com'] + [f'host{i}.example.com' for i in range(6)]
+
+
+class TestQuerySharded(unittest.TestCase):
+
+    def setUp(self):
+        self.server = PollutionServer(ZONE, delay=0.02, injections=[Injection(('31.13.94.41',), 0.005)],
+                                      polluted=['twitter.com']).start()
+        self.dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.3, timeout=0.05, transaction_id=100,
+                            poison=PoisonIndex(['31.13.94.0/24']))
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_ordered_results(self):
+        sink = self.dns.add_sink(QueueSink())
+        results = query_sharded(self.dns, DOMAINS + ['twitter.com'], workers=2, chunk_size=3)
+        self.assertEqual(list(results), DOMAINS)
+        self.assertEqual([r.answer_RRs[0].data_view for r in results['twitter.com']], ['31.13.94.41', '104.244.42.1'])
+        self.assertEqual([r.verdict for r in results['twitter.com']], ['fake', 'real'])
+        for i in range(6):
+            (response,) = results[f'host{i}.example.com']
+            self.assertEqual(response.answer_RRs[0].data_view, f'10.0.0.{i}')
+            self.assertEqual(response.address, ('127.0.0.1', self.server.port))
+            self.assertGreater(response.rtt, 0)
+        # 与 query_many 相同，ID 按输入位置依次递增，跨分片不重复
+        self.assertEqual([results[domain][-1].id for domain in DOMAINS], list(range(100, 107)))
+        self.assertEqual([event.qname for event in sink.drain()], ['twitter.com'] + DOMAINS)
+
+    def test_worker_output(self):
+        sink = self.dns.add_sink(QueueSink())
+        chunks = []
+        results = query_sharded(self.dns, DOMAINS, workers=2, output_format='jsonl', write=chunks.append)
+        self.assertEqual(len(chunks), 2)
+        rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        self.assertEqual([row['qname'] for row in rows], ['twitter.com'] + DOMAINS)
+        self.assertEqual([row['verdict'] for row in rows[:2]], ['fake', 'real'])
+        self.assertEqual(len(sink), 0)   # 已在 worker 中输出
+        self.assertEqual(sum(len(responses) for responses in results.values()), 8)
+        with self.assertRaises(ValueError):
+            query_sharded(self.dns, DOMAINS, output_format='xml')
+
+    def test_bounded_shards(self):
+        self.addCleanup(setattr, shard, 'SHARD_SIZE', shard.SHARD_SIZE)
+        shard.SHARD_SIZE = 2
+        chunks = []
+        query_sharded(self.dns, DOMAINS, workers=2, output_format='jsonl', write=chunks.append)
+        # 默认分片不超过 SHARD_SIZE，各分片的输出仍按输入顺序写出
+        self.assertEqual(len(chunks), 4)
+        rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        self.assertEqual([row['qname'] for row in rows], ['twitter.com'] + DOMAINS)
+
+    def test_empty(self):
+        self.assertEqual(query_sharded(self.dns, [], workers=2), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
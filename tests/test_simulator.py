@@ -0,0 +1,54 @@
+"""Test the local pollution simulator."""
+import unittest
+from dns_observe import DNSQuery, RecordType
+from dns_observe.simulator import Injection, PollutionServer
+
+ZONE = {
+    'twitter.com': {'A': ['104.244.42.1']},
+    'www.twitter.com': {'CNAME': ['twitter.com']},
+    'example.com': {'A': ['93.184.216.34'], 'MX': ['10 mail.example.com'], 'TXT': ['v=spf1 -all']},
+}
+
+
+class TestPollutionServer(unittest.TestCase):
+
+    def setUp(self):
+        injections = [Injection(('31.13.94.41',), 0.005, 247), Injection(('2001::1', '59.24.3.173'), 0.01, 60)]
+        self.server = PollutionServer(ZONE, delay=0.05, injections=injections, polluted=['twitter.com']).start()
+        self.dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.3, timeout=0.1)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_injections_before_genuine(self):
+        responses = self.dns.query('twitter.com')
+        self.assertEqual(len(responses), 3)
+        first, second = responses.fakes()
+        self.assertEqual([(r.type_name, r.data_view, r.ttl) for r in first.answer_RRs], [('A', '31.13.94.41', 247)])
+        self.assertEqual([r.data_view for r in second.answer_RRs], ['2001::1', '59.24.3.173'])
+        self.assertEqual(responses.real().answer_RRs[0].data_view, '104.244.42.1')
+        self.assertEqual(len({r.id for r in responses}), 1)
+        self.assertLess(first.rtt, responses.real().rtt)
+        self.assertEqual((self.server.queries, self.server.replies), (1, 3))
+        # 结果只引用自己的数据包，不占住接收 arena
+        self.assertTrue(all(type(r._response) is bytes for r in responses))
+
+    def test_cname_and_subdomain_pollution(self):
+        responses = self.dns.query('www.twitter.com')
+        self.assertEqual(len(responses), 3)
+        self.assertEqual([r.data_view for r in responses.real().answer_RRs], ['twitter.com', '104.244.42.1'])
+
+    def test_clean_domain(self):
+        responses = self.dns.query('example.com', RecordType.MX)
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(responses.real().answer_RRs[0].data_view, '(10) mail.example.com')
+        self.assertEqual(self.dns.query('example.com', RecordType.TXT).real().answer_RRs[0].data_view, 'v=spf1 -all')
+
+    def test_nxdomain(self):
+        responses = self.dns.query('missing.example.net')
+        self.assertEqual(responses.real().rcode, 3)
+        self.assertEqual(responses.real().qname, 'missing.example.net')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""Test delivering responses to sinks."""
+import unittest
+import contextlib
+import csv
+import io
+import json
+import struct
+from dns_observe import DNSQuery, RecordType, CallbackSink, QueueSink, TextSink, JSONLinesSink, CSVSink, ResponseEvent, ROW_FIELDS
+from test_query_many import LocalResponder, build_answer
+
+
+class TestSinks(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalResponder(delay=0.05)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_callback_sink(self):
+        events = []
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.3, timeout=0.1, sinks=[CallbackSink(events.append)])
+        responses = dns.query('abc.example.com')
+        self.assertEqual(len(events), 1)
+        self.assertIs(events[0].response, responses.real())
+        self.assertIsNone(events[0].qname)
+
+    def test_query_many_events(self):
+        queue = QueueSink()
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.3, timeout=0.1)
+        dns.add_sink(queue)
+        dns.query_many(['a.example.com', 'bb.example.com'])
+        events = queue.drain()
+        self.assertEqual(sorted(e.qname for e in events), ['a.example.com', 'bb.example.com'])
+        self.assertEqual(len(queue), 0)
+
+    def test_text_sink(self):
+        lines = []
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.3, timeout=0.1, sinks=[TextSink(lines.append)])
+        dns.query('abc.example.com')
+        self.assertTrue(lines[0].startswith('↯ Time: '))
+        self.assertIn('Reply: No Error(0), Answer: 1', lines[0])
+        self.assertEqual(lines[1], '- Answer: abc.example.com, TTL: 60 (1m), A: 10.0.0.3')
+
+    def test_jsonl_sink(self):
+        stream = io.StringIO()
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.3, timeout=0.1, sinks=[JSONLinesSink(stream)])
+        response = dns.query('abc.example.com').real()
+        rows = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual(tuple(row), ROW_FIELDS)
+        self.assertEqual((row['address'], row['port']), ('127.0.0.1', self.server.port))
+        self.assertEqual(row['id'], response.id)
+        self.assertEqual((row['section'], row['type'], row['ttl'], row['data']), ('answer', 'A', 60, '10.0.0.3'))
+        self.assertAlmostEqual(row['timestamp'], response.timestamp, places=5)
+        self.assertGreater(row['rtt'], 0)
+
+    def test_csv_sink(self):
+        stream = io.StringIO()
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.3, timeout=0.1, sinks=[CSVSink(stream)])
+        dns.query_many(['a.example.com', 'bb.example.com'])
+        rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+        self.assertEqual(sorted((r['qname'], r['data']) for r in rows),
+                         [('a.example.com', '10.0.0.1'), ('bb.example.com', '10.0.0.2')])
+
+
+class TestQueueSink(unittest.TestCase):
+
+    def test_bounded(self):
+        """The oldest events are dropped once the queue is full."""
+        queue = QueueSink(maxsize=3)
+        packet = build_answer(DNSQuery()._build_request('a.com', RecordType.A, 1), '10.0.0.1')
+        responses = [DNSQuery()._parse_response(packet) for _ in range(5)]
+        for response in responses:
+            queue.on_response(ResponseEvent(response))
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual([e.response for e in queue.drain()], responses[2:])
+
+    def test_malformed_records(self):
+        from dns_observe import render_text
+        packet = build_answer(DNSQuery()._build_request('a.com', RecordType.A, 1), '10.0.0.1')
+        response = DNSQuery()._parse_response(packet[:-3])
+        lines = render_text(ResponseEvent(response))
+        self.assertEqual(lines[1:], ['! Malformed resource records'])
+        stream = io.StringIO()
+        JSONLinesSink(stream).on_response(ResponseEvent(response))
+        self.assertEqual(json.loads(stream.getvalue())['section'], 'malformed')
+
+    def test_bad_address_length(self):
+        from dns_observe import render_text
+        packet = build_answer(DNSQuery()._build_request('a.com', RecordType.A, 1), '10.0.0.1')
+        # RDLENGTH 为 3 的 A 记录，inet_ntop 抛出 ValueError
+        response = DNSQuery()._parse_response(packet[:-6] + struct.pack('>H', 3) + b'\x0a\x00\x00')
+        lines = render_text(ResponseEvent(response))
+        self.assertEqual(lines[1:], ['! Malformed resource records'])
+        stream = io.StringIO()
+        JSONLinesSink(stream).on_response(ResponseEvent(response))
+        self.assertEqual(json.loads(stream.getvalue())['section'], 'malformed')
+
+
+
+class TestSpinner(unittest.TestCase):
+
+    def test_render_outside_receive_loop(self):
+        from dns_observe.console import Spinner
+        server = LocalResponder(delay=0.01)
+        self.addCleanup(server.close)
+        dns = DNSQuery('127.0.0.1', port=server.port, wait_time=0.2)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            with Spinner(dns) as spinner:
+                # 接收循环只把响应放进队列
+                self.assertIsInstance(dns.sinks[-1], QueueSink)
+                responses = dns.query('abc.example.com')
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(dns.sinks, [])
+        self.assertIn('Answer: 1', out.getvalue())
+        self.assertEqual(len(spinner._sink), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
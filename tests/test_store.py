@@ -0,0 +1,146 @@
+"""Test the SQLite observation store and the history command."""
+import unittest
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+from dns_observe import DNSQuery, ObservationStore, RecordType
+from dns_observe.simulator import Injection, PollutionServer
+from dns_observe.sinks import ResponseEvent
+from dns_observe.store import SCHEMA, main as history_main
+
+ZONE = {
+    'twitter.com': {'A': ['104.244.42.1']},
+    'example.com': {'A': ['93.184.216.34'], 'MX': ['10 mail.example.com']},
+}
+
+
+class TestObservationStore(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.server = PollutionServer(ZONE, delay=0.02, injections=[Injection(('31.13.94.41',), 0.005)],
+                                      polluted=['twitter.com']).start()
+        self.dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.1, timeout=0.05)
+        self.server_name = f'127.0.0.1:{self.server.port}'
+
+    def tearDown(self):
+        self.server.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_add_and_history(self):
+        with ObservationStore(self.path) as store:
+            store.add(self.dns.query('twitter.com'))
+            store.add(self.dns.query('example.com', RecordType.MX), qname='example.com', server='resolver-1')
+            rows = store.history('TWITTER.com.')
+            self.assertEqual([(r.server, r.qtype, r.verdict, r.answers) for r in rows],
+                             [(self.server_name, 'A', 'fake', ('31.13.94.41',)),
+                              (self.server_name, 'A', 'real', ('104.244.42.1',))])
+            self.assertEqual(store.history('example.com')[0].answers, ('(10) mail.example.com',))
+            self.assertEqual(store.history('example.com', server='resolver-1')[0].verdict, 'real')
+            self.assertEqual(store.history('example.com', server='other'), [])
+        # WAL 模式，数据在关闭前已提交
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(conn.execute('SELECT count(*) FROM responses').fetchone()[0], 3)
+        conn.close()
+
+    def test_poisoning_and_ip_lookup(self):
+        with ObservationStore(self.path, batch_size=2) as store:
+            first = self.dns.query('twitter.com')
+            store.add(first)
+            store.add(self.dns.query('twitter.com'))
+        # 重新打开后继续分配 id
+        with ObservationStore(self.path) as store:
+            store.add(self.dns.query('twitter.com'))
+            poisoned = store.poisoning('twitter.com')
+            self.assertEqual(len(poisoned), 1)
+            self.assertEqual(poisoned[0][:2], (self.server_name, '31.13.94.41'))
+            self.assertEqual(poisoned[0].count, 3)
+            self.assertAlmostEqual(poisoned[0].first_seen, first[0].timestamp, places=3)
+            self.assertEqual(store.poisoning('twitter.com', since=poisoned[0].last_seen + 1), [])
+            uses = store.names_for_ip('104.244.42.1')
+            self.assertEqual([(u.qname, u.verdict, u.count) for u in uses], [('twitter.com', 'real', 3)])
+
+    def test_sink_and_malformed(self):
+        store = ObservationStore(self.path, batch_size=100, flush_interval=60)
+        self.dns.add_sink(store)
+        self.dns.query('example.com')
+        self.assertEqual(store.written, 0)   # 还在批次中
+        malformed = self.dns._parse_response(bytes(self.dns._build_request('bad.example', RecordType.A, 9))[:12] +
+                                             b'\x00\x00\x01\x00\x01' + b'\xff' * 8)
+        malformed.answer_n = 1
+        malformed.address = ('127.0.0.1', 53)
+        store.on_response(ResponseEvent(malformed))
+        store.close()
+        self.assertEqual(store.written, 2)
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute('SELECT count(*) FROM records').fetchone()[0], 1)
+        self.assertEqual(conn.execute('SELECT server FROM servers ORDER BY id').fetchall(), [(self.server_name,), ('127.0.0.1',)])
+        conn.close()
+
+    def test_concurrent_writers(self):
+        first = ObservationStore(self.path)
+        second = ObservationStore(self.path)
+        first.add(self.dns.query('twitter.com'))
+        first.flush()
+        second.add(self.dns.query('example.com'))
+        second.close()
+        first.add(self.dns.query('example.com'))
+        first.close()
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute('SELECT count(DISTINCT id) FROM responses').fetchone()[0], 4)
+        conn.close()
+
+    def test_old_schema(self):
+        conn = sqlite3.connect(self.path)
+        conn.executescript(SCHEMA.replace(',\n    transport TEXT', ''))
+        conn.close()
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            history_main([self.path, 'twitter.com', '--timeline'])
+        self.assertEqual(out.getvalue(), '')
+        with ObservationStore(self.path) as store:
+            store.add(self.dns.query('twitter.com'))
+            self.assertEqual([row.transport for row in store.history('twitter.com')], ['udp', 'udp'])
+
+    def test_bad_address_length(self):
+        request = bytes(self.dns._build_request('bad.example', RecordType.A, 9))
+        # RDLENGTH 为 3 的 A 记录，inet_ntop 抛出 ValueError
+        response = self.dns._parse_response(request[:2] + b'\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00' + request[12:] +
+                                            b'\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x03\x0a\x00\x00')
+        response.address = ('127.0.0.1', 53)
+        with ObservationStore(self.path) as store:
+            store.on_response(ResponseEvent(response))
+            store.flush()
+            self.assertEqual(store.written, 1)
+            self.assertEqual(store.history('bad.example')[0].answers, ())
+
+    def test_history_cli(self):
+        with ObservationStore(self.path) as store:
+            store.add(self.dns.query('twitter.com'))
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            history_main([self.path, 'twitter.com', '--json'])
+            history_main([self.path, '--ip', '31.13.94.41'])
+            history_main([self.path, 'twitter.com', '--timeline', '--since', '2000-01-01'])
+        lines = out.getvalue().splitlines()
+        self.assertEqual(json.loads(lines[0])['ip'], '31.13.94.41')
+        self.assertTrue(lines[1].startswith(f'twitter.com  {self.server_name}  fake  first='))
+        self.assertTrue(lines[2].endswith('fake  31.13.94.41'))
+        self.assertTrue(lines[3].endswith('real  104.244.42.1'))
+
+        missing = self.path + '.missing'
+        with contextlib.redirect_stderr(io.StringIO()) as err, self.assertRaises(SystemExit):
+            history_main([missing, 'twitter.com'])
+        self.assertIn('cannot read', err.getvalue())
+        self.assertFalse(os.path.exists(missing))
+
+
+if __name__ == '__main__':
+    unittest.main()
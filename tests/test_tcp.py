@@ -0,0 +1,136 @@
+"""Test DNS over TCP: framing, the connection pool, pipelining and TC fallback."""
+import unittest
+import os
+import socket
+import struct
+import tempfile
+import time
+from dns_observe import DNSQuery, Metrics, ObservationStore, RecordType, TCPPool, query_sharded
+from dns_observe.simulator import Injection, PollutionServer
+from dns_observe.sinks import QueueSink
+from dns_observe.tcp import TCPConnection
+
+ZONE = {f'host{i}.example.com': {'A': [f'10.0.0.{i}']} for i in range(20)}
+ZONE['twitter.com'] = {'A': ['104.244.42.1']}
+ZONE['big.example.com'] = {'TXT': ['x' * 600]}
+
+
+class TestTCPConnection(unittest.TestCase):
+
+    def test_framing(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        conn = TCPConnection(listener.getsockname(), timeout=1)
+        peer, _ = listener.accept()
+        conn.send([b'abc', b'de'])
+        self.assertEqual(peer.recv(64), b'\x00\x03abc\x00\x02de')
+        self.assertEqual(conn.outstanding, 2)
+        # 一次读取包含一个半消息，剩下的半个在下一次读取中补齐
+        peer.sendall(b'\x00\x02xy\x00\x04ab')
+        time.sleep(0.05)
+        self.assertEqual(conn.read(), [b'xy'])
+        peer.sendall(b'cd')
+        time.sleep(0.05)
+        self.assertEqual(conn.read(), [b'abcd'])
+        self.assertEqual(conn.outstanding, 0)
+        self.assertFalse(conn.is_stale(30))
+        peer.close()
+        time.sleep(0.05)
+        self.assertTrue(conn.is_stale(30))
+        with self.assertRaises(ConnectionError):
+            conn.read()
+        conn.close()
+        listener.close()
+
+
+class TestTCPQuery(unittest.TestCase):
+
+    def start(self, **kwargs):
+        self.server = PollutionServer(ZONE, delay=0.02, injections=[Injection(('31.13.94.41',), 0.005)],
+                                      polluted=['twitter.com'], tcp=True, **kwargs).start()
+        self.addCleanup(self.server.close)
+        self.pool = TCPPool(max_connections=2, max_pipeline=8, timeout=1)
+        self.addCleanup(self.pool.close)
+        self.dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.1, timeout=0.5, tcp_pool=self.pool)
+
+    def test_query_tcp(self):
+        self.start()
+        udp = self.dns.query('twitter.com')
+        tcp = self.dns.query_tcp('twitter.com')
+        self.assertEqual([r.answer_RRs[0].A for r in udp], ['31.13.94.41', '104.244.42.1'])
+        self.assertEqual([(r.answer_RRs[0].A, r.transport) for r in tcp], [('104.244.42.1', 'tcp')])
+        self.assertEqual(tcp[0].address, ('127.0.0.1', self.server.port))
+        self.assertGreater(tcp[0].rtt, 0)
+        # 第二次查询复用同一条连接
+        self.dns.query_tcp('host1.example.com')
+        self.assertEqual((self.pool.connects, self.server.tcp_connections), (1, 1))
+        self.assertEqual(self.pool.idle_count(('127.0.0.1', self.server.port)), 1)
+
+    def test_pipelined(self):
+        self.start()
+        sink = self.dns.add_sink(QueueSink())
+        domains = [f'host{i}.example.com' for i in range(20)] + ['missing.example.com']
+        results = self.dns.query_many_tcp(domains)
+        self.assertEqual(list(results), domains)
+        for i in range(20):
+            self.assertEqual(results[f'host{i}.example.com'][0].answer_RRs[0].A, f'10.0.0.{i}')
+        self.assertEqual(results['missing.example.com'][0].rcode, 3)
+        self.assertEqual(len({r.id for responses in results.values() for r in responses}), 21)
+        self.assertEqual(self.server.tcp_connections, 2)   # max_connections
+        self.assertEqual(len(sink), 21)
+
+    def test_server_closes_connection(self):
+        self.start(tcp_max_queries=2)
+        results = self.dns.query_many_tcp(['host0.example.com', 'host1.example.com', 'host2.example.com'])
+        self.assertEqual([len(responses) for responses in results.values()], [1, 1, 1])
+        self.assertEqual(self.server.tcp_connections, 2)   # 第三个查询在新连接上重试
+        # 复用第二条连接，服务器回答后关闭它；关闭的空闲连接不会被复用
+        self.assertEqual(len(self.dns.query_tcp('host3.example.com')), 1)
+        self.assertEqual(self.server.tcp_connections, 2)
+        time.sleep(0.05)
+        self.assertEqual(len(self.dns.query_tcp('host4.example.com')), 1)
+        self.assertEqual(self.server.tcp_connections, 3)
+
+    def test_truncated_fallback(self):
+        self.start(truncate=['big.example.com'])
+        responses = self.dns.query('big.example.com', RecordType.TXT)
+        self.assertEqual([(r.truncated, r.transport) for r in responses], [(True, 'udp'), (False, 'tcp')])
+        self.assertEqual(responses.real().answer_RRs[0].TXT, 'x' * 255)
+        # 截断的 UDP 响应来自真实服务器，按到达顺序判定时也不是伪造的
+        self.assertEqual(responses.fakes(), [])
+        metrics = Metrics()
+        with DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.1, timeout=0.5, metrics=metrics) as dns:
+            dns.query('big.example.com', RecordType.TXT)
+        self.assertEqual(metrics.forged.value((f'127.0.0.1:{self.server.port}',)), 0)
+        results = self.dns.query_many(['big.example.com', 'host0.example.com'], RecordType.TXT)
+        self.assertEqual([r.transport for r in results['big.example.com']], ['udp', 'tcp'])
+        self.assertEqual([r.transport for r in results['host0.example.com']], ['udp'])
+        servers = self.dns.query_servers(['127.0.0.1'], 'big.example.com', RecordType.TXT)
+        self.assertEqual([r.transport for r in servers['127.0.0.1']], ['udp', 'tcp'])
+        self.dns.tcp_fallback = False
+        self.assertEqual([r.truncated for r in self.dns.query('big.example.com', RecordType.TXT)], [True])
+
+    def test_transport_sharded_and_stored(self):
+        self.start(truncate=['big.example.com'])
+        results = query_sharded(self.dns, ['big.example.com', 'host0.example.com'], RecordType.TXT, workers=2, chunk_size=1)
+        self.assertEqual([r.transport for r in results['big.example.com']], ['udp', 'tcp'])
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.addCleanup(lambda: [os.remove(path + suffix) for suffix in ('', '-wal', '-shm') if os.path.exists(path + suffix)])
+        with ObservationStore(path) as store:
+            store.add(results['big.example.com'])
+            self.assertEqual([row.transport for row in store.history('big.example.com')], ['udp', 'tcp'])
+            self.assertEqual([row.verdict for row in store.history('big.example.com')], [None, 'real'])
+
+    def test_no_tcp_listener(self):
+        server = PollutionServer(ZONE, delay=0.01, truncate=['big.example.com']).start()
+        self.addCleanup(server.close)
+        with DNSQuery('127.0.0.1', port=server.port, wait_time=0.1, timeout=0.5) as dns:
+            self.assertEqual([r.truncated for r in dns.query('big.example.com', RecordType.TXT)], [True])
+            with self.assertRaises(RuntimeError):
+                dns.query_tcp('host0.example.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
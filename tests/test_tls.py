@@ -0,0 +1,61 @@
+"""Test DNS over TLS against the simulator's TLS listener with a self-signed certificate."""
+import unittest
+import ssl
+from pathlib import Path
+from dns_observe import DNSQuery, TCPPool
+from dns_observe.simulator import Injection, PollutionServer
+from dns_observe.sinks import QueueSink
+
+CERTS = Path(__file__).resolve().parent / 'tls'
+ZONE = {f'host{i}.example.com': {'A': [f'10.0.0.{i}']} for i in range(10)}
+ZONE['twitter.com'] = {'A': ['104.244.42.1']}
+
+
+class TestDNSOverTLS(unittest.TestCase):
+
+    def setUp(self):
+        server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_context.load_cert_chain(CERTS / 'localhost.pem')
+        self.server = PollutionServer(ZONE, delay=0.01, injections=[Injection(('31.13.94.41',), 0.002)],
+                                      polluted=['twitter.com'], tls_context=server_context).start()
+        self.addCleanup(self.server.close)
+        self.client_context = ssl.create_default_context(cafile=str(CERTS / 'ca.pem'))
+        self.pool = TCPPool(max_connections=2, max_pipeline=4, timeout=1, ssl_context=self.client_context)
+        self.addCleanup(self.pool.close)
+        self.dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.1, timeout=1,
+                            tls_pool=self.pool, tls_port=self.server.tls_port)
+
+    def test_query_tls(self):
+        sink = self.dns.add_sink(QueueSink())
+        responses = self.dns.query_tls('twitter.com')
+        self.assertEqual([(r.answer_RRs[0].A, r.transport) for r in responses], [('104.244.42.1', 'tls')])
+        self.assertEqual(responses[0].address, ('127.0.0.1', self.server.tls_port))
+        self.assertEqual(len(sink), 1)
+        # 保持连接：第二次查询不再握手
+        self.dns.query_tls('host1.example.com')
+        self.assertEqual((self.pool.connects, self.server.tls_handshakes), (1, 1))
+
+    def test_session_resumption(self):
+        self.dns.query_tls('host0.example.com')
+        self.pool.close()   # 关闭连接，保留会话
+        self.assertEqual(len(self.dns.query_tls('host1.example.com')), 1)
+        self.assertEqual((self.pool.connects, self.pool.resumed), (2, 1))
+        self.assertEqual((self.server.tls_handshakes, self.server.tls_resumed), (2, 1))
+
+    def test_pipelined(self):
+        domains = [f'host{i}.example.com' for i in range(10)]
+        results = self.dns.query_many_tls(domains)
+        self.assertEqual([responses[0].answer_RRs[0].A for responses in results.values()],
+                         [f'10.0.0.{i}' for i in range(10)])
+        self.assertEqual(self.server.tls_handshakes, 2)   # max_connections
+
+    def test_untrusted_certificate(self):
+        dns = DNSQuery('127.0.0.1', timeout=1, tls_port=self.server.tls_port)
+        self.addCleanup(dns.close)
+        with self.assertRaises(RuntimeError):
+            dns.query_tls('twitter.com')
+        self.assertEqual(self.server.tls_resumed, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""Test the tracing hooks and the Chrome trace-event exporter."""
+import unittest
+import io
+import json
+import os
+import tempfile
+from dns_observe import ChromeTraceExporter, DNSQuery, Tracer
+from dns_observe.simulator import Injection, PollutionServer
+from dns_observe.sinks import CallbackSink
+
+ZONE = {'twitter.com': {'A': ['104.244.42.1']}}
+
+
+class RecordingTracer(Tracer):
+
+    def __init__(self):
+        self.events = []
+
+    def span_start(self, name, category, timestamp, args=None):
+        self.events.append(('B', name, timestamp, args))
+
+    def span_end(self, name, category, timestamp):
+        self.events.append(('E', name, timestamp, None))
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.server = PollutionServer(ZONE, delay=0.02, injections=[Injection(('31.13.94.41',), 0.005)],
+                                      polluted=['twitter.com']).start()
+
+    def tearDown(self):
+        self.server.close()
+
+    def _query(self, tracer):
+        dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.1, timeout=0.05, tracer=tracer)
+        dns.add_sink(CallbackSink(lambda event: event.response.answer_RRs))
+        return dns, dns.query('twitter.com')
+
+    def test_spans_nest(self):
+        tracer = RecordingTracer()
+        dns, responses = self._query(tracer)
+        self.assertEqual(len(responses), 2)
+        stack = []
+        last = 0
+        for phase, name, timestamp, _ in tracer.events:
+            self.assertGreaterEqual(timestamp, last)
+            last = timestamp
+            if phase == 'B':
+                stack.append(name)
+            else:
+                self.assertEqual(stack.pop(), name)
+        self.assertEqual(stack, [])
+        names = [name for phase, name, _, _ in tracer.events if phase == 'B']
+        self.assertEqual(names[:2], ['query', 'send'])
+        self.assertEqual(tracer.events[0][3], {'qname': 'twitter.com'})
+        for stage in ('wait', 'recv', 'parse', 'decode', 'output'):
+            self.assertIn(stage, names)
+        # 每个响应只有 sink 访问的答案区被解析，decode 在 output 中
+        decodes = [(i, args) for i, (phase, name, _, args) in enumerate(tracer.events) if phase == 'B' and name == 'decode']
+        self.assertEqual([args for _, args in decodes], [{'section': 'answer'}] * 2)
+        self.assertTrue(all(tracer.events[i - 1][:2] == ('B', 'output') for i, _ in decodes))
+        # 查询返回后再解析其他 section 不再记录
+        count = len(tracer.events)
+        responses[0].additional_RRs
+        self.assertEqual(len(tracer.events), count)
+
+    def test_results_outlive_trace(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        with ChromeTraceExporter(path) as exporter:
+            dns = DNSQuery('127.0.0.1', port=self.server.port, wait_time=0.1, timeout=0.05, tracer=exporter)
+            responses = dns.query('twitter.com')
+            detached = responses[0].detach()
+        events = exporter.events
+        # 查询结束后响应不再引用 tracer，关闭 exporter 后仍可读取记录区
+        self.assertEqual(responses.real().answer_RRs[0].data_view, '104.244.42.1')
+        self.assertIsNone(detached._tracer)
+        exporter.span_start('late', 'query', 0)
+        self.assertEqual(exporter.events, events)
+        with open(path) as f:
+            self.assertEqual(len(json.load(f)), events)
+
+    def test_disabled(self):
+        dns = DNSQuery('127.0.0.1', port=self.server.port)
+        self.assertIsNone(dns.tracer)
+        for method in ('query', '_send', '_wait', '_drain', '_parse_packet', '_emit'):
+            self.assertNotIn(method, vars(dns))
+
+    def test_chrome_exporter(self):
+        buffer = io.BytesIO()
+        with ChromeTraceExporter(buffer) as exporter:
+            self._query(exporter)
+        events = json.loads(buffer.getvalue())
+        self.assertEqual(len(events), exporter.events)
+        self.assertEqual([e['ph'] for e in events[:2]], ['B', 'B'])
+        self.assertEqual(events[-1], dict(events[-1], ph='E', name='query'))
+        self.assertTrue(all(e['ts'] >= 0 and e['pid'] == os.getpid() for e in events))
+
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            exporter = ChromeTraceExporter(path)
+            exporter.close()
+            exporter.close()
+            with open(path) as f:
+                self.assertEqual(json.load(f), [])
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
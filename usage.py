@@ -1,4 +1,4 @@
-from dns_observe import DNSQuery, RecordType, ResponseList
+from dns_observe import DNSQuery, QueueSink, RecordType, ResponseList, render_text
 
 def print_answers(responses: ResponseList):
     for res in responses:
@@ -29,7 +29,14 @@ print('👌 real response:')
 print(responses.real())              # 打印真实的响应
 print('---\n')
 
+def print_events(sink: QueueSink):
+    # 接收循环交给 sink 的响应摘要，与命令行输出相同
+    for event in sink.drain():
+        for line in render_text(event):
+            print(line)
+
 with DNSQuery('8.8.8.8', wait_time=3) as dns2:
+    sink2 = dns2.add_sink(QueueSink(maxsize=None))
     responses = dns2.query('www.google.com', RecordType.A)
     print_answers(responses)
 
@@ -53,15 +60,14 @@ with DNSQuery('8.8.8.8', wait_time=3) as dns2:
     responses = dns2.query('mails.dev', RecordType.MX)
     print_answers(responses)
 
-    for msg in dns2.stdout_msg:
-        print(f'{msg}')
+    print_events(sink2)
 
 with DNSQuery('a.gtld-servers.net', wait_time=3) as dns3:
+    sink3 = dns3.add_sink(QueueSink(maxsize=None))
     responses = dns3.query('example.com', RecordType.A)
     print_answers(responses)
 
-    for msg in dns3.stdout_msg:
-        print(f'{msg}')
+    print_events(sink3)
 
 with DNSQuery('8.8.8.8', wait_time=3) as dns4:
     responses = dns4.query('googleapis.com', RecordType.HTTPS)